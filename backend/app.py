@@ -1,17 +1,35 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
 import pandas as pd
 import numpy as np
 import yfinance as yf
 import os
-import traceback
+import logging
 from datetime import datetime, timedelta
 import uvicorn
 
-from utils.data_fetcher import search_stocks, get_stock_data
-from utils.indicators import calculate_portfolio_value, calculate_indicators
+from utils.data_fetcher import search_stocks, get_close_price_async, get_price_histories_async
+from utils.concurrency import run_in_compute_pool
+from utils.indicators import calculate_portfolio_value, calculate_indicators, iter_indicators
+from utils.pipeline import INDICATOR_GROUPS, validate_indicator_groups, validate_rolling_windows, validate_var_settings
+from utils.calendars import resample_portfolio_value, validate_output_options
+from utils.downsample import downsample_portfolio_value, validate_max_points
+from utils.encoding import (encode_portfolio_result, encode_stream_event, encode_cached_stream, portfolio_series, dumps,
+                            validate_format, MEDIA_TYPES, STREAM_MEDIA_TYPES)
+from utils.config import RESULT_CACHE_ENABLED, COMPRESSION_ENABLED, METRICS_ENABLED, PROFILING_ENABLED
+from utils.price_cache import get_price_versions
+from utils.result_cache import result_cache, portfolio_key, result_ttl, result_etag, etag_matches, is_volatile_range
+from utils.compression import CompressionMiddleware
+from utils.tracing import TracingMiddleware, span
+from utils.logs import configure_logging
+from utils.metrics import registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.profiling import ProfilingMiddleware, is_profiling
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="投资组合可视化系统", description="基于Python的投资组合分析后端")
 
@@ -22,8 +40,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing", "X-Request-ID", "X-Profile"],
 )
 
+# 压缩较大的响应（投资组合结果、搜索结果）
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# 按需性能剖析，没有启用时不添加
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# 请求ID和各阶段耗时，放在最外层以便计入压缩的耗时
+app.add_middleware(TracingMiddleware)
+
 # 数据模型
 class StockTransaction(BaseModel):
     symbol: str
@@ -36,12 +66,30 @@ class PortfolioData(BaseModel):
     transactions: List[StockTransaction]
     start_date: Optional[str] = None  # 不指定则使用最早交易日期
     end_date: Optional[str] = None  # 不指定则使用当前日期
+    indicator_groups: Optional[List[str]] = None  # 需要计算的指标组，不指定则计算默认指标组，空列表表示只返回价值序列
+    rolling_windows: Optional[List[int]] = None  # 滚动指标的窗口大小，不指定则使用20日和60日
+    var_window: Optional[int] = None  # 滚动VaR/CVaR的窗口大小，不指定则使用60日
+    var_levels: Optional[List[float]] = None  # 滚动VaR/CVaR的置信度，不指定则使用0.95和0.99
+    frequency: Optional[str] = None  # 价值序列的输出频率: daily/weekly/monthly，不指定则为 daily
+    calendar: Optional[str] = None  # 输出日历: trading 只包含交易日，calendar 包含所有自然日，不指定则为 trading
+    max_points: Optional[int] = None  # 价值序列最多返回的点数，超过时按曲线形状(LTTB)降采样，不指定则返回全部
+    format: Optional[str] = None  # 响应格式: records(默认)/columnar/arrow
+    stream: Optional[str] = None  # 流式响应: ndjson/sse，价值序列和各指标组计算完成后依次发送，不指定则一次返回
 
 # API端点
 @app.get("/")
 def read_root():
     return {"message": "投资组合可视化系统API已启动"}
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    Prometheus 格式的运行指标：接口延迟、各计算阶段耗时、上游请求次数、缓存命中率和内存占用
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=registry.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/api/stocks/search")
 def api_search_stocks(query: str = Query(..., min_length=2)):
     """
@@ -51,42 +99,203 @@ def api_search_stocks(query: str = Query(..., min_length=2)):
         results = search_stocks(query)
         return {"results": results}
     except Exception as e:
-        print(f"搜索股票时出错: {e}")
-        print(traceback.format_exc())
+        logger.exception("搜索股票时出错: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/stock/price")
-def get_stock_price(symbol: str, date: str):
+async def get_stock_price(symbol: str, date: str):
     """
     获取特定日期的股票价格，用于自动填充买入价格
+    
+    返回不晚于该日期的最近一个交易日的收盘价，date 为实际使用的交易日
     """
     try:
-        print(f"获取股票价格: symbol={symbol}, date={date}")
-        stock_data = get_stock_data(symbol, date, date)
+        logger.debug("获取股票价格: symbol=%s, date=%s", symbol, date)
+        price_date, price = await get_close_price_async(symbol, date)
         
-        if stock_data.empty:
-            print(f"没有找到股票 {symbol} 在 {date} 的价格数据")
+        if price is None:
+            logger.info("没有找到股票 %s 在 %s 的价格数据", symbol, date)
             return {"price": None, "error": "没有该日期的价格数据"}
         
-        price = stock_data["Close"].iloc[0]
-        print(f"获取到价格: {price}, 类型: {type(price)}")
-        return {"price": price}
+        logger.debug("获取到价格: %s, 交易日: %s", price, price_date)
+        return {"price": price, "date": price_date}
     except Exception as e:
-        print(f"获取股票价格时出错: {e}")
-        print(traceback.format_exc())
+        logger.exception("获取股票价格时出错: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/indicators/groups")
+def list_indicator_groups():
+    """
+    列出可以在 indicator_groups 中选择的指标组
+    """
+    return {
+        "groups": [
+            {"name": group.name, "description": group.description, "default": group.default}
+            for group in INDICATOR_GROUPS.values()
+        ]
+    }
+
+def compute_portfolio_values(portfolio_data, start_date, end_date, stock_data):
+    """
+    根据已经获取的历史数据计算投资组合价值
+    
+    Returns:
+    tuple: (每日价值序列，用于计算指标, 重新采样和降采样后输出的价值序列)
+    """
+    try:
+        portfolio_value_df = calculate_portfolio_value(portfolio_data.transactions, start_date, end_date, stock_data=stock_data,
+                                                       calendar=portfolio_data.calendar or 'trading')
+        logger.debug("计算投资组合价值成功, 数据点数量: %d", len(portfolio_value_df))
+    except Exception as e:
+        logger.exception("计算投资组合价值失败: %s", e)
+        raise ValueError(f"计算投资组合价值失败: {e}")
+    
+    # 指标使用每日数据计算，只对输出的价值序列重新采样和降采样
+    with span('resample'):
+        output_df = resample_portfolio_value(portfolio_value_df, portfolio_data.frequency or 'daily')
+        output_df = downsample_portfolio_value(output_df, portfolio_data.max_points)
+    return portfolio_value_df, output_df
+
+def compute_portfolio_response(portfolio_data, start_date, end_date, stock_data):
+    """
+    根据已经获取的历史数据计算投资组合价值和指标，并序列化为响应
+    
+    CPU密集，在计算线程池中执行
+    
+    Returns:
+    tuple: (Response, 结果是否可以缓存)
+    """
+    portfolio_value_df, output_df = compute_portfolio_values(portfolio_data, start_date, end_date, stock_data)
+    
+    # 计算各种指标
+    try:
+        indicators = calculate_indicators(portfolio_value_df, portfolio_data.transactions, portfolio_data.indicator_groups,
+                                          rolling_windows=portfolio_data.rolling_windows,
+                                          var_window=portfolio_data.var_window,
+                                          var_levels=portfolio_data.var_levels)
+        logger.debug("计算指标成功, 指标数量: %d", len(indicators))
+    except Exception as e:
+        logger.exception("计算指标失败: %s", e)
+        indicators = {"计算错误": str(e)}
+    
+    response_format = portfolio_data.format or 'records'
+    with span('serialize'):
+        body = encode_portfolio_result(output_df, indicators, response_format)
+    response = Response(content=body, media_type=MEDIA_TYPES[response_format])
+    return response, is_cacheable_result(portfolio_value_df, indicators, portfolio_data.transactions)
+
+def is_cacheable_result(portfolio_value_df, indicators, transactions):
+    """计算出错或有股票没有价格数据（可能是网络问题）时不缓存结果"""
+    return "计算错误" not in indicators and all(
+        symbol in portfolio_value_df.columns and (portfolio_value_df[symbol] != 0).any()
+        for symbol in (tx.symbol for tx in transactions)
+    )
+
+def encode_value_event(output_df, portfolio_data):
+    """
+    把输出的价值序列编码为流式响应事件
+    
+    Returns:
+    tuple: (价值序列, 事件)，价值序列用于在完成后组装缓存的响应体
+    """
+    with span('serialize'):
+        series = portfolio_series(output_df, portfolio_data.format or 'records')
+        return series, encode_stream_event('portfolio_value', {'data': series}, portfolio_data.stream)
+
+def next_indicator_event(groups, stream):
+    """
+    计算下一个指标组并编码为流式响应事件，全部完成后返回None
+    
+    Returns:
+    tuple: (该组的指标字典, 事件)
+    """
+    item = next(groups, None)
+    if item is None:
+        return None
+    name, indicators = item
+    return indicators, encode_stream_event('indicators', {'group': name, 'data': indicators}, stream)
+
+async def stream_portfolio_events(portfolio_data, start_date, end_date, stock_data, cache_key=None, versions=None):
+    """
+    流式响应的事件：价值序列计算完成后立即发送，之后每计算完一个指标组发送一次，最后发送 done
+    
+    指定 cache_key 时，全部计算完成后把组装好的响应体保存到结果缓存，之后相同的请求（流式或非流式）直接命中；
+    versions 为价格下载完成后读取的版本号。
+    出错时发送 error 事件并结束
+    """
+    stream = portfolio_data.stream
+    try:
+        portfolio_value_df, output_df = await run_in_compute_pool(compute_portfolio_values, portfolio_data, start_date, end_date, stock_data)
+        series, event = await run_in_compute_pool(encode_value_event, output_df, portfolio_data)
+        yield event
+        
+        groups = iter_indicators(portfolio_value_df, portfolio_data.transactions, portfolio_data.indicator_groups,
+                                 rolling_windows=portfolio_data.rolling_windows,
+                                 var_window=portfolio_data.var_window,
+                                 var_levels=portfolio_data.var_levels)
+        indicators = {}
+        while True:
+            item = await run_in_compute_pool(next_indicator_event, groups, stream)
+            if item is None:
+                break
+            group_indicators, event = item
+            indicators.update(group_indicators)
+            yield event
+        
+        if cache_key is not None and is_cacheable_result(portfolio_value_df, indicators, portfolio_data.transactions):
+            # 与非流式响应的响应体相同
+            with span('serialize'):
+                body = await run_in_compute_pool(dumps, {"portfolio_value": series, "indicators": indicators})
+            symbols = list(dict.fromkeys(tx.symbol for tx in portfolio_data.transactions))
+            result_cache.put(cache_key, body, symbols, ttl=result_ttl(end_date), versions=versions)
+        yield encode_stream_event('done', {}, stream)
+    except Exception as e:
+        logger.exception("流式计算投资组合时出错: %s", e)
+        yield encode_stream_event('error', {'message': str(e)}, stream)
+
 @app.post("/api/portfolio/value")
-def calculate_portfolio_values(portfolio_data: PortfolioData):
+async def calculate_portfolio_values(portfolio_data: PortfolioData, if_none_match: Optional[str] = Header(None)):
     """
     计算投资组合在一段时间内的价值
+    
+    indicator_groups 指定需要计算的指标组，只有被选中的指标组会执行，
+    rolling_windows 指定滚动指标的窗口大小，var_window/var_levels 指定滚动VaR/CVaR的窗口和置信度，
+    calendar 指定输出日历（默认只包含交易日），frequency 指定价值序列的输出频率，
+    max_points 限制价值序列返回的点数（指标仍按完整的每日数据计算），
+    format 指定响应格式: records（每行一个对象）、columnar（每列一个数组）或 arrow（Arrow IPC 流），
+    stream 为 ndjson 或 sse 时使用流式响应，先发送价值序列，再逐个发送指标组
+    
+    相同的请求直接返回缓存的结果，直到所涉及股票收到新的价格数据；
+    不包含当天的日期区间的结果带有 ETag，请求头 If-None-Match 与之相同时返回 304
+    （POST 返回 304 是非标准的用法，见 etag_matches；If-None-Match: * 不会匹配）。
+    流式响应只在命中结果缓存、结果完整时带有 ETag
     """
+    if portfolio_data.indicator_groups is not None:
+        try:
+            validate_indicator_groups(portfolio_data.indicator_groups)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if portfolio_data.rolling_windows is not None:
+        try:
+            validate_rolling_windows(portfolio_data.rolling_windows)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        print(f"收到计算投资组合请求, 交易数量: {len(portfolio_data.transactions)}")
+        validate_var_settings(portfolio_data.var_window, portfolio_data.var_levels)
+        validate_output_options(portfolio_data.frequency, portfolio_data.calendar)
+        validate_max_points(portfolio_data.max_points)
+        validate_format(portfolio_data.format, portfolio_data.stream)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        logger.debug("收到计算投资组合请求, 交易数量: %d", len(portfolio_data.transactions))
         
-        # 打印交易详情
-        for i, tx in enumerate(portfolio_data.transactions):
-            print(f"交易 {i+1}: symbol={tx.symbol}, name={tx.name}, quantity={tx.quantity}, buy_date={tx.buy_date}, buy_price={tx.buy_price}")
+        # 交易详情只在调试时记录
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, tx in enumerate(portfolio_data.transactions):
+                logger.debug("交易 %d: symbol=%s, name=%s, quantity=%s, buy_date=%s, buy_price=%s",
+                             i + 1, tx.symbol, tx.name, tx.quantity, tx.buy_date, tx.buy_price)
             
         # 如果没有指定开始日期，使用最早的交易日期
         if not portfolio_data.start_date:
@@ -100,37 +309,94 @@ def calculate_portfolio_values(portfolio_data: PortfolioData):
         # 如果没有指定结束日期，使用当前日期
         end_date = portfolio_data.end_date or datetime.now().strftime("%Y-%m-%d")
         
-        print(f"计算日期范围: {start_date} 到 {end_date}")
+        logger.debug("计算日期范围: %s 到 %s", start_date, end_date)
         
-        # 计算投资组合价值
-        try:
-            portfolio_value_df = calculate_portfolio_value(portfolio_data.transactions, start_date, end_date)
-            print(f"计算投资组合价值成功, 数据点数量: {len(portfolio_value_df)}")
-        except Exception as e:
-            print(f"计算投资组合价值失败: {e}")
-            print(traceback.format_exc())
-            raise ValueError(f"计算投资组合价值失败: {e}")
+        # 请求的规范化哈希，用于结果缓存和 ETag。结果缓存的键不包含 stream，流式和非流式请求共享缓存的结果；
+        # 两者的响应体不同，ETag 使用包含 stream 的哈希
+        symbols = list(dict.fromkeys(tx.symbol for tx in portfolio_data.transactions))
+        media_type = MEDIA_TYPES[portfolio_data.format or 'records']
+        options = {
+            "indicator_groups": sorted(portfolio_data.indicator_groups) if portfolio_data.indicator_groups is not None else None,
+            "rolling_windows": portfolio_data.rolling_windows,
+            "var_window": portfolio_data.var_window,
+            "var_levels": portfolio_data.var_levels,
+            "frequency": portfolio_data.frequency or 'daily',
+            "calendar": portfolio_data.calendar or 'trading',
+            "max_points": portfolio_data.max_points,
+            "format": portfolio_data.format or 'records',
+        }
+        request_key = portfolio_key(portfolio_data.transactions, start_date, end_date, options)
+        etag_key = request_key
+        if portfolio_data.stream:
+            etag_key = portfolio_key(portfolio_data.transactions, start_date, end_date, {**options, "stream": portfolio_data.stream})
+        
+        # 不包含当天的历史区间的结果只取决于请求和价格数据，客户端已经持有时返回 304
+        deterministic = not is_volatile_range(end_date)
+        # 剖析的请求总是重新计算
+        profiling = is_profiling()
+        use_cache = RESULT_CACHE_ENABLED and not profiling
+        # 价格版本号每个阶段只读取一次，同时用于 ETag 和结果缓存
+        versions = get_price_versions(symbols) if (deterministic and not profiling) or use_cache else None
+        if deterministic and not profiling:
+            etag = result_etag(etag_key, symbols, versions)
+            if etag_matches(if_none_match, etag):
+                logger.debug("客户端结果未变化")
+                return Response(status_code=304, headers={"ETag": etag})
+        
+        # 相同的投资组合请求直接返回缓存的结果，流式请求把缓存的结果作为一组事件发送
+        if use_cache:
+            cached_body = result_cache.get(request_key, versions)
+            if cached_body is not None:
+                logger.debug("命中结果缓存")
+                headers = {"ETag": result_etag(etag_key, symbols, versions)} if deterministic else {}
+                if portfolio_data.stream:
+                    events = await run_in_compute_pool(encode_cached_stream, cached_body, portfolio_data.stream)
+                    headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+                    return StreamingResponse(iter(events), media_type=STREAM_MEDIA_TYPES[portfolio_data.stream], headers=headers)
+                return Response(content=cached_body, media_type=media_type, headers=headers or None)
         
-        # 计算各种指标
+        if portfolio_data.stream:
+            # 流式响应：价格下载完成后开始发送，价值序列和各指标组计算完成后依次发送
+            stock_data = {}
+            try:
+                logger.debug("下载 %s 的历史数据...", ', '.join(symbols))
+                with span('fetch'):
+                    stock_data = await get_price_histories_async(symbols, start_date, end_date)
+            except Exception as e:
+                logger.warning("获取历史数据失败: %s", e)
+            # 价格下载完成后的版本号，与结果使用的数据一致
+            versions = get_price_versions(symbols)
+            # 响应头在计算完成之前发送，这时还不知道结果是否完整（之后可能发送 error 事件），不带 ETag；
+            # 完整的结果保存到结果缓存后，之后相同的请求命中缓存时才带有 ETag
+            headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            events = stream_portfolio_events(portfolio_data, start_date, end_date, stock_data,
+                                             cache_key=request_key if RESULT_CACHE_ENABLED else None, versions=versions)
+            return StreamingResponse(events, media_type=STREAM_MEDIA_TYPES[portfolio_data.stream], headers=headers)
+        
+        # 并发获取所有股票的历史数据，不阻塞事件循环
+        stock_data = {}
         try:
-            indicators = calculate_indicators(portfolio_value_df, portfolio_data.transactions)
-            print(f"计算指标成功, 指标数量: {len(indicators)}")
+            logger.debug("下载 %s 的历史数据...", ', '.join(symbols))
+            with span('fetch'):
+                stock_data = await get_price_histories_async(symbols, start_date, end_date)
         except Exception as e:
-            print(f"计算指标失败: {e}")
-            print(traceback.format_exc())
-            indicators = {"计算错误": str(e)}
+            logger.warning("获取历史数据失败: %s", e)
         
-        result = {
-            "portfolio_value": portfolio_value_df.to_dict(orient="records"),
-            "indicators": indicators
-        }
+        # 估值、指标计算和序列化在计算线程池中执行
+        response, cacheable = await run_in_compute_pool(compute_portfolio_response, portfolio_data, start_date, end_date, stock_data)
+        if cacheable:
+            # 价格下载完成后的版本号，与结果使用的数据一致
+            versions = get_price_versions(symbols)
+            if RESULT_CACHE_ENABLED:
+                result_cache.put(request_key, response.body, symbols, ttl=result_ttl(end_date), versions=versions)
+            if deterministic:
+                response.headers["ETag"] = result_etag(request_key, symbols, versions)
         
-        print("计算投资组合完成")
-        return result
+        logger.debug("计算投资组合完成")
+        return response
     except Exception as e:
         error_msg = f"计算投资组合价值时出错: {e}"
-        print(error_msg)
-        print(traceback.format_exc())
+        logger.exception(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
 
 if __name__ == "__main__":
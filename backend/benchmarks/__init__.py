@@ -0,0 +1,9 @@
+"""
+估值和指标计算的基准测试与端到端负载测试
+
+在 backend 目录下运行，不需要网络：
+
+    python -m benchmarks.run --symbols 20 --years 10 --transactions 200 --output results.json
+    python -m benchmarks.compare baseline.json results.json
+    python -m benchmarks.loadtest --rps 20 --duration 30 --warmup 10
+"""
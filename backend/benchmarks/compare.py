@@ -0,0 +1,75 @@
+"""
+比较两次基准测试的结果
+
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1
+
+按中位数比较每个用例，变慢超过 threshold 的用例标记为回退，存在回退时退出码为1。
+"""
+import sys
+import json
+import argparse
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_reports(baseline, current, threshold=0.1):
+    """
+    比较两次结果中都存在的用例
+
+    Parameters:
+    baseline (dict): 基准结果
+    current (dict): 当前结果
+    threshold (float): 中位数变慢超过该比例时视为回退
+
+    Returns:
+    list: [(用例名称, 基准中位数, 当前中位数, 比值, 状态), ...]，状态为 faster/slower/same
+    """
+    rows = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['median'] / base['median'] if base['median'] > 0 else float('inf')
+        if ratio > 1 + threshold:
+            status = 'slower'
+        elif ratio < 1 / (1 + threshold):
+            status = 'faster'
+        else:
+            status = 'same'
+        rows.append((name, base['median'], result['median'], ratio, status))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='比较两次基准测试的结果')
+    parser.add_argument('baseline', help='基准结果 JSON')
+    parser.add_argument('current', help='当前结果 JSON')
+    parser.add_argument('--threshold', type=float, default=0.1, help='视为回退的变慢比例，默认 0.1')
+    args = parser.parse_args(argv)
+
+    baseline = load_report(args.baseline)
+    current = load_report(args.current)
+    if baseline['meta'].get('scale') != current['meta'].get('scale'):
+        print(f"警告: 两次运行的规模不同: {baseline['meta'].get('scale')} / {current['meta'].get('scale')}", file=sys.stderr)
+
+    rows = compare_reports(baseline, current, args.threshold)
+    print(f"{'用例':<45} {'基准(ms)':>12} {'当前(ms)':>12} {'比值':>8}  状态")
+    for name, base, now, ratio, status in rows:
+        print(f"{name:<45} {base * 1000:12.3f} {now * 1000:12.3f} {ratio:8.2f}  {status}")
+
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        print(f"当前结果中没有的用例: {', '.join(missing)}", file=sys.stderr)
+
+    regressions = [row for row in rows if row[4] == 'slower']
+    if regressions:
+        print(f"{len(regressions)} 个用例变慢超过 {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+负载测试使用的本地价格数据源
+
+任何股票代码都返回合成的历史数据（每只股票的数据由代码决定，每次相同），
+每次请求先等待设定的延迟，模拟访问上游的网络耗时。请求同样经过 upstream_slot，
+受 UPSTREAM_CONCURRENCY 限制并计入 /metrics 的上游请求次数。
+"""
+import time
+import random
+import zlib
+import threading
+
+import pandas as pd
+
+from utils.providers import PriceProvider, combine_histories, upstream_slot
+
+from .synthetic import generate_price_histories
+
+
+class FakePriceProvider(PriceProvider):
+    """
+    返回合成数据、带有可配置延迟的数据源
+
+    Parameters:
+    latency (float): 每次请求的延迟（秒）
+    jitter (float): 延迟的随机波动幅度（秒），实际延迟在 latency ± jitter 之间
+    years (int): 每只股票历史数据的年数
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.05, jitter=0.0, years=20):
+        self.latency = latency
+        self.jitter = jitter
+        self.years = years
+        self._histories = {}
+        self._lock = threading.Lock()
+
+    def _history(self, symbol):
+        with self._lock:
+            data = self._histories.get(symbol)
+        if data is None:
+            seed = zlib.crc32(symbol.encode('utf-8'))
+            data = generate_price_histories([symbol], self.years, seed=seed)[symbol]
+            with self._lock:
+                self._histories[symbol] = data
+        return data
+
+    def _wait(self):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _slice(self, symbol, start_date, end_date):
+        data = self._history(symbol)
+        return data[(data.index >= pd.Timestamp(start_date)) & (data.index < pd.Timestamp(end_date))]
+
+    def fetch(self, symbol, start_date, end_date):
+        with upstream_slot(self.name, [symbol]):
+            self._wait()
+        return self._slice(symbol, start_date, end_date)
+
+    def fetch_many(self, symbols, start_date, end_date):
+        # 与 yfinance 一样一次请求取回所有股票
+        symbols = list(symbols)
+        with upstream_slot(self.name, symbols):
+            self._wait()
+        return combine_histories({symbol: self._slice(symbol, start_date, end_date) for symbol in symbols})
+
+    def nbytes(self):
+        with self._lock:
+            histories = list(self._histories.values())
+        return int(sum(data.memory_usage(index=True).sum() for data in histories))
@@ -0,0 +1,51 @@
+"""
+使用 FakePriceProvider 启动后端，供负载测试使用
+
+    python -m benchmarks.loadserver --port 8050 --workers 2
+
+数据源的延迟由环境变量 LOADTEST_LATENCY、LOADTEST_JITTER（秒）设置；
+每个 worker 进程导入这个模块时替换数据源，其余配置与正常启动相同。
+
+合成的价格数据不能写入正式的价格缓存：没有设置 PRICE_CACHE_DIR 时使用一个临时目录，
+退出时删除。配置在导入 app 时读取，所以必须在导入之前设置；worker 进程继承同一个目录。
+"""
+import os
+import sys
+import atexit
+import shutil
+import signal
+import argparse
+import tempfile
+
+if 'PRICE_CACHE_DIR' not in os.environ:
+    _cache_dir = tempfile.mkdtemp(prefix='loadserver-cache-')
+    os.environ['PRICE_CACHE_DIR'] = _cache_dir
+    os.environ.setdefault('PRICE_STORE_PATH', os.path.join(_cache_dir, 'prices.sqlite'))
+    atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+
+import uvicorn  # noqa: E402
+
+from app import app  # noqa: E402
+from utils.providers import set_provider  # noqa: E402
+
+from .fake_provider import FakePriceProvider  # noqa: E402
+
+set_provider(FakePriceProvider(latency=float(os.environ.get('LOADTEST_LATENCY', '0.05')),
+                               jitter=float(os.environ.get('LOADTEST_JITTER', '0.0'))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='使用本地数据源启动后端')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn 进程数')
+    args = parser.parse_args(argv)
+    # uvicorn 正常关闭后会把收到的 SIGTERM 重新发给进程，默认处理方式直接结束进程，
+    # 不会执行 atexit 删除临时缓存目录，这里改为正常退出
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    uvicorn.run('benchmarks.loadserver:app', host=args.host, port=args.port, workers=args.workers,
+                log_level='warning', access_log=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,337 @@
+"""
+端到端负载测试
+
+启动使用 FakePriceProvider 的后端（子进程），按目标速率发送搜索、查询价格和计算投资组合的混合请求，
+统计吞吐量、延迟分位数和错误率。指标计算出错的投资组合响应（状态码为200）记为 indicator_error 错误：
+
+    python -m benchmarks.loadtest --rps 50 --duration 30 --mix search=3,price=5,portfolio=2 --latency 0.05
+
+请求按固定的时间表发出（开环），不等待之前的请求完成，延迟从计划发出的时间算起，
+服务变慢时排队的时间也计入延迟。--warmup 秒内发出的请求用于预热缓存，不计入统计。
+--url 指定时直接测试已经运行的服务，不启动子进程。
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from .synthetic import END_DATE
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STOCKS_CSV_PATH = os.path.join(os.path.dirname(BACKEND_DIR), 'data', 'stocks.csv')
+
+ENDPOINTS = {
+    'search': ('GET', '/api/stocks/search'),
+    'price': ('GET', '/api/stock/price'),
+    'portfolio': ('POST', '/api/portfolio/value'),
+}
+
+
+def parse_mix(text):
+    """
+    解析请求比例，例如 search=3,price=5,portfolio=2
+
+    Returns:
+    dict: {请求类型: 权重}
+    """
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"未知的请求类型: {name}, 可选: {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("请求比例的权重之和必须大于0")
+    return mix
+
+
+def load_stocks(path=STOCKS_CSV_PATH):
+    """股票列表中的 (代码, 名称)"""
+    with open(path, encoding='utf-8') as f:
+        return [(row['symbol'], row['name']) for row in csv.DictReader(f)]
+
+
+class RequestFactory:
+    """
+    生成请求参数
+
+    投资组合从固定数量的组合中随机选择，相同的组合会重复出现，与实际使用中反复查看同一组合相近
+
+    Parameters:
+    stocks (list): [(代码, 名称), ...]
+    portfolios (int): 不同投资组合的数量
+    portfolio_size (int): 每个组合的交易数量
+    seed (int): 随机种子
+    """
+
+    def __init__(self, stocks, portfolios=50, portfolio_size=5, seed=0):
+        self.stocks = stocks
+        self.rng = random.Random(seed)
+        self.days = pd.bdate_range(pd.Timestamp(END_DATE) - pd.DateOffset(years=15), END_DATE).strftime('%Y-%m-%d').tolist()
+        self.portfolios = [self._portfolio(portfolio_size) for _ in range(portfolios)]
+
+    def _portfolio(self, size):
+        transactions = []
+        for _ in range(size):
+            symbol, name = self.rng.choice(self.stocks)
+            transactions.append({
+                'symbol': symbol,
+                'name': name,
+                'quantity': self.rng.randint(1, 100),
+                'buy_date': self.rng.choice(self.days),
+                'buy_price': round(self.rng.uniform(10, 500), 2),
+            })
+        return {'transactions': transactions, 'end_date': END_DATE}
+
+    def make(self, kind):
+        """
+        Returns:
+        dict: httpx 请求的 params 或 json 参数
+        """
+        if kind == 'search':
+            symbol, name = self.rng.choice(self.stocks)
+            # 搜索至少需要2个字符，代码只有1个字符时搜索名称
+            text = symbol if len(symbol) >= 2 and self.rng.random() < 0.7 else name
+            return {'params': {'query': text[:self.rng.randint(2, max(2, min(4, len(text))))]}}
+        if kind == 'price':
+            symbol, _ = self.rng.choice(self.stocks)
+            return {'params': {'symbol': symbol, 'date': self.rng.choice(self.days)}}
+        return {'json': self.rng.choice(self.portfolios)}
+
+
+def indicator_error(response):
+    """
+    投资组合响应中指标计算是否出错
+
+    指标计算失败时服务仍然返回200，只在 indicators 中放入 计算错误，
+    这样的响应走的是不缓存的出错路径，不能当作成功的请求统计
+
+    Returns:
+    bool: 响应是 JSON 且包含 计算错误
+    """
+    if response.status_code != 200 or 'json' not in response.headers.get('content-type', ''):
+        return False
+    try:
+        indicators = response.json().get('indicators')
+    except ValueError:
+        return False
+    return isinstance(indicators, dict) and '计算错误' in indicators
+
+
+async def _send(client, kind, kwargs, scheduled, results):
+    method, path = ENDPOINTS[kind]
+    try:
+        response = await client.request(method, path, **kwargs)
+        await response.aread()
+        ok = response.status_code < 400
+        status = response.status_code
+        if ok and kind == 'portfolio' and indicator_error(response):
+            ok = False
+            status = 'indicator_error'
+    except httpx.HTTPError as e:
+        ok = False
+        status = type(e).__name__
+    results.append((kind, time.perf_counter() - scheduled, ok, status))
+
+
+async def drive(url, rps, duration, mix, factory, max_connections=256, poisson=False, seed=0, warmup=0.0):
+    """
+    按目标速率发送请求
+
+    Parameters:
+    url (str): 服务地址
+    rps (float): 每秒请求数
+    duration (float): 持续时间（秒）
+    mix (dict): {请求类型: 权重}
+    factory (RequestFactory): 请求参数生成器
+    max_connections (int): 最大连接数
+    poisson (bool): 请求间隔服从指数分布，否则均匀间隔
+    warmup (float): 预热时间（秒），在 duration 之前，这段时间的请求不计入结果
+
+    Returns:
+    tuple: ([(请求类型, 延迟秒, 是否成功, 状态), ...], 计入统计的时间段的实际用时秒)
+    """
+    rng = random.Random(seed)
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    results = []
+    discarded = []
+    tasks = []
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        start = time.perf_counter()
+        offset = 0.0
+        while offset < warmup + duration:
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind = rng.choices(kinds, weights)[0]
+            target = results if offset >= warmup else discarded
+            tasks.append(asyncio.create_task(_send(client, kind, factory.make(kind), scheduled, target)))
+            offset += rng.expovariate(rps) if poisson else 1.0 / rps
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start - warmup
+    return results, elapsed
+
+
+def summarize(results, elapsed):
+    """
+    按请求类型和总体统计吞吐量、延迟分位数（毫秒）和错误率
+
+    Returns:
+    dict: {请求类型或 all: 统计}
+    """
+    summary = {}
+    groups = {'all': results}
+    for kind in ENDPOINTS:
+        subset = [item for item in results if item[0] == kind]
+        if subset:
+            groups[kind] = subset
+    for name, items in groups.items():
+        latencies = np.array([item[1] for item in items]) * 1000
+        errors = [item for item in items if not item[2]]
+        statuses = {}
+        for item in errors:
+            statuses[str(item[3])] = statuses.get(str(item[3]), 0) + 1
+        summary[name] = {
+            'requests': len(items),
+            'throughput': len(items) / elapsed if elapsed > 0 else 0.0,
+            'error_rate': len(errors) / len(items) if items else 0.0,
+            'errors': statuses,
+            'mean_ms': float(latencies.mean()) if len(latencies) else None,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'max_ms': float(latencies.max()) if len(latencies) else None,
+        }
+    return summary
+
+
+def print_summary(summary, file=sys.stdout):
+    print(f"{'类型':<10} {'请求数':>8} {'吞吐(rps)':>10} {'错误率':>8} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}", file=file)
+    for name, stats in summary.items():
+        print(f"{name:<10} {stats['requests']:>8} {stats['throughput']:>10.1f} {stats['error_rate']:>8.2%} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}", file=file)
+        if stats['errors']:
+            print(f"{'':<10} 错误: {stats['errors']}", file=file)
+
+
+def start_server(port, workers, latency, jitter, cache_dir, extra_env=None):
+    """
+    在子进程中启动使用 FakePriceProvider 的后端，等待服务可用
+
+    Returns:
+    Popen: 服务进程
+    """
+    env = dict(os.environ)
+    env.update({
+        'LOADTEST_LATENCY': str(latency),
+        'LOADTEST_JITTER': str(jitter),
+        # 每次使用空的价格缓存，结果可以重现
+        'PRICE_CACHE_DIR': cache_dir,
+        'PRICE_STORE_PATH': os.path.join(cache_dir, 'prices.sqlite'),
+    })
+    env.update(extra_env or {})
+    process = subprocess.Popen([sys.executable, '-m', 'benchmarks.loadserver', '--port', str(port), '--workers', str(workers)],
+                               cwd=BACKEND_DIR, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务启动失败，退出码: {process.returncode}")
+        try:
+            if httpx.get(url + '/', timeout=1.0).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待服务启动超时")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='端到端负载测试')
+    parser.add_argument('--rps', type=float, default=20, help='每秒请求数')
+    parser.add_argument('--duration', type=float, default=30, help='持续时间（秒）')
+    parser.add_argument('--warmup', type=float, default=0, help='预热时间（秒），不计入统计')
+    parser.add_argument('--mix', default='search=3,price=5,portfolio=2', help='请求比例')
+    parser.add_argument('--latency', type=float, default=0.05, help='本地数据源每次请求的延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.02, help='延迟的随机波动（秒）')
+    parser.add_argument('--portfolios', type=int, default=50, help='不同投资组合的数量')
+    parser.add_argument('--portfolio-size', type=int, default=5, help='每个投资组合的交易数量')
+    parser.add_argument('--poisson', action='store_true', help='请求间隔服从指数分布')
+    parser.add_argument('--max-connections', type=int, default=256, help='客户端最大连接数')
+    parser.add_argument('--workers', type=int, default=1, help='服务的 uvicorn 进程数')
+    parser.add_argument('--port', type=int, default=8050, help='服务端口')
+    parser.add_argument('--url', help='测试已经运行的服务，不启动子进程')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='传给服务进程的环境变量，可以重复')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--output', help='结果保存的 JSON 文件')
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.rps <= 0 or args.duration <= 0 or args.warmup < 0:
+        parser.error('--rps/--duration 必须大于0，--warmup 不能为负')
+    if any('=' not in item for item in args.env):
+        parser.error('--env 的格式为 KEY=VALUE')
+    extra_env = dict(item.split('=', 1) for item in args.env)
+
+    factory = RequestFactory(load_stocks(), args.portfolios, args.portfolio_size, args.seed)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        process = None
+        url = args.url
+        if url is None:
+            process = start_server(args.port, args.workers, args.latency, args.jitter, cache_dir, extra_env)
+            url = f'http://127.0.0.1:{args.port}'
+        try:
+            results, elapsed = asyncio.run(drive(url, args.rps, args.duration, mix, factory,
+                                                 args.max_connections, args.poisson, args.seed, args.warmup))
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    summary = summarize(results, elapsed)
+    print_summary(summary)
+    if args.output:
+        report = {
+            'meta': {
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'url': args.url, 'rps': args.rps, 'duration': args.duration, 'warmup': args.warmup,
+                'elapsed': elapsed, 'mix': mix,
+                'latency': args.latency, 'jitter': args.jitter, 'portfolios': args.portfolios,
+                'portfolio_size': args.portfolio_size, 'poisson': args.poisson, 'workers': args.workers,
+                'env': extra_env, 'seed': args.seed,
+            },
+            'summary': summary,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+运行基准测试并保存 JSON 结果
+
+    python -m benchmarks.run --symbols 20 --years 10 --transactions 200 --output results.json
+
+每个用例先预热一次，再执行 --repeat 次，记录每次的耗时（秒）。输入数据在计时之外准备，
+每个用例单独计时，不共享中间结果。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils.indicators import (
+    calculate_portfolio_value, calculate_indicators, calculate_max_drawdown,
+    calculate_rolling_metrics, calculate_drawdown_metrics,
+)
+from utils.enhanced_indicators import (
+    calculate_enhanced_indicators, calculate_rolling_detailed_metrics,
+    calculate_rolling_tail_risk_metrics, calculate_detailed_drawdown_metrics,
+)
+from utils.kernels import running_peak, underwater, rolling_window_stats, rolling_tail_risk
+from utils.pipeline import IndicatorContext, DEFAULT_VAR_WINDOW, DEFAULT_VAR_LEVELS
+from utils.price_matrix import write_price_matrix, PriceMatrix
+
+from .synthetic import synthetic_symbols, generate_price_histories, generate_transactions, END_DATE
+
+
+def build_cases(histories, transactions, matrix):
+    """
+    准备每个用例的输入
+
+    Parameters:
+    histories (dict): {股票代码: DataFrame} 历史数据
+    transactions (list): 交易列表
+    matrix (PriceMatrix): 同一份数据的价格矩阵
+
+    Returns:
+    list: [(用例名称, 无参数的函数), ...]
+    """
+    start_date = transactions[0].buy_date
+    portfolio_value_df = calculate_portfolio_value(transactions, start_date, END_DATE, stock_data=histories)
+    if len(portfolio_value_df) < 2 or not (portfolio_value_df['TotalValue'] > 0).any():
+        raise RuntimeError("合成数据的估值结果无效，检查生成参数")
+
+    ctx = IndicatorContext(portfolio_value_df, transactions)
+    values = ctx.total_values
+    daily_returns = ctx.daily_returns
+    dates = portfolio_value_df['Date'].tolist()
+
+    return [
+        ('calculate_portfolio_value',
+         lambda: calculate_portfolio_value(transactions, start_date, END_DATE, stock_data=histories)),
+        ('calculate_portfolio_value[price_matrix]',
+         lambda: calculate_portfolio_value(transactions, start_date, END_DATE, price_matrix=matrix)),
+        ('calculate_indicators',
+         lambda: calculate_indicators(portfolio_value_df, transactions)),
+        ('calculate_enhanced_indicators',
+         lambda: calculate_enhanced_indicators(portfolio_value_df, daily_returns, values, ctx.initial_investment,
+                                               ctx.final_value, ctx.first_date, ctx.last_date, transactions)),
+        ('calculate_max_drawdown', lambda: calculate_max_drawdown(values)),
+        ('calculate_drawdown_metrics', lambda: calculate_drawdown_metrics(values, dates)),
+        ('calculate_detailed_drawdown_metrics', lambda: calculate_detailed_drawdown_metrics(values, dates)),
+        ('calculate_rolling_metrics', lambda: calculate_rolling_metrics(daily_returns, 20)),
+        ('calculate_rolling_detailed_metrics', lambda: calculate_rolling_detailed_metrics(daily_returns, 20)),
+        ('calculate_rolling_tail_risk_metrics', lambda: calculate_rolling_tail_risk_metrics(daily_returns)),
+        ('kernels.running_peak', lambda: running_peak(values)),
+        ('kernels.underwater', lambda: underwater(values)),
+        ('kernels.rolling_window_stats', lambda: rolling_window_stats(daily_returns, [20, 60])),
+        ('kernels.rolling_tail_risk', lambda: rolling_tail_risk(daily_returns, DEFAULT_VAR_WINDOW, DEFAULT_VAR_LEVELS)),
+    ]
+
+
+def time_case(func, repeat):
+    """
+    预热一次后执行 repeat 次
+
+    Returns:
+    dict: 最小值、中位数、平均值、标准差（秒）和每次的耗时
+    """
+    func()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return {
+        'min': min(runs),
+        'median': statistics.median(runs),
+        'mean': statistics.mean(runs),
+        'stdev': statistics.stdev(runs) if len(runs) > 1 else 0.0,
+        'runs': runs,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(symbols=20, years=10, transactions=200, repeat=5, seed=0, cases=None):
+    """
+    生成合成数据并运行基准测试
+
+    Parameters:
+    symbols (int): 股票数量
+    years (int): 历史数据的年数
+    transactions (int): 交易数量
+    repeat (int): 每个用例的执行次数
+    seed (int): 随机种子
+    cases (list): 只运行名称包含其中任一字符串的用例，None 表示全部
+
+    Returns:
+    dict: {'meta': 运行环境和规模, 'results': {用例名称: 耗时统计}}
+    """
+    histories = generate_price_histories(synthetic_symbols(symbols), years, seed=seed)
+    txs = generate_transactions(histories, transactions, seed=seed)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        matrix = write_price_matrix(os.path.join(directory, 'matrix'), histories)
+        for name, func in build_cases(histories, txs, matrix):
+            if cases and not any(pattern in name for pattern in cases):
+                continue
+            results[name] = time_case(func, repeat)
+            print(f"{name:<45} {results[name]['median'] * 1000:10.3f} ms", file=sys.stderr)
+        del matrix
+
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'scale': {'symbols': symbols, 'years': years, 'transactions': transactions, 'seed': seed},
+            'days': len(next(iter(histories.values()))),
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='估值和指标计算的基准测试')
+    parser.add_argument('--symbols', type=int, default=20, help='股票数量')
+    parser.add_argument('--years', type=int, default=10, help='历史数据的年数')
+    parser.add_argument('--transactions', type=int, default=200, help='交易数量')
+    parser.add_argument('--repeat', type=int, default=5, help='每个用例的执行次数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--case', action='append', dest='cases', help='只运行名称包含该字符串的用例，可以重复')
+    parser.add_argument('--output', help='结果保存的 JSON 文件，不指定则输出到标准输出')
+    args = parser.parse_args(argv)
+    if min(args.symbols, args.years, args.transactions, args.repeat) < 1:
+        parser.error('--symbols/--years/--transactions/--repeat 必须大于0')
+
+    report = run_benchmarks(args.symbols, args.years, args.transactions, args.repeat, args.seed, args.cases)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+合成的价格历史和交易记录
+
+价格按几何布朗运动生成，日期为纽交所交易日，格式与数据源返回的历史数据相同
+（以 Date 为索引的 Open/High/Low/Close/Volume）。相同的参数和随机种子总是生成相同的数据。
+"""
+import numpy as np
+import pandas as pd
+
+from utils.calendars import exchange_trading_days
+
+# 合成数据的结束日期固定，不同时间运行的结果可以比较
+END_DATE = '2024-12-31'
+
+
+class SyntheticTransaction:
+    """与接口中的交易记录具有相同属性的买入交易"""
+
+    def __init__(self, symbol, quantity, buy_date, buy_price):
+        self.symbol = symbol
+        self.name = symbol
+        self.quantity = quantity
+        self.buy_date = buy_date
+        self.buy_price = buy_price
+
+
+def synthetic_symbols(count):
+    """
+    生成股票代码
+
+    Parameters:
+    count (int): 股票数量
+
+    Returns:
+    list: SYN0001、SYN0002 ...
+    """
+    return [f'SYN{i + 1:04d}' for i in range(count)]
+
+
+def generate_price_histories(symbols, years, end_date=END_DATE, seed=0):
+    """
+    生成多只股票的历史数据
+
+    Parameters:
+    symbols (list): 股票代码列表
+    years (int): 历史数据的年数
+    end_date (str): 最后一个日期
+    seed (int): 随机种子
+
+    Returns:
+    dict: {股票代码: DataFrame}
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end_date)
+    dates = exchange_trading_days('NYSE', end - pd.DateOffset(years=years) + pd.Timedelta(days=1), end)
+    n_days, n_symbols = len(dates), len(symbols)
+
+    # 每只股票的年化漂移和波动率不同
+    drift = rng.uniform(-0.05, 0.15, n_symbols) / 252
+    volatility = rng.uniform(0.15, 0.5, n_symbols) / np.sqrt(252)
+    log_returns = drift + volatility * rng.standard_normal((n_days, n_symbols))
+    closes = rng.uniform(20, 500, n_symbols) * np.exp(np.cumsum(log_returns, axis=0))
+
+    opens = np.vstack([closes[:1], closes[:-1]]) * (1 + 0.002 * rng.standard_normal((n_days, n_symbols)))
+    spread = np.abs(0.01 * rng.standard_normal((n_days, n_symbols)))
+    highs = np.maximum(opens, closes) * (1 + spread)
+    lows = np.minimum(opens, closes) * (1 - spread)
+    volumes = rng.integers(100_000, 10_000_000, (n_days, n_symbols))
+
+    index = pd.DatetimeIndex(dates, name='Date')
+    return {
+        symbol: pd.DataFrame({
+            'Open': opens[:, col],
+            'High': highs[:, col],
+            'Low': lows[:, col],
+            'Close': closes[:, col],
+            'Volume': volumes[:, col],
+        }, index=index)
+        for col, symbol in enumerate(symbols)
+    }
+
+
+def generate_transactions(histories, count, seed=0):
+    """
+    在历史数据的日期范围内随机生成买入交易，买入价格为当天的收盘价
+
+    Parameters:
+    histories (dict): generate_price_histories 生成的历史数据
+    count (int): 交易数量
+    seed (int): 随机种子
+
+    Returns:
+    list: SyntheticTransaction 列表，按买入日期排序
+    """
+    rng = np.random.default_rng(seed + 1)
+    symbols = list(histories)
+    transactions = []
+    for _ in range(count):
+        symbol = symbols[rng.integers(len(symbols))]
+        data = histories[symbol]
+        row = rng.integers(len(data))
+        transactions.append(SyntheticTransaction(
+            symbol=symbol,
+            quantity=float(rng.integers(1, 100)),
+            buy_date=data.index[row].strftime('%Y-%m-%d'),
+            buy_price=round(float(data['Close'].iloc[row]), 2),
+        ))
+    transactions.sort(key=lambda tx: tx.buy_date)
+    return transactions
@@ -0,0 +1,58 @@
+"""
+测试公共配置
+
+测试在 backend 目录下运行，不需要网络：
+
+    python -m pytest -q
+
+价格缓存、剖析结果等目录在导入 utils 之前指向临时目录，测试不会写入 data/ 下的文件。
+"""
+import os
+import sys
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix='portfolio-tests-')
+os.environ.setdefault('PRICE_CACHE_DIR', os.path.join(_TMP_DIR, 'price_cache'))
+os.environ.setdefault('PROFILE_DIR', os.path.join(_TMP_DIR, 'profiles'))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
+
+from utils import price_store  # noqa: E402
+
+
+def make_history(start, end, seed=0, freq='B'):
+    """
+    生成 [start, end) 内的OHLCV历史数据
+
+    Parameters:
+    start (str): 开始日期
+    end (str): 结束日期（不含）
+    seed (int): 随机种子
+    freq (str): 日期频率，默认工作日
+
+    Returns:
+    DataFrame: 以日期为索引的OHLCV数据
+    """
+    index = pd.date_range(start, pd.Timestamp(end) - pd.Timedelta(days=1), freq=freq)
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(index))))
+    return pd.DataFrame({
+        'Open': close, 'High': close * 1.01, 'Low': close * 0.99, 'Close': close,
+        'Adj Close': close, 'Volume': rng.integers(1000, 10000, len(index)).astype(float),
+    }, index=index.rename('Date'))
+
+
+@pytest.fixture
+def file_store(tmp_path):
+    """使用临时目录的 FileStore，测试结束后恢复原来的存储后端"""
+    previous = price_store._store
+    store = price_store.FileStore(str(tmp_path))
+    price_store.set_store(store)
+    yield store
+    price_store.set_store(previous)
@@ -0,0 +1,35 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.loadtest import _send, summarize
+from benchmarks.run import run_benchmarks
+
+
+def test_run_benchmarks_smoke():
+    # 极小规模完整运行一遍所有用例，任何用例出错都会直接抛出异常
+    report = run_benchmarks(symbols=3, years=1, transactions=10, repeat=1)
+    assert report['results']
+    assert 'calculate_indicators' in report['results']
+    for name, stats in report['results'].items():
+        assert len(stats['runs']) == 1 and stats['median'] >= 0, name
+
+
+@pytest.mark.parametrize('body, ok, status', [
+    ({'portfolio_value': [], 'indicators': {'总收益率': '1.00%'}}, True, 200),
+    ({'portfolio_value': [], 'indicators': {'计算错误': 'boom'}}, False, 'indicator_error'),
+])
+def test_loadtest_counts_indicator_errors(body, ok, status):
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json=body))
+
+    async def send():
+        results = []
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            await _send(client, 'portfolio', {'json': {}}, time.perf_counter(), results)
+        return results
+
+    [(kind, _, result_ok, result_status)] = asyncio.run(send())
+    assert (kind, result_ok, result_status) == ('portfolio', ok, status)
+    assert summarize([(kind, 0.01, result_ok, result_status)], 1.0)['portfolio']['error_rate'] == (0.0 if ok else 1.0)
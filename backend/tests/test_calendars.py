@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+from utils import calendars
+from utils.calendars import (exchange_of, exchange_trading_days, trading_calendar, output_calendar,
+                             resample_portfolio_value, validate_output_options)
+
+from conftest import make_history
+
+
+@pytest.mark.parametrize('symbol, exchange', [
+    ('AAPL', 'NYSE'), ('BRK-B', 'NYSE'), ('600519.SS', 'XSHG'), ('000001.sz', 'XSHG'), ('0700.HK', 'OTHER'),
+])
+def test_exchange_of(symbol, exchange):
+    assert exchange_of(symbol) == exchange
+
+
+def test_nyse_uses_market_calendar():
+    # 1994-04-27 尼克松国葬休市
+    days = exchange_trading_days('NYSE', '1994-04-25', '1994-04-29')
+    assert list(days.strftime('%Y-%m-%d')) == ['1994-04-25', '1994-04-26', '1994-04-28', '1994-04-29']
+    assert len(exchange_trading_days('NYSE', '2023-01-01', '2023-12-31')) == 250
+    assert calendars._market_calendar('NYSE') is calendars._market_calendar('NYSE')
+
+
+def test_xshg_uses_market_calendar():
+    # 春节 2020-01-24 到 2020-01-31 休市（1月31日为延长假期），不需要成交日期
+    days = exchange_trading_days('XSHG', '2020-01-20', '2020-02-07')
+    assert not days.isin(pd.date_range('2020-01-24', '2020-02-02')).any()
+    assert pd.Timestamp('2020-01-23') in days and pd.Timestamp('2020-02-03') in days
+
+
+def test_market_trading_days_are_cached_per_range():
+    calendars._market_trading_days.cache_clear()
+    first = exchange_trading_days('NYSE', '2020-01-01', pd.Timestamp('2020-12-31'))
+    first.name = 'Date'
+    second = exchange_trading_days('NYSE', pd.Timestamp('2020-01-01'), '2020-12-31')
+    assert calendars._market_trading_days.cache_info().hits == 1
+    # 修改返回的索引不影响缓存
+    assert second.name is None and first.equals(second)
+
+
+def test_other_exchange_drops_days_before_first_trade():
+    observed = pd.DatetimeIndex(['2020-01-03', '2020-01-07'])
+    days = exchange_trading_days('OTHER', '2020-01-01', '2020-01-09', observed)
+    assert list(days.strftime('%Y-%m-%d')) == ['2020-01-03', '2020-01-07', '2020-01-08', '2020-01-09']
+
+
+def test_trading_calendar_is_union_of_exchanges():
+    stock_data = {'0700.HK': make_history('2020-01-02', '2020-01-10')}
+    calendar = trading_calendar(['AAPL', '600519.SS', '0700.HK'], '2020-01-01', '2020-01-31', stock_data)
+    # 元旦所有交易所都休市
+    assert calendar[0] == pd.Timestamp('2020-01-02')
+    assert pd.Timestamp('2020-01-04') not in calendar
+    # 马丁·路德·金纪念日只有纽交所休市
+    assert pd.Timestamp('2020-01-20') in calendar
+    # 春节期间纽交所照常交易
+    assert pd.Timestamp('2020-01-28') in calendar
+
+
+def test_trading_calendar_of_weekend_falls_back_to_calendar_days():
+    calendar = trading_calendar(['AAPL'], '2020-01-04', '2020-01-05')
+    assert list(calendar.strftime('%Y-%m-%d')) == ['2020-01-04', '2020-01-05']
+
+
+def test_output_calendar_calendar_mode():
+    assert len(output_calendar(['AAPL'], '2020-01-01', '2020-01-31', 'calendar')) == 31
+
+
+def test_resample_takes_last_trading_day_of_period():
+    calendar = exchange_trading_days('NYSE', '2020-01-01', '2020-03-31')
+    frame = pd.DataFrame({'Date': calendar.strftime('%Y-%m-%d'), 'TotalValue': range(len(calendar))})
+    monthly = resample_portfolio_value(frame, 'monthly')
+    assert list(monthly['Date']) == ['2020-01-31', '2020-02-28', '2020-03-31']
+    assert resample_portfolio_value(frame, 'daily') is frame
+
+
+def test_validate_output_options():
+    validate_output_options(None, None)
+    validate_output_options('weekly', 'calendar')
+    with pytest.raises(ValueError):
+        validate_output_options('yearly', None)
+    with pytest.raises(ValueError):
+        validate_output_options(None, 'lunar')
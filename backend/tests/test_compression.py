@@ -0,0 +1,88 @@
+import gzip
+import zlib
+import asyncio
+
+import pytest
+
+from utils import compression
+from utils.compression import CompressionMiddleware, choose_encoding
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate', 'gzip'),
+    ('deflate', None),
+    ('', None),
+    ('gzip;q=0', None),
+    ('*', 'gzip'),
+    ('GZIP;q=0.5', 'gzip'),
+    ('gzip;q=abc', None),
+])
+def test_choose_encoding_gzip_only(monkeypatch, header, expected):
+    monkeypatch.setattr(compression, 'COMPRESSORS', {'gzip': compression._GzipCompressor})
+    assert choose_encoding(header) == expected
+
+
+def test_choose_encoding_prefers_brotli_on_equal_weight(monkeypatch):
+    monkeypatch.setattr(compression, 'COMPRESSORS', {'gzip': object, 'br': object})
+    assert choose_encoding('gzip, br') == 'br'
+    assert choose_encoding('gzip;q=1, br;q=0.5') == 'gzip'
+
+
+def run_app(chunks, accept_encoding='gzip', status=200, headers=(), minimum_size=100):
+    """通过中间件执行一个依次发送 chunks 的 ASGI 应用，返回发出的消息"""
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': status, 'headers': list(headers)})
+        for i, chunk in enumerate(chunks):
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': i < len(chunks) - 1})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'headers': [(b'accept-encoding', accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size)(scope, None, send))
+    return messages
+
+
+def response_headers(messages):
+    return {key.decode().lower(): value.decode() for key, value in messages[0]['headers']}
+
+
+def test_large_response_is_gzipped_with_suffixed_etag():
+    body = b'{"value": 1}' * 100
+    messages = run_app([body], headers=[(b'etag', b'"abc"'), (b'content-length', str(len(body)).encode())])
+    headers = response_headers(messages)
+    assert headers['content-encoding'] == 'gzip'
+    assert headers['etag'] == '"abc-gzip"'
+    assert headers['vary'] == 'Accept-Encoding'
+    assert int(headers['content-length']) == len(messages[1]['body'])
+    assert gzip.decompress(messages[1]['body']) == body
+
+
+def test_small_response_is_not_compressed():
+    messages = run_app([b'{}'])
+    assert 'content-encoding' not in response_headers(messages)
+    assert messages[1]['body'] == b'{}'
+
+
+def test_streamed_chunks_are_flushed_individually():
+    chunks = [b'{"type":"portfolio_value"}\n' * 10, b'{"type":"done"}\n']
+    messages = run_app(chunks, minimum_size=1000)
+    headers = response_headers(messages)
+    assert 'content-length' not in headers
+    # 每一块压缩后立即可以解压出完整的内容
+    decompressor = zlib.decompressobj(31)
+    assert decompressor.decompress(messages[1]['body']) == chunks[0]
+    assert decompressor.decompress(messages[2]['body']) == chunks[1]
+
+
+def test_not_modified_keeps_client_etag_suffix():
+    messages = run_app([b''], status=304, headers=[(b'etag', b'"abc"')])
+    assert response_headers(messages)['etag'] == '"abc-gzip"'
+
+
+def test_already_encoded_response_passes_through():
+    body = b'x' * 1000
+    messages = run_app([body], headers=[(b'content-encoding', b'identity')])
+    assert messages[1]['body'] == body
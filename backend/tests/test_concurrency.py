@@ -0,0 +1,35 @@
+import asyncio
+import threading
+import contextvars
+
+from utils.concurrency import run_in_fetch_pool, run_in_compute_pool
+
+request_var = contextvars.ContextVar('request_var', default=None)
+
+
+def read_context(*args, **kwargs):
+    return request_var.get(), threading.current_thread().name, args, kwargs
+
+
+def test_pools_run_in_caller_context():
+    async def main():
+        request_var.set('req-1')
+        fetched = await run_in_fetch_pool(read_context, 1, key='a')
+        computed = await run_in_compute_pool(read_context, 2)
+        return fetched, computed
+
+    fetched, computed = asyncio.run(main())
+    assert fetched[0] == 'req-1' and fetched[1].startswith('fetch') and fetched[2:] == ((1,), {'key': 'a'})
+    assert computed[0] == 'req-1' and computed[1].startswith('compute') and computed[2:] == ((2,), {})
+
+
+def test_context_changes_in_pool_do_not_leak():
+    def change():
+        request_var.set('changed')
+
+    async def main():
+        request_var.set('req-2')
+        await run_in_compute_pool(change)
+        return request_var.get()
+
+    assert asyncio.run(main()) == 'req-2'
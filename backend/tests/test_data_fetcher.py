@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from utils import concurrency, data_fetcher, providers
+from utils.data_fetcher import get_price_histories, get_price_histories_async, search_stocks
+from utils.providers import PriceProvider, combine_histories
+
+from conftest import make_history
+
+
+class CountingProvider(PriceProvider):
+    """返回固定历史数据的切片，记录每次请求的股票，可以在请求中途阻塞"""
+
+    name = 'counting'
+
+    def __init__(self, history):
+        self.history = history
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def fetch_many(self, symbols, start_date, end_date):
+        self.calls.append(tuple(symbols))
+        self.release.wait(10)
+        data = self.history[(self.history.index >= start_date) & (self.history.index < end_date)]
+        return combine_histories({symbol: data for symbol in symbols})
+
+
+@pytest.fixture
+def provider(file_store):
+    previous = providers._provider
+    provider = CountingProvider(make_history('2019-01-01', '2021-01-01'))
+    providers.set_provider(provider)
+    yield provider
+    providers.set_provider(previous)
+
+
+def test_get_price_histories_returns_requested_window(provider):
+    histories = get_price_histories(['AAA', 'BBB', 'AAA'], '2020-01-01', '2020-02-01')
+    assert list(histories) == ['AAA', 'BBB']
+    assert histories['AAA'].index.min() >= pd.Timestamp('2020-01-01')
+    assert histories['AAA'].index.max() < pd.Timestamp('2020-02-01')
+    assert provider.calls == [('AAA', 'BBB')]
+
+
+def test_concurrent_requests_share_one_download(provider):
+    provider.release.clear()
+
+    async def run():
+        first = asyncio.ensure_future(get_price_histories_async(['CCC'], '2020-01-01', '2020-06-01'))
+        await asyncio.sleep(0.1)
+        # 区间被进行中的下载覆盖，等待并共享它的结果
+        second = asyncio.ensure_future(get_price_histories_async(['CCC'], '2020-02-01', '2020-03-01'))
+        await asyncio.sleep(0.1)
+        provider.release.set()
+        return await first, await second
+
+    first, second = asyncio.run(run())
+    assert provider.calls == [('CCC',)]
+    pd.testing.assert_frame_equal(second['CCC'], first['CCC']['2020-02-01':'2020-02-29'])
+
+
+def test_get_close_price(provider):
+    assert data_fetcher.get_close_price('DDD', '2020-03-07') == (
+        '2020-03-06', float(provider.history.loc['2020-03-06', 'Close']))
+
+
+def test_price_lookups_waiting_on_async_download_do_not_hold_fetch_threads(provider, monkeypatch):
+    monkeypatch.setattr(concurrency, 'fetch_executor', ThreadPoolExecutor(max_workers=2))
+    busy = threading.Event()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        # 占满下载线程池，之后提交的任务都要排队
+        blockers = [loop.run_in_executor(concurrency.fetch_executor, busy.wait, 10) for _ in range(2)]
+        # 覆盖查询区间的异步下载先登记，查询都等待它；它在线程池中的任务排在查询提交的任务之后
+        owner = asyncio.ensure_future(get_price_histories_async(['EEE'], '1970-01-01', '2023-01-01'))
+        lookups = [asyncio.ensure_future(data_fetcher.get_close_price_async('EEE', '2020-03-07')) for _ in range(4)]
+        await asyncio.sleep(0.05)
+        busy.set()
+        await asyncio.gather(*blockers)
+        return await asyncio.wait_for(asyncio.gather(owner, *lookups), 10)
+
+    owner, *prices = asyncio.run(run())
+    expected = ('2020-03-06', float(provider.history.loc['2020-03-06', 'Close']))
+    assert prices == [expected] * 4
+    assert provider.calls == [('EEE',)]
+
+
+def test_search_stocks_uses_stock_list():
+    results = search_stocks('aapl')
+    assert results and results[0]['symbol'] == 'AAPL'
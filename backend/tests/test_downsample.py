@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.downsample import lttb_indices, downsample_portfolio_value, validate_max_points
+
+
+def reference_lttb(x, y, threshold):
+    """LTTB 原始算法的逐点实现（Steinarsson 2013），桶边界按整数划分"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    buckets = threshold - 2
+    bounds = [i * (n - 2) // buckets + 1 for i in range(buckets + 1)]
+    selected = [0]
+    a = 0
+    for i in range(buckets):
+        lo, hi = bounds[i], bounds[i + 1]
+        if i + 1 < buckets:
+            next_lo, next_hi = bounds[i + 1], bounds[i + 2]
+            avg_x = sum(x[next_lo:next_hi]) / (next_hi - next_lo)
+            avg_y = sum(y[next_lo:next_hi]) / (next_hi - next_lo)
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        best, best_area = lo, -1.0
+        for j in range(lo, hi):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])) / 2
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+
+@pytest.mark.parametrize('n, threshold', [(1000, 100), (1000, 3), (257, 50), (10, 9), (500, 499)])
+def test_matches_reference_lttb(n, threshold):
+    rng = np.random.default_rng(n + threshold)
+    x = np.cumsum(rng.integers(1, 4, n)).astype(float)
+    y = 100 + np.cumsum(rng.normal(0, 1, n))
+    assert lttb_indices(x, y, threshold).tolist() == reference_lttb(x.tolist(), y.tolist(), threshold)
+
+
+def test_keeps_extremes_and_endpoints():
+    x = np.arange(2000, dtype=float)
+    y = np.sin(x / 50)
+    y[777] = 10.0
+    y[1333] = -10.0
+    indices = lttb_indices(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 1999
+    assert 777 in indices and 1333 in indices
+    assert (np.diff(indices) > 0).all()
+
+
+def test_short_series_are_returned_unchanged():
+    assert lttb_indices(np.arange(5), np.arange(5), 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb_indices(np.arange(5), np.arange(5), 2).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_downsample_portfolio_value_uses_same_rows_for_all_columns():
+    dates = pd.bdate_range('2015-01-01', periods=1500)
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'Date': dates.strftime('%Y-%m-%d'),
+                          'TotalValue': 1000 + np.cumsum(rng.normal(0, 5, len(dates))),
+                          'AAA': rng.normal(0, 1, len(dates))})
+    result = downsample_portfolio_value(frame, 200)
+    assert len(result) == 200
+    merged = result.merge(frame, on='Date', suffixes=('', '_full'))
+    assert (merged['AAA'] == merged['AAA_full']).all()
+    assert downsample_portfolio_value(frame, None) is frame
+    assert downsample_portfolio_value(frame, 5000) is frame
+
+
+def test_validate_max_points():
+    validate_max_points(None)
+    validate_max_points(3)
+    for value in (2, 100001):
+        with pytest.raises(ValueError):
+            validate_max_points(value)
@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import encoding
+from utils.encoding import (dumps, encode_portfolio_result, encode_stream_event, encode_cached_stream, portfolio_series,
+                            validate_format)
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'Date': ['2020-01-02', '2020-01-03', '2020-01-06'],
+        'TotalValue': [100.0, 101.5, 99.25],
+        'AAA': [60.0, 61.5, 59.25],
+        '600519.SS': [40.0, 40.0, 40.0],
+    })
+
+
+INDICATORS = {'收益指标': {'总收益率': '1.00%'}, 'count': np.int64(3), 'series': np.array([1.0, 2.0])}
+
+
+def test_records_match_to_dict(frame):
+    body = json.loads(encode_portfolio_result(frame, INDICATORS, 'records'))
+    assert body['portfolio_value'] == frame.to_dict(orient='records')
+    assert body['indicators'] == {'收益指标': {'总收益率': '1.00%'}, 'count': 3, 'series': [1.0, 2.0]}
+
+
+def test_columnar_round_trips_to_same_frame(frame):
+    body = json.loads(encode_portfolio_result(frame, INDICATORS, 'columnar'))
+    pd.testing.assert_frame_equal(pd.DataFrame(body['portfolio_value']), frame)
+
+
+def test_arrow_round_trips_with_indicators(frame):
+    pa = pytest.importorskip('pyarrow')
+    reader = pa.ipc.open_stream(encode_portfolio_result(frame, INDICATORS, 'arrow'))
+    table = reader.read_all()
+    result = table.to_pandas()
+    result['Date'] = pd.to_datetime(result['Date']).dt.strftime('%Y-%m-%d')
+    pd.testing.assert_frame_equal(result, frame)
+    assert json.loads(table.schema.metadata[b'indicators'])['count'] == 3
+
+
+def test_json_fallback_without_orjson_gives_same_content(monkeypatch, frame):
+    expected = json.loads(encode_portfolio_result(frame, INDICATORS, 'columnar'))
+    monkeypatch.setattr(encoding, 'orjson', None)
+    assert json.loads(encode_portfolio_result(frame, INDICATORS, 'columnar')) == expected
+    assert dumps({'名称': '茅台'}).decode('utf-8') == '{"名称":"茅台"}'
+
+
+@pytest.mark.parametrize('fmt', ['records', 'columnar'])
+def test_json_fallback_writes_nan_as_null_like_orjson(monkeypatch, frame, fmt):
+    frame.loc[1, 'AAA'] = np.nan
+    indicators = {'夏普比率': float('nan'), 'series': np.array([1.0, np.inf]), 'value': np.float64('nan')}
+    with_orjson = encode_portfolio_result(frame, indicators, fmt)
+    monkeypatch.setattr(encoding, 'orjson', None)
+    fallback = encode_portfolio_result(frame, indicators, fmt)
+    assert json.loads(fallback) == json.loads(with_orjson)
+    assert json.loads(fallback)['indicators'] == {'夏普比率': None, 'series': [1.0, None], 'value': None}
+
+
+def test_stream_events(frame):
+    payload = {'portfolio_value': portfolio_series(frame, 'columnar')}
+    line = encode_stream_event('portfolio_value', payload, 'ndjson')
+    assert line.endswith(b'\n') and line.count(b'\n') == 1
+    assert json.loads(line)['type'] == 'portfolio_value'
+
+    event = encode_stream_event('done', {}, 'sse')
+    assert event == b'event: done\ndata: {}\n\n'
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_cached_stream_replays_body_as_events(monkeypatch, frame, use_orjson):
+    body = encode_portfolio_result(frame, INDICATORS, 'columnar')
+    if not use_orjson:
+        monkeypatch.setattr(encoding, 'orjson', None)
+    events = [json.loads(line) for line in encode_cached_stream(body, 'ndjson')]
+    assert [event['type'] for event in events] == ['portfolio_value', 'indicators', 'done']
+    assert events[0]['data'] == json.loads(body)['portfolio_value']
+    assert events[1]['data'] == json.loads(body)['indicators']
+
+    sse = encode_cached_stream(body, 'sse')
+    assert sse[-1] == b'event: done\ndata: {}\n\n'
+
+
+def test_dumps_timestamps():
+    assert json.loads(dumps({'t': pd.Timestamp('2020-01-02')})) == {'t': '2020-01-02T00:00:00'}
+
+
+@pytest.mark.parametrize('fmt, stream', [('xml', None), (None, 'websocket'), ('arrow', 'ndjson')])
+def test_validate_format_rejects(fmt, stream):
+    with pytest.raises(ValueError):
+        validate_format(fmt, stream)
+
+
+def test_validate_format_accepts():
+    for fmt in (None, 'records', 'columnar'):
+        validate_format(fmt)
+        validate_format(fmt, 'sse')
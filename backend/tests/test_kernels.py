@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.kernels import (running_peak, new_peak_mask, peak_index, underwater, run_lengths,
+                           segment_episodes, segment_max, rolling_window_stats, rolling_tail_risk, gini)
+
+
+def random_values(seed, n=500):
+    """带有平台期和大幅回撤的价值序列"""
+    rng = np.random.default_rng(seed)
+    values = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    values[n // 3:n // 3 + 20] = values[n // 3]
+    return values
+
+
+SERIES = [random_values(seed) for seed in range(5)] + [
+    np.array([]), np.array([5.0]), np.array([0.0, 0.0, 1.0, 0.5]), np.array([3.0, 2.0, 1.0]), np.ones(10),
+]
+
+
+def reference_streaks(binary_array):
+    """重构前逐个累计连续为真的天数"""
+    streaks = []
+    current = 0
+    for value in binary_array:
+        if value:
+            current += 1
+        elif current > 0:
+            streaks.append(current)
+            current = 0
+    if current > 0:
+        streaks.append(current)
+    return streaks
+
+
+def reference_drawdown_periods(values):
+    """重构前逐点划分回撤区间：超过2%开始，小于0.5%结束，创新高放弃"""
+    periods = []
+    peak = values[0]
+    start = None
+    for i, value in enumerate(values):
+        if value > peak:
+            peak = value
+            start = None
+        elif peak > 0:
+            drawdown = (peak - value) / peak
+            if start is None and drawdown > 0.02:
+                start = i
+            if start is not None and drawdown < 0.005:
+                periods.append((start, i, max((peak - values[j]) / peak for j in range(start, i + 1))))
+                start = None
+    if start is not None:
+        periods.append((start, len(values) - 1, max((peak - values[j]) / peak for j in range(start, len(values)))))
+    return periods
+
+
+@pytest.mark.parametrize('values', SERIES)
+def test_drawdown_kernels_match_pandas(values):
+    series = pd.Series(values, dtype=float)
+    peak = series.cummax()
+    np.testing.assert_array_equal(running_peak(values), peak.to_numpy())
+
+    expected = np.where(peak > 0, (peak - series) / peak.where(peak > 0, 1), 0.0)
+    np.testing.assert_allclose(underwater(values), expected)
+
+    expected_index = [int(np.argmax(values[:i + 1])) for i in range(len(values))]
+    assert peak_index(values).tolist() == expected_index
+    if len(values):
+        assert not new_peak_mask(values)[0]
+
+
+@pytest.mark.parametrize('values', SERIES)
+def test_run_lengths_match_loop(values):
+    returns = np.diff(values) if len(values) > 1 else np.array([])
+    for mask in (returns > 0, returns < 0):
+        starts, lengths = run_lengths(mask)
+        assert lengths.tolist() == reference_streaks(mask)
+        assert all(mask[start:start + length].all() for start, length in zip(starts, lengths))
+
+
+@pytest.mark.parametrize('values', [values for values in SERIES if len(values) > 0])
+def test_segment_episodes_match_drawdown_loop(values):
+    peak = running_peak(values)
+    new_peak = new_peak_mask(values, peak)
+    curve = underwater(values, peak)
+    in_drawdown = ~new_peak & (peak > 0)
+    starts, ends, _ = segment_episodes(in_drawdown & (curve > 0.02), in_drawdown & (curve < 0.005), new_peak)
+    depths = segment_max(curve, starts, ends)
+
+    expected = reference_drawdown_periods(values)
+    assert list(zip(starts.tolist(), ends.tolist())) == [(start, end) for start, end, _ in expected]
+    np.testing.assert_allclose(depths, [depth for _, _, depth in expected])
+
+
+def test_segment_episodes_marks_open_episode():
+    start = np.array([0, 1, 0, 0, 1, 0], dtype=bool)
+    end = np.array([0, 0, 1, 0, 0, 0], dtype=bool)
+    starts, ends, is_open = segment_episodes(start, end)
+    assert starts.tolist() == [1, 4]
+    assert ends.tolist() == [2, 5]
+    assert is_open.tolist() == [False, True]
+
+
+def test_segment_episodes_drops_cancelled_episode():
+    start = np.array([1, 0, 0, 1, 0], dtype=bool)
+    end = np.array([0, 0, 0, 0, 1], dtype=bool)
+    cancel = np.array([0, 1, 0, 0, 0], dtype=bool)
+    starts, ends, _ = segment_episodes(start, end, cancel)
+    assert starts.tolist() == [3] and ends.tolist() == [4]
+
+
+def test_segment_max_handles_segment_at_end():
+    values = np.array([1.0, 5.0, 2.0, 7.0, 3.0])
+    assert segment_max(values, [0, 2], [1, 4]).tolist() == [5.0, 7.0]
+    assert segment_max(values, [], []).size == 0
+
+
+def returns_with_flat_stretch(seed, n=400):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.015, n)
+    returns[100:140] = 0.0
+    returns[200:230] = 0.001
+    return returns
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_rolling_window_stats_match_pandas_rolling(seed):
+    returns = returns_with_flat_stretch(seed)
+    series = pd.Series(returns)
+    windows = [1, 2, 20, 60, 20, len(returns), len(returns) + 1]
+    stats = rolling_window_stats(returns, windows)
+    assert list(stats) == [1, 2, 20, 60, len(returns), len(returns) + 1]
+    for window, result in stats.items():
+        rolling = series.rolling(window=window)
+        np.testing.assert_allclose(result['mean'], rolling.mean().to_numpy(), rtol=1e-9, atol=1e-12)
+        np.testing.assert_allclose(result['std'], rolling.std().to_numpy(), rtol=1e-7, atol=1e-12)
+        win_rate = rolling.apply(lambda x: np.sum(x > 0) / len(x) * 100, raw=True)
+        np.testing.assert_allclose(result['win_rate'], win_rate.to_numpy())
+
+
+def test_rolling_window_stats_constant_window_is_exact():
+    returns = np.concatenate((np.random.default_rng(0).normal(0, 1e6, 50), np.full(30, 0.1)))
+    result = rolling_window_stats(returns, [10])[10]
+    assert (result['mean'][-21:] == 0.1).all()
+    assert (result['std'][-21:] == 0.0).all()
+
+
+@pytest.mark.parametrize('window', [1, 2, 5, 20, 61])
+def test_rolling_tail_risk_matches_percentile_per_window(window):
+    returns = returns_with_flat_stretch(1, n=300)
+    # 重复值让二分查找删除和插入都要处理相同的元素
+    returns[50:60] = returns[40]
+    levels = [0.95, 0.99, 0.5, 0.95]
+    result = rolling_tail_risk(returns, window, levels)
+    assert list(result) == [0.95, 0.99, 0.5]
+    for level, series in result.items():
+        assert np.isnan(series['var'][:window - 1]).all()
+        for end in range(window - 1, len(returns)):
+            values = returns[end - window + 1:end + 1]
+            var = np.percentile(values, (1 - level) * 100)
+            assert series['var'][end] == pytest.approx(var, rel=1e-12, abs=1e-15)
+            assert series['cvar'][end] == pytest.approx(np.mean(values[values <= var]), rel=1e-12, abs=1e-15)
+
+
+def test_rolling_tail_risk_window_longer_than_series():
+    result = rolling_tail_risk(np.array([0.1, -0.2]), 3, [0.95])
+    assert np.isnan(result[0.95]['var']).all() and np.isnan(result[0.95]['cvar']).all()
+
+
+def test_gini_matches_mean_absolute_difference():
+    values = np.random.default_rng(0).uniform(0, 100, 7)
+    expected = np.abs(values[:, None] - values[None, :]).sum() / (2 * len(values) ** 2 * values.mean())
+    assert gini(values) == pytest.approx(expected)
+    assert gini([25, 25, 25, 25]) == 0.0
+    assert gini([0, 0, 100]) == pytest.approx(2 / 3)
+    assert gini([]) == 0.0 and gini([0, 0]) == 0.0
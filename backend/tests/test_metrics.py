@@ -0,0 +1,73 @@
+import pytest
+
+from utils.metrics import MetricsRegistry, Counter, Histogram, CallbackMetric
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_counter_with_labels(registry):
+    counter = Counter('fetches_total', '下载次数', ('provider', 'symbol'), registry=registry)
+    counter.inc(provider='fake', symbol='AAPL')
+    counter.inc(2, provider='fake', symbol='AAPL')
+    counter.inc(provider='fake', symbol='MSFT')
+    text = registry.render()
+    assert '# HELP fetches_total 下载次数' in text
+    assert '# TYPE fetches_total counter' in text
+    assert 'fetches_total{provider="fake",symbol="AAPL"} 3' in text
+    assert 'fetches_total{provider="fake",symbol="MSFT"} 1' in text
+
+
+def test_labels_must_match(registry):
+    counter = Counter('hits_total', '命中次数', ('cache',), registry=registry)
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        counter.inc(cache='price', extra='x')
+
+
+def test_duplicate_name(registry):
+    Counter('dup_total', 'a', registry=registry)
+    with pytest.raises(ValueError):
+        Counter('dup_total', 'b', registry=registry)
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    histogram = Histogram('latency_seconds', '延迟', ('route',), buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value, route='/a')
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_seconds_sum{route="/a"} 2.65' in lines
+    assert 'latency_seconds_count{route="/a"} 4' in lines
+
+
+def test_label_values_are_escaped(registry):
+    counter = Counter('escaped_total', '转义', ('name',), registry=registry)
+    counter.inc(name='a"b\\c\nd')
+    assert 'escaped_total{name="a\\"b\\\\c\\nd"} 1' in registry.render()
+
+
+def test_callback_metric(registry):
+    CallbackMetric('bytes', '字节数', lambda: 1024, registry=registry)
+    CallbackMetric('entries', '条目数', lambda: {('price',): 3, ('result',): 1}, labelnames=('cache',), registry=registry)
+    text = registry.render()
+    assert '# TYPE bytes gauge' in text
+    assert 'bytes 1024' in text
+    assert 'entries{cache="price"} 3' in text
+    assert 'entries{cache="result"} 1' in text
+
+
+def test_failing_metric_is_skipped(registry):
+    def broken():
+        raise RuntimeError('boom')
+
+    CallbackMetric('broken', '读取失败', broken, registry=registry)
+    Counter('ok_total', '正常', registry=registry).inc()
+    text = registry.render()
+    assert 'broken' not in text
+    assert 'ok_total 1' in text
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.indicators import calculate_indicators
+from utils.pipeline import (IndicatorContext, INDICATOR_GROUPS, quantile_sorted, default_indicator_groups,
+                            iter_indicator_groups, validate_indicator_groups,
+                            validate_rolling_windows, validate_var_settings)
+
+
+def make_portfolio(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    values = 10000 * np.cumprod(1 + rng.normal(0.0005, 0.01, n))
+    df = pd.DataFrame({
+        'Date': pd.bdate_range('2020-01-01', periods=n).strftime('%Y-%m-%d'),
+        'AAA': values * 0.6,
+        'BBB': values * 0.4,
+        'TotalValue': values,
+    })
+    transactions = [SimpleNamespace(symbol='AAA', quantity=60, buy_price=100.0),
+                    SimpleNamespace(symbol='BBB', quantity=40, buy_price=100.0)]
+    return df, transactions
+
+
+def make_context(n=300, seed=0, **kwargs):
+    return IndicatorContext(*make_portfolio(n, seed), **kwargs)
+
+
+@pytest.mark.parametrize('q', [0.0, 0.01, 0.05, 0.25, 0.5, 0.95, 0.99, 1.0])
+def test_quantile_sorted_matches_numpy(q):
+    values = np.sort(np.random.default_rng(1).normal(size=257))
+    assert quantile_sorted(values, q) == np.percentile(values, q * 100)
+
+
+def test_daily_returns_skip_non_positive_values():
+    ctx = IndicatorContext(total_values=[100.0, 0.0, 50.0, 55.0], dates=pd.bdate_range('2020-01-01', periods=4))
+    # 前一日价值为0的收益率不参与计算
+    np.testing.assert_allclose(ctx.daily_returns, [-1.0, 0.1])
+
+
+def test_intermediate_results_are_computed_once():
+    ctx = make_context()
+    assert ctx.daily_returns is ctx.daily_returns
+    first = ctx.rolling(20)
+    stats = ctx.rolling_stats([20, 60])
+    assert stats[20] is first
+    tail = ctx.tail_risk(60, [0.95])
+    assert ctx.tail_risk(60, [0.95, 0.99])[0.95] is tail[0.95]
+
+
+def test_only_selected_groups_prepare_their_requirements():
+    ctx = make_context()
+    names = [name for name, _ in iter_indicator_groups(ctx, ['returns'])]
+    assert names == ['returns']
+    assert 'daily_returns' in vars(ctx)
+    for name in ('sorted_returns', 'underwater', 'running_peak', 'latest_values'):
+        assert name not in vars(ctx)
+
+
+def test_groups_are_computed_in_registration_order():
+    ctx = make_context()
+    selected = ['drawdown', 'returns']
+    assert [name for name, _ in iter_indicator_groups(ctx, selected)] == [name for name in INDICATOR_GROUPS if name in selected]
+
+
+def test_default_groups():
+    defaults = default_indicator_groups()
+    assert 'tail_risk' not in defaults
+    assert set(defaults) == {name for name, group in INDICATOR_GROUPS.items() if group.default}
+    assert calculate_indicators(*make_portfolio(), []) == {}
+
+
+def test_calculate_indicators_merges_selected_groups():
+    merged = calculate_indicators(*make_portfolio(), ['returns', 'risk'])
+    separate = {}
+    for name in ('returns', 'risk'):
+        separate.update(INDICATOR_GROUPS[name].compute(make_context()))
+    assert merged.keys() == separate.keys()
+
+
+def test_allocation_group_with_two_symbols():
+    ctx = make_context()
+    indicators = INDICATOR_GROUPS['allocation'].compute(ctx)
+    # 两只股票的权重为 60% 和 40%
+    assert indicators['基尼系数'] == '0.10'
+    assert indicators['权重集中度(HHI)'] == '0.52'
+    assert indicators['股票权重'] == {'AAA': '60.00%', 'BBB': '40.00%'}
+    assert calculate_indicators(*make_portfolio(), ['allocation']).keys() == indicators.keys()
+
+
+def test_validation():
+    validate_indicator_groups(list(INDICATOR_GROUPS))
+    with pytest.raises(ValueError, match='未知的指标组'):
+        validate_indicator_groups(['returns', 'unknown'])
+    validate_rolling_windows([2, 2520])
+    with pytest.raises(ValueError):
+        validate_rolling_windows([1])
+    with pytest.raises(ValueError):
+        validate_rolling_windows(list(range(2, 13)))
+    validate_var_settings(60, [0.5, 0.99])
+    with pytest.raises(ValueError):
+        validate_var_settings(levels=[1.0])
+    with pytest.raises(ValueError):
+        validate_var_settings(window=1)
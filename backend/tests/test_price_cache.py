@@ -0,0 +1,175 @@
+import pandas as pd
+import pytest
+
+from utils import price_cache
+from utils.price_cache import find_missing_ranges, merge_ranges, get_history_many
+from utils.providers import PriceProvider, combine_histories
+
+from conftest import make_history
+
+
+class RecordingProvider(PriceProvider):
+    """返回给定历史数据的切片并记录每次请求的数据源"""
+
+    def __init__(self, histories, fail=False):
+        self.histories = histories
+        self.fail = fail
+        self.calls = []
+
+    def fetch(self, symbol, start_date, end_date):
+        return self.fetch_many([symbol], start_date, end_date)
+
+    def fetch_many(self, symbols, start_date, end_date):
+        self.calls.append((tuple(symbols), start_date, end_date))
+        if self.fail:
+            raise ConnectionError('upstream unavailable')
+        sliced = {}
+        for symbol in symbols:
+            data = self.histories.get(symbol, pd.DataFrame())
+            if not data.empty:
+                data = data[(data.index >= pd.Timestamp(start_date)) & (data.index < pd.Timestamp(end_date))]
+            sliced[symbol] = data
+        return combine_histories(sliced)
+
+
+def day(value):
+    return pd.Timestamp(value)
+
+
+def test_merge_ranges_joins_overlapping_and_adjacent():
+    ranges = [(day('2020-01-10'), day('2020-01-20')), (day('2020-01-01'), day('2020-01-05')),
+              (day('2020-01-05'), day('2020-01-08')), (day('2020-01-15'), day('2020-01-25'))]
+    assert merge_ranges(ranges) == [(day('2020-01-01'), day('2020-01-08')), (day('2020-01-10'), day('2020-01-25'))]
+
+
+def test_find_missing_ranges():
+    covered = [(day('2020-01-05'), day('2020-01-10')), (day('2020-01-15'), day('2020-01-20'))]
+    assert find_missing_ranges(covered, day('2020-01-01'), day('2020-01-31')) == [
+        (day('2020-01-01'), day('2020-01-05')),
+        (day('2020-01-10'), day('2020-01-15')),
+        (day('2020-01-20'), day('2020-01-31')),
+    ]
+    assert find_missing_ranges(covered, day('2020-01-06'), day('2020-01-09')) == []
+
+
+def test_cold_cache_fetches_and_records_coverage(file_store):
+    history = make_history('2020-01-01', '2020-03-01')
+    provider = RecordingProvider({'AAA': history})
+
+    result = get_history_many(['AAA'], '2020-01-01', '2020-03-01', provider)['AAA']
+    pd.testing.assert_frame_equal(result, history, check_freq=False, check_dtype=False)
+    assert file_store.load_meta('AAA')['stable'] == [['2020-01-01', '2020-03-01']]
+
+    # 第二次完全命中缓存，不再访问上游
+    again = get_history_many(['AAA'], '2020-01-10', '2020-02-10', provider)['AAA']
+    assert len(provider.calls) == 1
+    pd.testing.assert_frame_equal(again, history['2020-01-10':'2020-02-09'], check_freq=False, check_dtype=False)
+
+
+def test_gap_fill_only_fetches_missing_range(file_store):
+    history = make_history('2020-01-01', '2020-06-01')
+    provider = RecordingProvider({'AAA': history})
+    get_history_many(['AAA'], '2020-02-01', '2020-03-01', provider)
+
+    result = get_history_many(['AAA'], '2020-01-01', '2020-04-01', provider)['AAA']
+    # 缺失区间的外包区间是 [2020-01-01, 2020-04-01)，已有部分不会重复写入
+    assert provider.calls[-1][1:] == ('2020-01-01', '2020-04-01')
+    pd.testing.assert_frame_equal(result, history[:'2020-03-31'], check_freq=False, check_dtype=False)
+    assert file_store.load_meta('AAA')['stable'] == [['2020-01-01', '2020-04-01']]
+
+
+def test_empty_upstream_response_is_covered_briefly_without_new_version(file_store):
+    history = make_history('2020-01-01', '2020-03-01')
+    get_history_many(['AAA'], '2020-01-01', '2020-03-01', RecordingProvider({'AAA': history}))
+    versions_before = price_cache.get_price_versions(['AAA'])
+
+    empty = RecordingProvider({})
+    result = get_history_many(['AAA'], '2020-01-01', '2020-05-01', empty)['AAA']
+    get_history_many(['AAA'], '2020-01-01', '2020-05-01', empty)
+
+    assert len(empty.calls) == 1
+    pd.testing.assert_frame_equal(result, history, check_freq=False, check_dtype=False)
+    meta = file_store.load_meta('AAA')
+    assert meta['stable'] == [['2020-01-01', '2020-03-01']]
+    assert [(item['start'], item['end'], item['empty']) for item in meta['volatile']] == [('2020-03-01', '2020-05-01', True)]
+    # 数据没有变化，版本号不变
+    assert price_cache.get_price_versions(['AAA']) == versions_before
+
+
+def test_swallowed_download_error_does_not_poison_cache(file_store, monkeypatch):
+    # yfinance 遇到网络错误时返回空数据而不是抛出异常
+    outage = RecordingProvider({})
+    assert get_history_many(['AAA'], '2020-01-01', '2020-03-01', outage)['AAA'].empty
+    assert file_store.load_meta('AAA')['stable'] == []
+
+    monkeypatch.setattr(price_cache, 'PRICE_CACHE_NEGATIVE_TTL', 0)
+    history = make_history('2020-01-01', '2020-03-01')
+    recovered = RecordingProvider({'AAA': history})
+    result = get_history_many(['AAA'], '2020-01-01', '2020-03-01', recovered)['AAA']
+    assert len(recovered.calls) == 1
+    pd.testing.assert_frame_equal(result, history, check_freq=False, check_dtype=False)
+    meta = file_store.load_meta('AAA')
+    assert meta['stable'] == [['2020-01-01', '2020-03-01']]
+    assert meta['volatile'] == []
+
+
+def test_holiday_only_gap_is_fetched_once(file_store):
+    # 2020-12-25 是工作日但休市
+    history = make_history('2020-12-01', '2021-01-01').drop(pd.Timestamp('2020-12-25'))
+    provider = RecordingProvider({'AAA': history})
+    get_history_many(['AAA'], '2020-12-01', '2020-12-25', provider)
+    get_history_many(['AAA'], '2020-12-26', '2021-01-01', provider)
+
+    get_history_many(['AAA'], '2020-12-01', '2021-01-01', provider)
+    assert provider.calls[-1][1:] == ('2020-12-25', '2020-12-26')
+    calls = len(provider.calls)
+    get_history_many(['AAA'], '2020-12-01', '2021-01-01', provider)
+    assert len(provider.calls) == calls
+
+
+def test_pre_listing_gap_is_fetched_once(file_store):
+    history = make_history('2021-01-04', '2021-03-01')
+    provider = RecordingProvider({'AAA': history})
+    result = get_history_many(['AAA'], '2019-01-02', '2021-03-01', provider)['AAA']
+    pd.testing.assert_frame_equal(result, history, check_freq=False, check_dtype=False)
+
+    get_history_many(['AAA'], '2019-01-02', '2021-03-01', provider)
+    get_history_many(['AAA'], '2019-06-01', '2020-06-01', provider)
+    assert len(provider.calls) == 1
+
+
+def test_symbols_without_rows_record_coverage(file_store):
+    provider = RecordingProvider({'AAA': make_history('2020-01-01', '2020-02-01')})
+    result = get_history_many(['AAA', 'BBB'], '2020-01-01', '2020-02-01', provider)
+    assert result['BBB'].empty
+    assert file_store.load_meta('AAA')['stable'] == [['2020-01-01', '2020-02-01']]
+    assert file_store.load_meta('BBB')['stable'] == []
+    assert file_store.load_meta('BBB')['volatile'][0]['empty']
+    get_history_many(['AAA', 'BBB'], '2020-01-01', '2020-02-01', provider)
+    assert len(provider.calls) == 1
+
+
+def test_upstream_error_keeps_cached_data(file_store):
+    history = make_history('2020-01-01', '2020-03-01')
+    get_history_many(['AAA'], '2020-01-01', '2020-03-01', RecordingProvider({'AAA': history}))
+
+    failing = RecordingProvider({}, fail=True)
+    result = get_history_many(['AAA'], '2019-12-01', '2020-03-01', failing)['AAA']
+    assert len(failing.calls) == 1
+    pd.testing.assert_frame_equal(result, history, check_freq=False, check_dtype=False)
+    assert file_store.load_meta('AAA')['stable'] == [['2020-01-01', '2020-03-01']]
+
+
+def test_weekend_only_gap_is_not_fetched(file_store):
+    # 2020-01-04/05 是周末
+    provider = RecordingProvider({'AAA': make_history('2020-01-01', '2020-01-04')})
+    get_history_many(['AAA'], '2020-01-01', '2020-01-04', provider)
+    get_history_many(['AAA'], '2020-01-01', '2020-01-06', provider)
+    assert len(provider.calls) == 1
+
+
+@pytest.mark.parametrize('start, end', [('2020-01-01', '2020-01-01'), ('2020-02-01', '2020-01-01')])
+def test_empty_range_returns_empty_frames(file_store, start, end):
+    provider = RecordingProvider({})
+    assert get_history_many(['AAA'], start, end, provider)['AAA'].empty
+    assert provider.calls == []
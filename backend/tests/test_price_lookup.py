@@ -0,0 +1,120 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from utils.price_lookup import PriceLookup
+
+from conftest import make_history
+
+
+class FetchRecorder:
+    """按 [start_date, end_date) 切片返回给定历史数据，并记录每次调用"""
+
+    def __init__(self, history):
+        self.history = history
+        self.calls = []
+
+    def __call__(self, symbol, start_date, end_date):
+        self.calls.append((symbol, start_date, end_date))
+        data = self.history
+        return data[(data.index >= pd.Timestamp(start_date)) & (data.index < pd.Timestamp(end_date))]
+
+
+def test_returns_close_of_latest_trading_day_on_or_before_date():
+    history = make_history('2019-01-01', '2021-01-01')
+    lookup = PriceLookup(FetchRecorder(history), window_days=90)
+    # 2020-01-04 是周六，返回周五的收盘价
+    assert lookup.get_close('AAA', '2020-01-04') == ('2020-01-03', float(history.loc['2020-01-03', 'Close']))
+    assert lookup.get_close('AAA', '2020-01-06') == ('2020-01-06', float(history.loc['2020-01-06', 'Close']))
+
+
+def test_nearby_dates_hit_memory():
+    fetch = FetchRecorder(make_history('2019-01-01', '2021-01-01'))
+    lookup = PriceLookup(fetch, window_days=90)
+    for date in ('2020-03-02', '2020-03-10', '2020-02-20', '2020-04-01'):
+        lookup.get_close('AAA', date)
+    assert len(fetch.calls) == 1
+
+
+def test_async_lookup_shares_memory_with_sync_lookup():
+    history = make_history('2019-01-01', '2021-01-01')
+    fetch = FetchRecorder(history)
+
+    async def fetch_async(symbol, start_date, end_date):
+        return fetch(symbol, start_date, end_date)
+
+    lookup = PriceLookup(lambda *args: pytest.fail('同步下载不应被调用'), window_days=90, fetch_async=fetch_async)
+    assert asyncio.run(lookup.get_close_async('AAA', '2020-01-04')) == ('2020-01-03', float(history.loc['2020-01-03', 'Close']))
+    assert lookup.get_close('AAA', '2020-01-10') == ('2020-01-10', float(history.loc['2020-01-10', 'Close']))
+    assert len(fetch.calls) == 1
+
+
+def test_no_price_within_lookback():
+    # 查询日期之前 MAX_LOOKBACK_DAYS 天内没有成交
+    history = make_history('2019-01-01', '2019-06-01')
+    lookup = PriceLookup(FetchRecorder(history), window_days=365)
+    assert lookup.get_close('AAA', '2020-01-02') == (None, None)
+    assert lookup.get_close('AAA', '2018-06-01') == (None, None)
+
+
+def test_future_date_returns_nothing():
+    fetch = FetchRecorder(make_history('2019-01-01', '2020-01-01'))
+    lookup = PriceLookup(fetch)
+    future = (pd.Timestamp.now() + pd.Timedelta(days=30)).strftime('%Y-%m-%d')
+    assert lookup.get_close('AAA', future) == (None, None)
+    assert fetch.calls == []
+
+
+def test_empty_response_is_cached_for_negative_ttl():
+    fetch = FetchRecorder(make_history('2019-01-01', '2021-01-01').iloc[:0])
+    lookup = PriceLookup(fetch, window_days=90)
+    for date in ('2020-03-02', '2020-03-10', '2020-04-01'):
+        assert lookup.get_close('INVALID', date) == (None, None)
+    assert len(fetch.calls) == 1
+
+
+def test_empty_response_expires_and_keeps_existing_history():
+    history = make_history('2019-01-01', '2021-01-01')
+    fetch = FetchRecorder(history)
+    lookup = PriceLookup(fetch, window_days=30, negative_ttl=0)
+    lookup.get_close('AAA', '2020-06-01')
+
+    # 上游暂时不可用，远处的日期查不到，已有的历史数据仍然可以使用
+    fetch.history = history.iloc[:0]
+    assert lookup.get_close('AAA', '2019-03-01') == (None, None)
+    assert lookup.get_close('AAA', '2020-06-01')[0] == '2020-06-01'
+
+    # 空结果过期后重新下载
+    fetch.history = history
+    assert lookup.get_close('AAA', '2019-03-01') == ('2019-03-01', float(history.loc['2019-03-01', 'Close']))
+    assert len(fetch.calls) == 3
+
+
+def test_fetch_error_records_nothing():
+    history = make_history('2019-01-01', '2021-01-01')
+    fetch = FetchRecorder(history)
+    lookup = PriceLookup(fetch, window_days=90)
+
+    def failing(symbol, start_date, end_date):
+        fetch.calls.append((symbol, start_date, end_date))
+        raise ConnectionError('upstream unavailable')
+
+    lookup.fetch = failing
+    with pytest.raises(ConnectionError):
+        lookup.get_close('AAA', '2020-03-02')
+    lookup.fetch = fetch
+    assert lookup.get_close('AAA', '2020-03-02')[0] == '2020-03-02'
+    assert len(fetch.calls) == 2
+
+
+def test_evicts_least_recently_used_symbol():
+    fetch = FetchRecorder(make_history('2019-01-01', '2021-01-01'))
+    lookup = PriceLookup(fetch, window_days=90, max_symbols=2)
+    for symbol in ('AAA', 'BBB', 'AAA', 'CCC'):
+        lookup.get_close(symbol, '2020-03-02')
+    assert len(fetch.calls) == 3
+    lookup.get_close('AAA', '2020-03-02')
+    assert len(fetch.calls) == 3
+    lookup.get_close('BBB', '2020-03-02')
+    assert len(fetch.calls) == 4
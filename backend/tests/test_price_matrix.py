@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.price_matrix import write_price_matrix, write_price_matrix_from_store, PriceMatrix
+
+from conftest import make_history
+
+
+@pytest.fixture
+def histories():
+    return {
+        'AAA': make_history('2020-01-01', '2020-03-01', seed=1),
+        'BBB': make_history('2020-02-01', '2020-04-01', seed=2),
+        'EMPTY': pd.DataFrame(),
+    }
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_round_trip(tmp_path, histories, dtype):
+    write_price_matrix(str(tmp_path), histories, dtype=dtype)
+    matrix = PriceMatrix(str(tmp_path))
+    assert matrix.symbols == ['AAA', 'BBB', 'EMPTY']
+    assert 'AAA' in matrix and 'CCC' not in matrix
+    assert matrix.values.dtype == np.dtype(dtype)
+    assert matrix.values.flags['F_CONTIGUOUS']
+
+    dates = histories['AAA'].index.union(histories['BBB'].index)
+    assert matrix.shape == (len(dates), 3)
+    for symbol in ('AAA', 'BBB'):
+        expected = histories[symbol]['Close'].astype(dtype).astype(float)
+        history = matrix.history(symbol)
+        np.testing.assert_array_equal(history.index, expected.index)
+        np.testing.assert_allclose(history['Close'].to_numpy(), expected.to_numpy())
+    assert np.isnan(matrix.column('EMPTY')).all()
+
+
+def test_ranges_are_end_exclusive(tmp_path, histories):
+    matrix = write_price_matrix(str(tmp_path), histories)
+    lo, hi = matrix.date_range('2020-02-03', '2020-02-07')
+    assert [str(day) for day in matrix.dates[lo:hi]] == ['2020-02-03', '2020-02-04', '2020-02-05', '2020-02-06']
+
+    dates, values = matrix.rows('2020-02-03', '2020-02-07')
+    assert values.shape == (4, 3)
+    np.testing.assert_array_equal(values[:, 0], matrix.column('AAA', '2020-02-03', '2020-02-07'))
+    assert matrix.date_range('2020-05-01', '2020-04-01')[0] == matrix.date_range('2020-05-01', '2020-04-01')[1]
+
+
+def test_column_is_read_only_view(tmp_path, histories):
+    matrix = write_price_matrix(str(tmp_path), histories)
+    column = matrix.column('BBB')
+    assert not column.flags['WRITEABLE']
+    assert np.shares_memory(column, matrix.values)
+
+
+def test_explicit_dates(tmp_path, histories):
+    dates = pd.date_range('2020-01-01', '2020-01-10')
+    matrix = write_price_matrix(str(tmp_path), histories, dates=dates)
+    assert len(matrix.dates) == 10
+    # 周末没有交易，保存为 NaN
+    assert np.isnan(matrix.column('AAA', '2020-01-04', '2020-01-06')).all()
+
+
+def test_build_from_store(tmp_path, file_store, histories):
+    for symbol in ('AAA', 'BBB'):
+        file_store.write(symbol, histories[symbol], {'stable': [], 'volatile': []})
+    matrix = write_price_matrix_from_store(str(tmp_path / 'matrix'), ['aaa', 'BBB', 'MISSING'],
+                                           '2020-01-15', '2020-03-15')
+    assert matrix.symbols == ['AAA', 'BBB', 'MISSING']
+    assert str(matrix.dates[0]) == '2020-01-15' and str(matrix.dates[-1]) == '2020-03-13'
+    expected = histories['BBB']['Close']
+    expected = expected[expected.index < '2020-03-15']
+    np.testing.assert_allclose(matrix.history('BBB')['Close'].to_numpy(), expected.to_numpy())
+    assert np.isnan(matrix.column('MISSING')).all()
+
+
+def test_rewrite_swaps_whole_version(tmp_path, histories):
+    old = write_price_matrix(str(tmp_path), {'AAA': histories['AAA']})
+    new = write_price_matrix(str(tmp_path), {'BBB': histories['BBB'], 'AAA': histories['AAA']})
+    assert new.version != old.version
+    # 旧版本目录被清理，只留下 CURRENT 和新版本
+    assert sorted(os.listdir(tmp_path)) == sorted(['.lock', 'CURRENT', new.version])
+    # 已经打开的矩阵继续使用自己的版本，股票索引与价格一致
+    assert old.symbols == ['AAA'] and old.shape[1] == 1
+    np.testing.assert_allclose(old.history('AAA')['Close'].to_numpy(), histories['AAA']['Close'].to_numpy())
+    reopened = PriceMatrix(str(tmp_path))
+    assert reopened.symbols == ['BBB', 'AAA'] and reopened.shape[1] == 2
+
+
+def test_concurrent_writers_leave_only_current_version(tmp_path, histories):
+    write_price_matrix(str(tmp_path), histories)
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: write_price_matrix(str(tmp_path), histories), range(8)))
+    current = PriceMatrix(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted(['.lock', 'CURRENT', current.version])
+    assert current.symbols == ['AAA', 'BBB', 'EMPTY']
@@ -0,0 +1,109 @@
+import multiprocessing
+
+import pandas as pd
+import pytest
+
+from utils import price_store
+from utils.price_store import FileStore, SQLiteStore, symbol_file_locks
+
+from conftest import make_history
+
+
+@pytest.fixture(params=['file', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'file':
+        return FileStore(str(tmp_path))
+    return SQLiteStore(str(tmp_path / 'prices.sqlite'))
+
+
+def test_empty_store(store):
+    assert store.load_meta('AAA') == {'stable': [], 'volatile': []}
+    assert store.read('AAA').empty
+
+
+def test_write_merges_and_reads_range(store):
+    first = make_history('2020-01-01', '2020-02-01', seed=1)
+    second = make_history('2020-01-15', '2020-03-01', seed=2)
+    meta = {'stable': [['2020-01-01', '2020-03-01']], 'volatile': [], 'version': 'abc'}
+    store.write('aaa', first, {'stable': [['2020-01-01', '2020-02-01']], 'volatile': []})
+    store.write('AAA', second, meta)
+
+    assert store.load_meta('AAA') == meta
+    expected = pd.concat([first[first.index < '2020-01-15'], second])
+    pd.testing.assert_frame_equal(store.read('AAA'), expected, check_freq=False)
+    window = store.read('AAA', pd.Timestamp('2020-01-10'), pd.Timestamp('2020-01-20'))
+    pd.testing.assert_frame_equal(window, expected['2020-01-10':'2020-01-17'], check_freq=False)
+
+
+def test_write_meta_only(store):
+    store.write('AAA', pd.DataFrame(), {'stable': [['2020-01-01', '2020-01-02']], 'volatile': []})
+    assert store.load_meta('AAA')['stable'] == [['2020-01-01', '2020-01-02']]
+    assert store.read('AAA').empty
+
+
+def test_load_versions(store):
+    assert store.load_versions(['AAA', 'BBB']) == {'AAA': 0, 'BBB': 0}
+    store.write('AAA', make_history('2020-01-01', '2020-01-10'), {'stable': [], 'volatile': [], 'version': 'v1'})
+    store.write('BBB', pd.DataFrame(), {'stable': [], 'volatile': []})
+    assert store.load_versions(['aaa', 'BBB', 'CCC']) == {'aaa': 'v1', 'BBB': 0, 'CCC': 0}
+
+
+def test_file_store_keeps_versions_in_memory_until_meta_is_replaced(tmp_path, monkeypatch):
+    store = FileStore(str(tmp_path))
+    store.write('AAA', make_history('2020-01-01', '2020-01-10'), {'stable': [], 'volatile': [], 'version': 'v1'})
+    other = FileStore(str(tmp_path))
+    assert other.load_versions(['AAA']) == {'AAA': 'v1'}
+
+    def fail(symbol):
+        raise AssertionError('元数据没有变化时不应重新读取')
+
+    monkeypatch.setattr(store, 'load_meta', fail)
+    monkeypatch.setattr(other, 'load_meta', fail)
+    assert store.load_versions(['AAA']) == {'AAA': 'v1'}
+    assert other.load_versions(['AAA']) == {'AAA': 'v1'}
+
+    # 另一个进程（独立的存储实例）写入了新数据
+    monkeypatch.undo()
+    store.write('AAA', pd.DataFrame(), {'stable': [], 'volatile': [], 'version': 'v2'})
+    assert other.load_versions(['AAA']) == {'AAA': 'v2'}
+
+
+def test_sqlite_drops_missing_fields(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'prices.sqlite'))
+    store.write('AAA', make_history('2020-01-01', '2020-01-10')[['Close']], {'stable': [], 'volatile': []})
+    assert list(store.read('AAA').columns) == ['Close']
+
+
+def _increment(path, count):
+    """在子进程中持有文件锁做读-改-写"""
+    for _ in range(count):
+        with symbol_file_locks(['AAA']):
+            with open(path) as f:
+                value = int(f.read())
+            with open(path, 'w') as f:
+                f.write(str(value + 1))
+
+
+@pytest.mark.skipif(price_store.fcntl is None, reason='需要 fcntl 文件锁')
+def test_symbol_file_locks_are_exclusive_across_processes(tmp_path):
+    counter = tmp_path / 'counter'
+    counter.write_text('0')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_increment, args=(str(counter), 50))
+                 for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    assert counter.read_text() == '200'
+
+
+def test_get_store_rejects_unknown_backend(monkeypatch):
+    previous = price_store._store
+    try:
+        price_store.set_store(None)
+        monkeypatch.setattr(price_store, 'PRICE_STORE', 'redis')
+        with pytest.raises(ValueError):
+            price_store.get_store()
+    finally:
+        price_store.set_store(previous)
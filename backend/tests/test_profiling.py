@@ -0,0 +1,77 @@
+import os
+import time
+import asyncio
+
+import pytest
+
+from utils.concurrency import run_in_compute_pool
+from utils.profiling import ProfilingMiddleware, SamplingProfiler, is_profiling
+
+
+def busy_stage(seconds=0.05):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+    return is_profiling()
+
+
+def run_request(directory, headers=(), query_string=b'', token=''):
+    """通过中间件执行一个在计算线程池中工作的 ASGI 应用，返回响应头和线程中是否处于剖析状态"""
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen['profiling'] = await run_in_compute_pool(busy_stage)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/test', 'query_string': query_string, 'headers': list(headers)}
+    middleware = ProfilingMiddleware(app, str(directory), interval=0.001, token=token)
+    asyncio.run(middleware(scope, None, send))
+    response_headers = {key.decode().lower(): value.decode() for key, value in messages[0]['headers']}
+    return response_headers, seen['profiling']
+
+
+def test_not_requested(tmp_path):
+    headers, profiling = run_request(tmp_path)
+    assert 'x-profile' not in headers
+    assert not profiling
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('headers, query_string', [
+    ([(b'x-profile', b'1')], b''),
+    ([], b'profile=true'),
+])
+def test_profiled_request_samples_pool_thread(tmp_path, headers, query_string):
+    response_headers, profiling = run_request(tmp_path, headers, query_string)
+    assert profiling
+    filename = response_headers['x-profile']
+    assert filename == 'request.folded'
+    with open(tmp_path / filename, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines
+    assert any('busy_stage (tests/test_profiling.py' in line for line in lines)
+    for line in lines:
+        stack, _, count = line.rpartition(' ')
+        assert stack and int(count) > 0
+
+
+def test_token_required(tmp_path):
+    headers, profiling = run_request(tmp_path, [(b'x-profile', b'1')], token='secret')
+    assert 'x-profile' not in headers and not profiling
+    headers, profiling = run_request(tmp_path, [(b'x-profile', b'secret')], token='secret')
+    assert headers['x-profile'] == 'request.folded' and profiling
+
+
+def test_unregistered_threads_are_not_sampled():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.sample()
+    assert profiler.samples == 0
+    profiler.wrap(profiler.sample)()
+    assert profiler.samples == 1
+    assert profiler._threads == {}
@@ -0,0 +1,91 @@
+import time
+import asyncio
+
+import pandas as pd
+import pytest
+
+from utils import providers
+from utils.config import FETCH_WORKERS
+from utils.providers import (PriceProvider, LocalFileProvider, combine_histories, split_histories,
+                             normalize_history, create_provider)
+
+from conftest import make_history
+
+
+class SlowProvider(PriceProvider):
+    """不支持批量请求、每只股票等待一小段时间的数据源，使用基类的 fetch_many"""
+
+    name = 'slow'
+
+    def fetch(self, symbol, start_date, end_date):
+        time.sleep(0.01)
+        return make_history(start_date, end_date, seed=len(symbol))
+
+
+def test_combine_and_split_round_trip():
+    histories = {'AAA': make_history('2020-01-01', '2020-02-01', seed=1),
+                 'BBB': make_history('2020-01-15', '2020-03-01', seed=2)}
+    split = split_histories(combine_histories(histories), ['AAA', 'BBB', 'CCC'])
+    for symbol, data in histories.items():
+        pd.testing.assert_frame_equal(split[symbol], data, check_freq=False)
+    assert split['CCC'].empty
+
+
+def test_combine_histories_of_nothing_is_empty():
+    assert combine_histories({'AAA': pd.DataFrame()}).empty
+    assert split_histories(pd.DataFrame(), ['AAA'])['AAA'].empty
+
+
+def test_normalize_history_flattens_columns_and_drops_timezone():
+    data = make_history('2020-01-01', '2020-01-10')
+    data.index = data.index.tz_localize('America/New_York')
+    data.columns = pd.MultiIndex.from_product([data.columns, ['AAA']])
+    normalized = normalize_history(data)
+    assert list(normalized.columns) == ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+    assert normalized.index.tz is None
+    assert normalized.index.name == 'Date'
+
+
+def test_fetch_many_uses_fetch_for_each_symbol():
+    provider = SlowProvider()
+    combined = provider.fetch_many(['A', 'BB'], '2020-01-01', '2020-01-10')
+    assert set(combined.columns.get_level_values(0)) == {'A', 'BB'}
+
+
+def test_fetch_many_async_does_not_deadlock_when_many_calls_are_in_flight():
+    # 外层调用比线程数多时，外层任务和逐只下载的内层任务如果共用线程池会相互等待
+    provider = SlowProvider()
+
+    async def run():
+        calls = [provider.fetch_many_async(['A', 'BB', 'CCC'], '2020-01-01', '2020-01-10')
+                 for _ in range(FETCH_WORKERS * 2)]
+        return await asyncio.wait_for(asyncio.gather(*calls), timeout=30)
+
+    results = asyncio.run(run())
+    assert all(set(result.columns.get_level_values(0)) == {'A', 'BB', 'CCC'} for result in results)
+
+
+def test_local_file_provider_reads_csv_end_exclusive(tmp_path):
+    history = make_history('2020-01-01', '2020-02-01')
+    history.to_csv(tmp_path / 'AAA.csv')
+    provider = LocalFileProvider(str(tmp_path))
+    data = provider.fetch('AAA', '2020-01-06', '2020-01-10')
+    assert list(data.index.strftime('%Y-%m-%d')) == ['2020-01-06', '2020-01-07', '2020-01-08', '2020-01-09']
+    assert provider.fetch('MISSING', '2020-01-01', '2020-02-01').empty
+    assert provider.nbytes() > 0
+
+
+def test_create_provider_rejects_unknown_name():
+    assert isinstance(create_provider('local'), LocalFileProvider)
+    with pytest.raises(ValueError):
+        create_provider('nope')
+
+
+def test_set_provider_replaces_current_provider():
+    previous = providers._provider
+    try:
+        provider = SlowProvider()
+        providers.set_provider(provider)
+        assert providers.get_provider() is provider
+    finally:
+        providers.set_provider(previous)
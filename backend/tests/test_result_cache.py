@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import price_store, result_cache
+from utils.price_cache import get_history_many, get_price_versions
+from utils.result_cache import ResultCache, portfolio_key, result_etag, etag_matches, is_volatile_range
+from utils.providers import PriceProvider, combine_histories
+
+from conftest import make_history
+
+
+class HistoryProvider(PriceProvider):
+    def __init__(self, history):
+        self.history = history
+
+    def fetch_many(self, symbols, start_date, end_date):
+        data = self.history[start_date:end_date]
+        return combine_histories({symbol: data[data.index < end_date] for symbol in symbols})
+
+
+def tx(symbol, quantity, buy_date, buy_price=10.0):
+    return SimpleNamespace(symbol=symbol, quantity=quantity, buy_date=buy_date, buy_price=buy_price)
+
+
+def test_portfolio_key_normalizes_dates_and_ignores_names():
+    a = portfolio_key([tx('AAA', 1, '2020-01-02')], '2020-01-01', '2020-06-30')
+    b = portfolio_key([tx('AAA', 1.0, '2020-01-02T00:00:00')], '2020-01-01T00:00:00', '2020-06-30')
+    assert a == b
+    assert a != portfolio_key([tx('AAA', 2, '2020-01-02')], '2020-01-01', '2020-06-30')
+    assert a != portfolio_key([tx('AAA', 1, '2020-01-02')], '2020-01-01', '2020-06-30', {'groups': ['risk']})
+
+
+def test_is_volatile_range():
+    assert is_volatile_range('2999-01-01')
+    assert not is_volatile_range('2000-01-01')
+
+
+def test_result_cache_evicts_least_recently_used(file_store):
+    cache = ResultCache(max_entries=2)
+    cache.put('a', b'1', [])
+    cache.put('b', b'2', [])
+    assert cache.get('a') == b'1'
+    cache.put('c', b'3', [])
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1' and cache.get('c') == b'3'
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.nbytes() == 2
+
+
+def test_result_cache_expires_after_ttl(file_store):
+    cache = ResultCache()
+    cache.put('a', b'1', [], ttl=-1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_passed_versions_are_used_without_reading_the_store(file_store, monkeypatch):
+    def fail(symbols):
+        raise AssertionError('传入版本号时不应读取价格存储')
+
+    monkeypatch.setattr(result_cache, 'get_price_versions', fail)
+    cache = ResultCache()
+    cache.put('a', b'1', ['AAA', 'BBB'], versions={'AAA': 'v1', 'BBB': 0})
+    assert cache.get('a', {'AAA': 'v1', 'BBB': 0}) == b'1'
+    assert result_etag('k', ['BBB', 'AAA'], {'AAA': 'v1', 'BBB': 0}) == result_etag('k', ['AAA', 'BBB'], {'AAA': 'v1'})
+    assert cache.get('a', {'AAA': 'v2', 'BBB': 0}) is None
+
+
+def test_new_prices_written_by_another_process_invalidate_results(tmp_path):
+    previous = price_store._store
+    try:
+        price_store.set_store(price_store.FileStore(str(tmp_path)))
+        get_history_many(['AAA'], '2020-01-01', '2020-02-01', HistoryProvider(make_history('2019-01-01', '2021-01-01')))
+        cache = ResultCache()
+        cache.put('a', b'1', ['AAA'])
+        key = portfolio_key([tx('AAA', 1, '2020-01-02')], '2020-01-01', '2020-01-31')
+        etag = result_etag(key, ['AAA'])
+
+        # 另一个 worker 进程（独立的存储实例）读到相同的版本号，给出相同的 ETag
+        price_store.set_store(price_store.FileStore(str(tmp_path)))
+        assert result_etag(key, ['AAA']) == etag
+        assert cache.get('a') == b'1'
+
+        # 另一个进程下载了新的价格数据
+        get_history_many(['AAA'], '2020-01-01', '2020-03-01', HistoryProvider(make_history('2019-01-01', '2021-01-01')))
+        assert result_etag(key, ['AAA']) != etag
+        assert cache.get('a') is None
+    finally:
+        price_store.set_store(previous)
+
+
+def test_price_version_of_uncached_symbol_is_zero(file_store):
+    assert get_price_versions(['NEVER']) == {'NEVER': 0}
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"abc-gzip"', True),
+    ('"abc-br"', True),
+    ('W/"abc-gzip"', True),
+    ('"other", "abc-br"', True),
+    ('*', False),
+    ('*, "abc"', True),
+    ('"abcd"', False),
+    ('"abc-deflate"', False),
+    ('', False),
+    (None, False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
+
+
+def test_etag_matches_without_etag():
+    assert not etag_matches('*', None)
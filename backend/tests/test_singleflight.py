@@ -0,0 +1,176 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.singleflight import KeyedLocks, RangeFlights
+
+
+class BlockingFetch:
+    """记录调用的 fetch，在 release 之前阻塞"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.fail = fail
+
+    def __call__(self, keys):
+        self.calls.append(tuple(keys))
+        self.started.set()
+        self.release.wait(10)
+        if self.fail:
+            raise ConnectionError('upstream unavailable')
+        return {key: f'{key}-data' for key in keys}
+
+
+def test_covered_request_shares_in_flight_fetch():
+    flights = RangeFlights()
+    fetch = BlockingFetch()
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flights.run, ['A', 'B'], 0, 100, fetch)
+        fetch.started.wait(5)
+        second = pool.submit(flights.run, ['A', 'C'], 10, 50, fetch)
+        time.sleep(0.1)
+        fetch.release.set()
+        assert first.result() == {'A': 'A-data', 'B': 'B-data'}
+        assert second.result() == {'A': 'A-data', 'C': 'C-data'}
+    # A 共享第一次下载，只有 C 单独下载
+    assert fetch.calls == [('A', 'B'), ('C',)]
+    assert flights.shared == 1
+    assert flights._flights == {}
+
+
+def test_uncovered_range_starts_its_own_fetch():
+    flights = RangeFlights()
+    fetch = BlockingFetch()
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flights.run, ['A'], 10, 50, fetch)
+        fetch.started.wait(5)
+        second = pool.submit(flights.run, ['A'], 0, 50, fetch)
+        time.sleep(0.1)
+        fetch.release.set()
+        first.result()
+        second.result()
+    assert fetch.calls == [('A',), ('A',)]
+    assert flights.shared == 0
+
+
+def test_error_is_delivered_to_waiting_requests():
+    flights = RangeFlights()
+    fetch = BlockingFetch(fail=True)
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flights.run, ['A'], 0, 100, fetch)
+        fetch.started.wait(5)
+        second = pool.submit(flights.run, ['A'], 0, 100, fetch)
+        time.sleep(0.1)
+        fetch.release.set()
+        for future in (first, second):
+            with pytest.raises(ConnectionError):
+                future.result()
+    assert len(fetch.calls) == 1
+    assert flights._flights == {}
+
+
+def test_run_async_waits_without_threads():
+    flights = RangeFlights()
+    calls = []
+
+    async def fetch(keys):
+        calls.append(tuple(keys))
+        await asyncio.sleep(0.05)
+        return {key: key.lower() for key in keys}
+
+    async def run():
+        return await asyncio.gather(*(flights.run_async(['A', 'B'], 0, 10, fetch) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert results == [{'A': 'a', 'B': 'b'}] * 5
+    assert calls == [('A', 'B')]
+    assert flights.shared == 8
+
+
+def test_cancelled_owner_still_delivers_to_waiters():
+    flights = RangeFlights()
+    calls = []
+
+    async def fetch(keys):
+        calls.append(tuple(keys))
+        await asyncio.sleep(0.05)
+        return {key: key.lower() for key in keys}
+
+    async def run():
+        owner = asyncio.create_task(flights.run_async(['A'], 0, 10, fetch))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(flights.run_async(['A'], 0, 10, fetch))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    assert asyncio.run(run()) == {'A': 'a'}
+    assert calls == [('A',)]
+    assert flights._flights == {}
+
+
+def test_cancelled_waiter_does_not_cancel_shared_fetch():
+    flights = RangeFlights()
+
+    async def fetch(keys):
+        await asyncio.sleep(0.05)
+        return {key: key.lower() for key in keys}
+
+    async def run():
+        owner = asyncio.create_task(flights.run_async(['A'], 0, 10, fetch))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(flights.run_async(['A'], 0, 10, fetch)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        waiters[0].cancel()
+        return await owner, await waiters[1]
+
+    assert asyncio.run(run()) == ({'A': 'a'}, {'A': 'a'})
+
+
+def test_interrupted_owner_lets_waiter_fetch_itself():
+    flights = RangeFlights()
+    fetch = BlockingFetch()
+
+    def interrupted(keys):
+        fetch(keys)
+        raise KeyboardInterrupt
+
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flights.run, ['A'], 0, 100, interrupted)
+        fetch.started.wait(5)
+        second = pool.submit(flights.run, ['A'], 0, 100, fetch)
+        time.sleep(0.1)
+        fetch.release.set()
+        with pytest.raises(KeyboardInterrupt):
+            first.result()
+        assert second.result() == {'A': 'A-data'}
+    assert fetch.calls == [('A',), ('A',)]
+    assert flights._flights == {}
+
+
+def test_keyed_locks_serialize_same_key_and_release_entries():
+    locks = KeyedLocks()
+    active = []
+    overlaps = []
+
+    def worker(keys):
+        with locks.hold(keys):
+            overlaps.append(bool(set(keys) & set(active)))
+            active.extend(keys)
+            time.sleep(0.01)
+            for key in keys:
+                active.remove(key)
+
+    # 不同顺序请求相同的键不会死锁
+    key_sets = [['A', 'B'], ['B', 'A'], ['C'], ['A', 'C', 'A']] * 5
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(worker, key_sets))
+    assert not any(overlaps)
+    assert locks._locks == {}
@@ -0,0 +1,101 @@
+import os
+import random
+import string
+
+import pandas as pd
+import pytest
+
+from utils.symbol_index import SymbolIndex
+
+
+def reference_search(stocks_df, query, limit=10):
+    """逐条比较的参考实现：按匹配档次排序，同一档内代码较短的在前"""
+    query = query.strip().lower()
+    if not query:
+        return []
+    records = stocks_df.to_dict(orient='records')
+    order = sorted(range(len(records)), key=lambda i: (len(records[i]['symbol']), records[i]['symbol'].lower(), i))
+    ranked = []
+    for rank, i in enumerate(order):
+        symbol, name = records[i]['symbol'].lower(), records[i]['name'].lower()
+        tiers = [symbol == query, symbol.startswith(query), name.startswith(query), query in symbol, query in name]
+        if any(tiers):
+            ranked.append((tiers.index(True), rank, records[i]))
+    return [record for _, _, record in sorted(ranked, key=lambda item: item[:2])[:limit]]
+
+
+@pytest.fixture
+def stocks(tmp_path):
+    rng = random.Random(0)
+    rows = [{'symbol': 'AAPL', 'name': '苹果公司', 'sector': '技术'},
+            {'symbol': 'AA', 'name': 'Alcoa', 'sector': '材料'},
+            {'symbol': 'PAA', 'name': 'Plains All American', 'sector': '能源'}]
+    for _ in range(3000):
+        symbol = ''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(1, 5)))
+        if rng.random() < 0.2:
+            symbol += rng.choice(['.SS', '.SZ', '.HK'])
+        name = ' '.join(''.join(rng.choice('abcdefgh') for _ in range(rng.randint(2, 6))) for _ in range(2))
+        rows.append({'symbol': symbol, 'name': name.title(), 'sector': ''})
+    stocks_df = pd.DataFrame(rows)
+    path = tmp_path / 'stocks.csv'
+    stocks_df.to_csv(path, index=False)
+    return str(path), pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+def test_ranking_tiers(stocks):
+    path, _ = stocks
+    results = SymbolIndex(path).search('aa', limit=3)
+    assert [item['symbol'] for item in results][:1] == ['AA']
+
+
+def test_matches_reference_search(stocks):
+    path, stocks_df = stocks
+    index = SymbolIndex(path)
+    rng = random.Random(1)
+    queries = ['a', 'AA', 'aapl', '苹果', 'ab', 'bc d', '.ss', 'x', 'zzzzzz', ' Ab ']
+    for _ in range(100):
+        record = stocks_df.iloc[rng.randrange(len(stocks_df))]
+        text = record['symbol'] if rng.random() < 0.5 else record['name']
+        start = rng.randrange(len(text))
+        queries.append(text[start:start + rng.randint(1, 4)])
+    for query in queries:
+        expected = reference_search(stocks_df, query, 50)
+        for limit in (1, 10, 50):
+            assert index.search(query, limit) == expected[:limit], query
+
+
+def test_empty_query_returns_nothing(stocks):
+    path, _ = stocks
+    assert SymbolIndex(path).search('   ') == []
+    assert SymbolIndex(path).search('aa', limit=0) == []
+
+
+def test_reloads_when_file_changes(tmp_path):
+    path = tmp_path / 'stocks.csv'
+    path.write_text('symbol,name,sector\nAAPL,苹果公司,技术\n', encoding='utf-8')
+    index = SymbolIndex(str(path))
+    assert [item['symbol'] for item in index.search('aapl')] == ['AAPL']
+
+    path.write_text('symbol,name,sector\nMSFT,微软公司,技术\nAAPL2,测试,技术\n', encoding='utf-8')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert [item['symbol'] for item in index.search('aapl')] == ['AAPL2']
+    assert len(index) == 2
+
+
+def test_reload_during_search_uses_one_snapshot(tmp_path):
+    rows = [{'symbol': f'A{i:03d}', 'name': f'Alpha {i}'} for i in range(50)]
+    path = tmp_path / 'stocks.csv'
+    pd.DataFrame(rows).to_csv(path, index=False)
+    index = SymbolIndex(str(path))
+    index.refresh()
+
+    def prefix_ids_with_reload(keys, ids, prefix, limit):
+        # 搜索进行到一半时股票列表被重新加载成更短的列表
+        index._build(pd.DataFrame({'symbol': ['ZZZ'], 'name': ['Zeta']}))
+        return SymbolIndex._prefix_ids(keys, ids, prefix, limit)
+
+    index._prefix_ids = prefix_ids_with_reload
+    assert [item['symbol'] for item in index.search('a0', limit=3)] == ['A000', 'A001', 'A002']
+    del index._prefix_ids
+    assert [item['symbol'] for item in index.search('z')] == ['ZZZ']
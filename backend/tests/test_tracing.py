@@ -0,0 +1,94 @@
+import json
+import asyncio
+import logging
+
+from utils.tracing import TracingMiddleware, RequestTrace, span, current_trace, current_request_id
+from utils.logs import JsonFormatter, TextFormatter, RequestContextFilter
+
+
+def run_request(request_id=None, server_timing=True, stages=('fetch', 'align', 'fetch')):
+    """通过中间件执行一个记录若干阶段的 ASGI 应用，返回响应头和请求中看到的请求ID"""
+    seen = {}
+
+    async def app(scope, receive, send):
+        seen['request_id'] = current_request_id()
+        for name in stages:
+            with span(name):
+                pass
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    headers = [(b'x-request-id', request_id.encode())] if request_id is not None else []
+    scope = {'type': 'http', 'method': 'GET', 'path': '/test', 'headers': headers}
+    asyncio.run(TracingMiddleware(app, server_timing)(scope, None, send))
+    response_headers = {}
+    for key, value in messages[0]['headers']:
+        response_headers.setdefault(key.decode().lower(), []).append(value.decode())
+    return response_headers, seen['request_id']
+
+
+def test_request_id_from_header():
+    headers, seen = run_request('abc-123')
+    assert headers['x-request-id'] == ['abc-123']
+    assert seen == 'abc-123'
+
+
+def test_invalid_request_id_is_replaced():
+    headers, seen = run_request('bad id\nwith newline')
+    assert seen != 'bad id\nwith newline'
+    assert len(seen) == 16
+    assert headers['x-request-id'] == [seen]
+
+
+def test_server_timing_sums_repeated_stages():
+    headers, _ = run_request()
+    metrics = [item.split(';')[0] for item in headers['server-timing'][0].split(', ')]
+    assert metrics == ['fetch', 'align', 'total']
+
+
+def test_server_timing_disabled():
+    headers, _ = run_request(server_timing=False)
+    assert 'server-timing' not in headers
+
+
+def test_span_outside_request_does_nothing():
+    assert current_trace() is None
+    with span('fetch'):
+        pass
+    assert current_request_id() is None
+
+
+def test_trace_totals():
+    trace = RequestTrace('id')
+    trace.add('fetch', 1.0)
+    trace.add('value', 2.0)
+    trace.add('fetch', 0.5)
+    assert trace.totals() == {'fetch': 1.5, 'value': 2.0}
+    assert trace.server_timing().startswith('fetch;dur=1.5, value;dur=2.0, total;dur=')
+
+
+def make_record(**extra):
+    record = logging.makeLogRecord({'name': 'utils.test', 'levelno': logging.INFO, 'levelname': 'INFO',
+                                    'msg': '%s done', 'args': ('fetch',)})
+    for key, value in extra.items():
+        setattr(record, key, value)
+    RequestContextFilter().filter(record)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    entry = json.loads(JsonFormatter().format(make_record(duration_ms=1.5, spans={'fetch': 1.0})))
+    assert entry['message'] == 'fetch done'
+    assert entry['request_id'] == '-'
+    assert entry['duration_ms'] == 1.5
+    assert entry['spans'] == {'fetch': 1.0}
+
+
+def test_text_formatter_appends_fields():
+    text = TextFormatter().format(make_record(status=200))
+    assert text.endswith('INFO utils.test [-] fetch done status=200')
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import indicators
+from utils.indicators import calculate_portfolio_value
+from utils.price_matrix import write_price_matrix
+from utils.valuation import align_prices, align_matrix_prices, build_holdings, value_holdings
+
+from conftest import make_history
+
+START, END = '2020-01-01', '2020-06-30'
+
+
+def tx(symbol, quantity, buy_date):
+    return SimpleNamespace(symbol=symbol, quantity=quantity, buy_date=buy_date)
+
+
+@pytest.fixture
+def histories():
+    data = {
+        'AAA': make_history('2019-06-01', '2020-08-01', seed=1),
+        # 区间开始之后才有交易
+        'BBB': make_history('2020-02-10', '2020-08-01', seed=2),
+        # 有停牌的日期
+        '600519.SS': make_history('2019-06-01', '2020-08-01', seed=3).drop(pd.bdate_range('2020-03-02', '2020-03-13')),
+    }
+    return data
+
+
+@pytest.fixture
+def fetch_window(monkeypatch, histories):
+    """让 calculate_portfolio_value 与真实下载一样得到 [start_date, end_date) 内的数据"""
+    def get_price_histories(symbols, start_date, end_date):
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        return {symbol: histories[symbol][(histories[symbol].index >= start) & (histories[symbol].index < end)]
+                for symbol in symbols}
+    monkeypatch.setattr(indicators, 'get_price_histories', get_price_histories)
+
+
+def reference_portfolio_value(transactions, stock_data, calendar):
+    """重构前按天逐笔交易计算价值的实现"""
+    value = pd.DataFrame(0.0, index=calendar, columns=['TotalValue'] + list(dict.fromkeys(t.symbol for t in transactions)))
+    for t in transactions:
+        data = stock_data.get(t.symbol)
+        if data is None or data.empty:
+            continue
+        buy_date = pd.Timestamp(t.buy_date).date()
+        for date in calendar:
+            if date.date() < buy_date:
+                continue
+            available = data.index[data.index <= date]
+            if available.empty:
+                continue
+            amount = t.quantity * data.loc[available[-1], 'Close']
+            value.at[date, t.symbol] += amount
+            value.at[date, 'TotalValue'] += amount
+    return value
+
+
+def test_vectorized_valuation_matches_reference(histories):
+    transactions = [tx('AAA', 10, '2020-01-15'), tx('BBB', 5, '2020-01-20'), tx('AAA', 3, '2020-03-07'),
+                    tx('600519.SS', 2, '2020-02-01')]
+    symbols = ['AAA', 'BBB', '600519.SS']
+    calendar = pd.date_range(START, END)
+    window = {symbol: data[START:END] for symbol, data in histories.items()}
+
+    prices = align_prices(window, calendar, symbols)
+    symbol_values, total = value_holdings(prices, build_holdings(transactions, calendar, symbols))
+
+    expected = reference_portfolio_value(transactions, window, calendar)
+    np.testing.assert_allclose(symbol_values, expected[symbols].to_numpy())
+    np.testing.assert_allclose(total, expected['TotalValue'].to_numpy())
+
+
+def test_build_holdings_ignores_buys_after_calendar():
+    calendar = pd.date_range('2020-01-01', '2020-01-05')
+    holdings = build_holdings([tx('AAA', 1, '2020-01-03'), tx('AAA', 2, '2020-02-01')], calendar, ['AAA'])
+    assert holdings[:, 0].tolist() == [0, 0, 1, 1, 1]
+
+
+@pytest.mark.parametrize('calendar', ['trading', 'calendar'])
+def test_price_matrix_path_matches_fetched_path(tmp_path, histories, fetch_window, calendar):
+    transactions = [tx('AAA', 10, '2020-01-02'), tx('BBB', 5, '2020-01-02'), tx('600519.SS', 7, '2020-01-02')]
+    matrix = write_price_matrix(str(tmp_path / 'matrix'), histories)
+
+    fetched = calculate_portfolio_value(transactions, START, END, calendar=calendar)
+    from_matrix = calculate_portfolio_value(transactions, START, END, price_matrix=matrix, calendar=calendar)
+    pd.testing.assert_frame_equal(from_matrix, fetched)
+
+
+def test_price_matrix_lookup_ignores_symbol_case(tmp_path, histories):
+    matrix = write_price_matrix(str(tmp_path / 'matrix'), {'aaa': histories['AAA']})
+    assert matrix.symbols == ['AAA'] and 'aaa' in matrix
+    upper = calculate_portfolio_value([tx('AAA', 10, '2020-01-02')], START, END, price_matrix=matrix)
+    lower = calculate_portfolio_value([tx('aaa', 10, '2020-01-02')], START, END, price_matrix=matrix)
+    assert (lower['TotalValue'] > 0).any()
+    np.testing.assert_array_equal(lower['TotalValue'], upper['TotalValue'])
+
+
+def test_matrix_alignment_uses_end_exclusive_window_without_lookback(tmp_path, histories):
+    matrix = write_price_matrix(str(tmp_path / 'matrix'), histories)
+    # 2020-02-10 是周一，2020-02-07 是周五
+    calendar = pd.date_range('2020-02-08', '2020-02-10')
+    prices = align_matrix_prices(matrix, calendar, ['AAA', 'BBB'], '2020-02-08', '2020-02-10')
+    # 区间开始之前的周五收盘价不使用，结束日期当天的价格不包含
+    assert np.isnan(prices).all()
+
+    window = {symbol: data['2020-02-08':'2020-02-09'] for symbol, data in histories.items()}
+    np.testing.assert_array_equal(prices, align_prices(window, calendar, ['AAA', 'BBB']))
+
+
+def test_matrix_alignment_of_unknown_symbol_is_nan(tmp_path, histories):
+    matrix = write_price_matrix(str(tmp_path / 'matrix'), histories)
+    prices = align_matrix_prices(matrix, pd.date_range(START, END), ['ZZZ'], START, END)
+    assert np.isnan(prices).all()
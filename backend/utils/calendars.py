@@ -0,0 +1,189 @@
+"""
+交易日历
+
+投资组合价值序列默认只包含所涉及交易所的交易日，不再包含周末和节假日向前填充出来的重复数据。
+
+- 美股（没有后缀的代码）：pandas_market_calendars 的 NYSE 日历
+- 沪深股票（.SS/.SZ）：pandas_market_calendars 的 XSHG 日历
+- 其他市场：工作日，去掉价格数据中没有任何成交的日期
+
+按成交日期确定休市日时，第一个成交日之前的日期都视为休市；最后一个成交日之后的日期
+（例如结束日期当天）无法判断，保留工作日。
+
+多个交易所的股票组合使用各交易所交易日的并集。交易所日历按 (交易所, 开始日期, 结束日期) 缓存，
+同一区间的重复请求不再重新计算。
+"""
+from functools import lru_cache
+
+import pandas as pd
+import pandas_market_calendars as mcal
+
+# 输出的价值序列频率
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+# 输出日历: trading 只包含交易日，calendar 包含每一个自然日
+CALENDARS = ('trading', 'calendar')
+
+# 重新采样时每个周期使用的 pandas 周期
+_PERIODS = {'weekly': 'W', 'monthly': 'M'}
+
+# 有 pandas_market_calendars 日历的交易所
+MARKET_CALENDARS = ('NYSE', 'XSHG')
+
+
+def exchange_of(symbol):
+    """
+    根据股票代码后缀判断交易所
+
+    Parameters:
+    symbol (str): 股票代码
+
+    Returns:
+    str: NYSE、XSHG（沪深）或 OTHER
+    """
+    symbol = symbol.upper()
+    if '.' not in symbol:
+        return 'NYSE'
+    suffix = symbol.rsplit('.', 1)[1]
+    if suffix in ('SS', 'SZ'):
+        return 'XSHG'
+    return 'OTHER'
+
+
+@lru_cache(maxsize=None)
+def _market_calendar(name):
+    """pandas_market_calendars 的交易所日历，每个交易所只创建一次"""
+    return mcal.get_calendar(name)
+
+
+@lru_cache(maxsize=1024)
+def _market_trading_days(name, start_date, end_date):
+    """pandas_market_calendars 给出的 [start_date, end_date] 内的交易日，按日期字符串缓存"""
+    days = pd.DatetimeIndex(_market_calendar(name).valid_days(start_date=start_date, end_date=end_date))
+    if days.tz is not None:
+        days = days.tz_convert(None)
+    return days.normalize()
+
+
+def _day_key(value):
+    """把日期统一为 YYYY-MM-DD 字符串，作为缓存的键"""
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def _observed_trading_days(days, observed):
+    """
+    按实际成交日期去掉休市日：第一个成交日之前以及成交日期之间没有成交的日期都去掉，
+    最后一个成交日之后（例如最新的日期）保留工作日
+    """
+    if observed is None or len(observed) == 0:
+        return days
+    observed = pd.DatetimeIndex(observed).normalize().unique().sort_values()
+    return days[(days > observed[-1]) | days.isin(observed)]
+
+
+def exchange_trading_days(exchange, start_date, end_date, observed=None):
+    """
+    单个交易所在 [start_date, end_date] 内的交易日
+
+    Parameters:
+    exchange (str): exchange_of 返回的交易所
+    start_date (str): 开始日期
+    end_date (str): 结束日期（含）
+    observed (DatetimeIndex): 可选，该交易所股票实际有成交的日期，没有交易所日历时用来去掉节假日
+
+    Returns:
+    DatetimeIndex: 交易日
+    """
+    if exchange in MARKET_CALENDARS:
+        # 返回浅复制，调用方修改索引名称时不影响缓存
+        return _market_trading_days(exchange, _day_key(start_date), _day_key(end_date)).copy()
+    return _observed_trading_days(pd.bdate_range(start=start_date, end=end_date), observed)
+
+
+def trading_calendar(symbols, start_date, end_date, stock_data=None):
+    """
+    投资组合的输出日历：所涉及交易所交易日的并集
+
+    Parameters:
+    symbols (list): 股票代码列表
+    start_date (str): 开始日期
+    end_date (str): 结束日期（含）
+    stock_data (dict): 可选，{股票代码: DataFrame} 历史数据，用于确定没有交易所日历的市场的休市日期
+
+    Returns:
+    DatetimeIndex: 升序的交易日，区间内没有交易日时退回到自然日
+    """
+    by_exchange = {}
+    for symbol in symbols:
+        by_exchange.setdefault(exchange_of(symbol), []).append(symbol)
+    if not by_exchange:
+        by_exchange['NYSE'] = []
+
+    calendar = pd.DatetimeIndex([])
+    for exchange, members in by_exchange.items():
+        observed = None
+        if stock_data and exchange not in MARKET_CALENDARS:
+            frames = [stock_data[symbol].index for symbol in members
+                      if stock_data.get(symbol) is not None and not stock_data[symbol].empty]
+            if frames:
+                observed = frames[0].append(frames[1:]) if len(frames) > 1 else frames[0]
+        calendar = calendar.union(exchange_trading_days(exchange, start_date, end_date, observed))
+
+    if len(calendar) == 0:
+        # 区间内全部是休市日（例如只选了一个周末），仍然返回自然日，保证结果不为空
+        return pd.date_range(start=start_date, end=end_date)
+    return calendar
+
+
+def output_calendar(symbols, start_date, end_date, calendar='trading', stock_data=None):
+    """
+    投资组合价值序列的输出日历
+
+    Parameters:
+    symbols (list): 股票代码列表
+    start_date (str): 开始日期
+    end_date (str): 结束日期（含）
+    calendar (str): trading 或 calendar
+    stock_data (dict): 可选，已经获取的历史数据
+
+    Returns:
+    DatetimeIndex: 输出日期
+    """
+    if calendar == 'calendar':
+        return pd.date_range(start=start_date, end=end_date)
+    return trading_calendar(symbols, start_date, end_date, stock_data)
+
+
+def resample_portfolio_value(portfolio_value_df, frequency):
+    """
+    把每日的投资组合价值重新采样为每周或每月，每个周期取最后一个交易日的数据
+
+    Parameters:
+    portfolio_value_df (DataFrame): calculate_portfolio_value 返回的数据，Date 为字符串列
+    frequency (str): daily、weekly 或 monthly
+
+    Returns:
+    DataFrame: 重新采样后的数据，Date 为各周期实际的最后一个交易日
+    """
+    if frequency == 'daily' or portfolio_value_df.empty:
+        return portfolio_value_df
+    periods = pd.DatetimeIndex(portfolio_value_df['Date']).to_period(_PERIODS[frequency])
+    last_of_period = periods[1:] != periods[:-1]
+    keep = list(last_of_period) + [True]
+    return portfolio_value_df[keep].reset_index(drop=True)
+
+
+def validate_output_options(frequency, calendar):
+    """
+    校验输出频率和日历
+
+    Parameters:
+    frequency (str): 输出频率，None 表示 daily
+    calendar (str): 输出日历，None 表示 trading
+
+    Raises:
+    ValueError: 取值不在可选范围内
+    """
+    if frequency is not None and frequency not in FREQUENCIES:
+        raise ValueError(f"未知的输出频率: {frequency}, 可选: {', '.join(FREQUENCIES)}")
+    if calendar is not None and calendar not in CALENDARS:
+        raise ValueError(f"未知的输出日历: {calendar}, 可选: {', '.join(CALENDARS)}")
@@ -0,0 +1,159 @@
+"""
+HTTP 响应压缩
+
+根据请求的 Accept-Encoding 选择 brotli（安装了 brotli 时）或 gzip 压缩响应。
+小于 COMPRESSION_MIN_SIZE 的响应和已经编码过的响应原样返回。
+分块发送的响应（例如流式响应）逐块压缩并立即刷新，客户端不需要等到响应结束。
+
+压缩后的响应与原始响应是不同的表示，ETag 会加上 -br/-gzip 后缀，
+比较 If-None-Match 时由 result_cache.etag_matches 去掉后缀。
+"""
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import COMPRESSION_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:
+    # brotli 是可选依赖，没有安装时只使用 gzip
+    brotli = None
+
+GZIP_LEVEL = 6
+# 动态响应使用较低的 brotli 质量，压缩率接近 gzip 的最高级别而速度更快
+BROTLI_QUALITY = 4
+
+
+class _GzipCompressor:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data, finish):
+        chunk = self._compressor.compress(data)
+        return chunk + self._compressor.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data, finish):
+        chunk = self._compressor.process(data)
+        return chunk + (self._compressor.finish() if finish else self._compressor.flush())
+
+
+COMPRESSORS = {'gzip': _GzipCompressor}
+if brotli is not None:
+    COMPRESSORS['br'] = _BrotliCompressor
+
+
+def choose_encoding(accept_encoding):
+    """
+    根据 Accept-Encoding 选择压缩编码
+
+    Parameters:
+    accept_encoding (str): Accept-Encoding 请求头
+
+    Returns:
+    str: br、gzip 或 None（不压缩）
+    """
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if name == '*':
+            for supported in COMPRESSORS:
+                weights.setdefault(supported, weight)
+        elif name in COMPRESSORS:
+            weights[name] = weight
+
+    # 权重相同时优先 brotli
+    candidates = [(weight, name == 'br', name) for name, weight in weights.items() if weight > 0]
+    return max(candidates)[2] if candidates else None
+
+
+class CompressionMiddleware:
+    """
+    ASGI 中间件，压缩客户端支持的较大响应
+
+    Parameters:
+    app: ASGI 应用
+    minimum_size (int): 小于该字节数的响应不压缩
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    """拦截响应消息：第一块响应体到达时决定是否压缩，之后逐块压缩；encoding 为 None 时只添加 Vary"""
+
+    def __init__(self, send, encoding, minimum_size):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    def _mark_etag(self, headers):
+        """压缩后的表示使用带编码后缀的 ETag"""
+        etag = headers.get('etag')
+        if etag and etag.endswith('"'):
+            headers['ETag'] = etag[:-1] + '-' + self.encoding + '"'
+
+    async def __call__(self, message):
+        if message['type'] == 'http.response.start':
+            self.start_message = message
+            return
+        if message['type'] != 'http.response.body' or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(scope=self.start_message)
+            if 'content-encoding' not in headers:
+                headers.add_vary_header('Accept-Encoding')
+            if self.encoding is not None and self.start_message['status'] == 304:
+                # 304 没有响应体，ETag 与客户端持有的压缩表示一致
+                self._mark_etag(headers)
+            small = not more_body and len(body) < self.minimum_size
+            if self.encoding is None or 'content-encoding' in headers or self.start_message['status'] in (204, 304) or small:
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.compressor = COMPRESSORS[self.encoding]()
+            headers['Content-Encoding'] = self.encoding
+            self._mark_etag(headers)
+            chunk = self.compressor.compress(body, finish=not more_body)
+            if more_body:
+                del headers['Content-Length']
+            else:
+                headers['Content-Length'] = str(len(chunk))
+            await self.send(self.start_message)
+            await self.send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+            return
+
+        chunk = self.compressor.compress(body, finish=not more_body)
+        await self.send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
@@ -0,0 +1,35 @@
+"""
+异步请求路径使用的线程池
+
+事件循环中不执行阻塞操作：
+- 下载价格数据（等待上游网络、读写本地缓存）在 FETCH_WORKERS 个线程的下载线程池中执行
+- 投资组合估值、指标计算和响应序列化在 COMPUTE_WORKERS 个线程的计算线程池中执行
+
+两个线程池相互独立，大量请求等待上游时不会占满计算线程，反之亦然。
+函数在调用方的 contextvars 上下文中执行，线程池中记录的日志和耗时属于发起的请求，
+正在剖析的请求在线程池中执行时会被采样（见 profiling.py）。
+"""
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import FETCH_WORKERS, COMPUTE_WORKERS
+from .profiling import profiled
+
+fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='fetch')
+compute_executor = ThreadPoolExecutor(max_workers=COMPUTE_WORKERS, thread_name_prefix='compute')
+
+
+async def run_in_fetch_pool(func, *args, **kwargs):
+    """在下载线程池中执行阻塞的下载函数"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(fetch_executor, functools.partial(context.run, profiled(func), *args, **kwargs))
+
+
+async def run_in_compute_pool(func, *args, **kwargs):
+    """在计算线程池中执行CPU密集的函数"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(compute_executor, functools.partial(context.run, profiled(func), *args, **kwargs))
@@ -0,0 +1,81 @@
+"""
+后端配置
+
+所有配置项都可以通过环境变量覆盖，未设置时使用默认值
+"""
+import os
+
+# 项目根目录和数据目录
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
+
+
+def _env_bool(name, default):
+    """读取布尔类型的环境变量"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# 本地价格缓存
+PRICE_CACHE_ENABLED = _env_bool('PRICE_CACHE_ENABLED', True)
+PRICE_CACHE_DIR = os.environ.get('PRICE_CACHE_DIR', os.path.join(DATA_DIR, 'price_cache'))
+# 当天(未收盘)数据的有效期，单位秒
+PRICE_CACHE_TTL = int(os.environ.get('PRICE_CACHE_TTL', '900'))
+# 上游没有返回数据的区间视为已覆盖的时间，单位秒。yfinance 在网络错误时也返回空数据，不能永久记录
+PRICE_CACHE_NEGATIVE_TTL = int(os.environ.get('PRICE_CACHE_NEGATIVE_TTL', '300'))
+# 价格缓存的存储后端: file (每只股票一个Parquet文件) 或 sqlite (多进程共享的单个数据库)
+PRICE_STORE = os.environ.get('PRICE_STORE', 'file')
+# sqlite 存储后端的数据库文件
+PRICE_STORE_PATH = os.environ.get('PRICE_STORE_PATH', os.path.join(PRICE_CACHE_DIR, 'prices.sqlite'))
+# sqlite 存储后端的内存映射大小，单位字节
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(1 << 30)))
+
+# 按日期查询价格时，缓存缺失的日期前后各下载的天数
+PRICE_LOOKUP_WINDOW_DAYS = int(os.environ.get('PRICE_LOOKUP_WINDOW_DAYS', '365'))
+# 按日期查询价格时在内存中保存历史数据的股票数量
+PRICE_LOOKUP_MAX_SYMBOLS = int(os.environ.get('PRICE_LOOKUP_MAX_SYMBOLS', '512'))
+# 按日期查询价格时，上游没有返回数据的区间视为已覆盖的时间，单位秒
+PRICE_LOOKUP_NEGATIVE_TTL = int(os.environ.get('PRICE_LOOKUP_NEGATIVE_TTL', '300'))
+
+# 价格数据源: yfinance 或 local
+PRICE_PROVIDER = os.environ.get('PRICE_PROVIDER', 'yfinance')
+# local 数据源读取的目录
+PRICE_FIXTURE_DIR = os.environ.get('PRICE_FIXTURE_DIR', os.path.join(DATA_DIR, 'fixtures', 'prices'))
+
+# 每个上游数据源同时进行的请求数量上限
+UPSTREAM_CONCURRENCY = int(os.environ.get('UPSTREAM_CONCURRENCY', '4'))
+# 下载价格数据和等待上游使用的线程数
+FETCH_WORKERS = int(os.environ.get('FETCH_WORKERS', '32'))
+# 计算投资组合价值和指标使用的线程数
+COMPUTE_WORKERS = int(os.environ.get('COMPUTE_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+# 计算结果缓存: 相同投资组合和日期区间的请求直接返回上次的结果
+RESULT_CACHE_ENABLED = _env_bool('RESULT_CACHE_ENABLED', True)
+# 最多缓存的结果数量，超出时淘汰最久未使用的结果
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '256'))
+
+# HTTP 响应压缩: 客户端支持时使用 brotli（需要安装 brotli）或 gzip 压缩较大的响应
+COMPRESSION_ENABLED = _env_bool('COMPRESSION_ENABLED', True)
+# 小于该字节数的响应不压缩
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+
+# 日志级别: DEBUG/INFO/WARNING/ERROR，INFO 时每个请求输出一条包含各阶段耗时的日志
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING')
+# 日志格式: text 或 json（每行一个 JSON 对象）
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+# 是否在响应头 Server-Timing 中返回各阶段的耗时
+SERVER_TIMING_ENABLED = _env_bool('SERVER_TIMING_ENABLED', True)
+
+# 是否提供 Prometheus 格式的运行指标接口 /metrics
+METRICS_ENABLED = _env_bool('METRICS_ENABLED', True)
+
+# 按需性能剖析: 启用后带有 X-Profile 请求头或 profile 查询参数的请求会被采样剖析
+PROFILING_ENABLED = _env_bool('PROFILING_ENABLED', False)
+# 非空时 X-Profile/profile 的取值必须与之相同
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+# 剖析结果（折叠调用栈）保存的目录
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+# 采样间隔，单位秒
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.002'))
@@ -1,16 +1,33 @@
 import pandas as pd
-import yfinance as yf
 import os
-from datetime import datetime, timedelta
-import numpy as np
+import logging
+
+from .config import PRICE_CACHE_ENABLED
+from . import price_cache
+from .providers import get_provider, split_histories
+from .symbol_index import SymbolIndex
+from .price_lookup import PriceLookup
+from .singleflight import RangeFlights
+from .concurrency import run_in_fetch_pool
+from .metrics import CallbackMetric
+
+logger = logging.getLogger(__name__)
 
 # 股票列表CSV文件路径
 STOCKS_CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data', 'stocks.csv')
 
+# 股票列表的搜索索引，文件修改后自动重新加载
+_symbol_index = SymbolIndex(STOCKS_CSV_PATH)
+
+# 进行中的价格下载，并发请求相同股票和覆盖区间时共享同一次下载
+_price_flights = RangeFlights()
+
 def search_stocks(query):
     """
     根据输入查询搜索匹配的股票
     
+    结果依次为代码完全匹配、代码前缀匹配、名称前缀匹配、代码包含和名称包含的股票
+    
     Parameters:
     query (str): 搜索查询字符串
     
@@ -23,50 +40,135 @@ def search_stocks(query):
             # 创建一个样例股票列表CSV文件
             create_sample_stocks_csv()
         
-        # 读取股票列表CSV
-        stocks_df = pd.read_csv(STOCKS_CSV_PATH)
-        
-        # 搜索匹配项 (不区分大小写)
-        query = query.lower()
-        matches = stocks_df[
-            stocks_df['symbol'].str.lower().str.contains(query) | 
-            stocks_df['name'].str.lower().str.contains(query)
-        ]
-        
-        # 转换为列表字典返回
-        return matches.head(10).to_dict(orient='records')
+        # 索引只在文件变化时重新建立
+        return _symbol_index.search(query, limit=10)
     except Exception as e:
-        print(f"搜索股票时出错: {e}")
+        logger.warning("搜索股票时出错: %s", e)
         return []
 
-def get_stock_data(symbol, start_date, end_date):
+def get_price_history(symbol, start_date, end_date):
     """
-    使用yfinance获取股票数据
+    获取股票在 [start_date, end_date) 内的OHLCV历史数据
+    
+    启用本地价格缓存时只下载缓存中缺失的日期区间
     
     Parameters:
     symbol (str): 股票代码
     start_date (str): 开始日期 (YYYY-MM-DD)
-    end_date (str): 结束日期 (YYYY-MM-DD)
+    end_date (str): 结束日期 (YYYY-MM-DD)，不包含
     
     Returns:
-    DataFrame: 股票历史数据
+    DataFrame: 以日期为索引的历史数据
     """
-    try:
-        # 添加额外的天数以确保包含周末/假日
-        start_datetime = datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=5)
-        start_date_adj = start_datetime.strftime('%Y-%m-%d')
-        
-        # 获取股票数据
-        stock_data = yf.download(symbol, start=start_date_adj, end=end_date, progress=False)
-        
-        # 确保日期列被设置为索引
-        if not isinstance(stock_data.index, pd.DatetimeIndex):
-            stock_data.set_index('Date', inplace=True)
-        
-        return stock_data
-    except Exception as e:
-        print(f"获取股票数据时出错: {e}")
-        return pd.DataFrame()
+    return get_price_histories([symbol], start_date, end_date)[symbol]
+
+async def get_price_history_async(symbol, start_date, end_date):
+    """get_price_history 的异步版本"""
+    return (await get_price_histories_async([symbol], start_date, end_date))[symbol]
+
+def get_price_histories(symbols, start_date, end_date):
+    """
+    批量获取多只股票在 [start_date, end_date) 内的OHLCV历史数据
+    
+    所有需要下载的股票通过数据源的 fetch_many 一次取回；其他请求正在下载的股票，
+    如果那次下载的区间覆盖了本次请求，则等待并共享它的结果
+    
+    Parameters:
+    symbols (list): 股票代码列表
+    start_date (str): 开始日期 (YYYY-MM-DD)
+    end_date (str): 结束日期 (YYYY-MM-DD)，不包含
+    
+    Returns:
+    dict: {股票代码: DataFrame}，没有数据的股票对应空的 DataFrame
+    """
+    symbols = list(dict.fromkeys(symbols))
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    histories = _price_flights.run(symbols, start, end, lambda keys: _fetch_price_histories(keys, start_date, end_date))
+    return {symbol: _trim_history(histories[symbol], start, end) for symbol in symbols}
+
+async def get_price_histories_async(symbols, start_date, end_date):
+    """
+    get_price_histories 的异步版本
+    
+    下载在下载线程池中执行；等待其他请求正在进行的下载时不占用线程
+    
+    Parameters:
+    symbols (list): 股票代码列表
+    start_date (str): 开始日期 (YYYY-MM-DD)
+    end_date (str): 结束日期 (YYYY-MM-DD)，不包含
+    
+    Returns:
+    dict: {股票代码: DataFrame}，没有数据的股票对应空的 DataFrame
+    """
+    symbols = list(dict.fromkeys(symbols))
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize()
+    histories = await _price_flights.run_async(symbols, start, end, lambda keys: _fetch_price_histories_async(keys, start_date, end_date))
+    return {symbol: _trim_history(histories[symbol], start, end) for symbol in symbols}
+
+def _fetch_price_histories(symbols, start_date, end_date):
+    """通过本地价格缓存或直接通过数据源下载历史数据"""
+    provider = get_provider()
+    if PRICE_CACHE_ENABLED:
+        return price_cache.get_history_many(symbols, start_date, end_date, provider)
+    histories = split_histories(provider.fetch_many(symbols, start_date, end_date), symbols)
+    price_cache.bump_price_versions([symbol for symbol, data in histories.items() if not data.empty])
+    return histories
+
+async def _fetch_price_histories_async(symbols, start_date, end_date):
+    """_fetch_price_histories 的异步版本"""
+    provider = get_provider()
+    if PRICE_CACHE_ENABLED:
+        return await run_in_fetch_pool(price_cache.get_history_many, symbols, start_date, end_date, provider)
+    histories = split_histories(await provider.fetch_many_async(symbols, start_date, end_date), symbols)
+    price_cache.bump_price_versions([symbol for symbol, data in histories.items() if not data.empty])
+    return histories
+
+def _trim_history(data, start, end):
+    """截取 [start, end) 内的数据，共享的下载结果可能覆盖更大的区间"""
+    if data.empty:
+        return data
+    return data[(data.index >= start) & (data.index < end)]
+
+def get_close_price(symbol, date):
+    """
+    获取不晚于指定日期的最近一个交易日的收盘价
+    
+    每只股票的收盘价历史保存在内存中，缓存缺失时一次下载日期前后一段较宽的区间
+    
+    Parameters:
+    symbol (str): 股票代码
+    date (str): 日期 (YYYY-MM-DD)
+    
+    Returns:
+    tuple: (交易日期字符串, 收盘价)，没有数据时为 (None, None)
+    """
+    return _price_lookup.get_close(symbol, date)
+
+async def get_close_price_async(symbol, date):
+    """
+    get_close_price 的异步版本，缓存缺失时的下载在下载线程池中执行，
+    等待其他请求正在进行的下载时在事件循环中等待，不占用下载线程
+    
+    Parameters:
+    symbol (str): 股票代码
+    date (str): 日期 (YYYY-MM-DD)
+    
+    Returns:
+    tuple: (交易日期字符串, 收盘价)，没有数据时为 (None, None)
+    """
+    return await _price_lookup.get_close_async(symbol, date)
+
+# 按日期查询收盘价使用的内存历史数据
+_price_lookup = PriceLookup(get_price_history, fetch_async=get_price_history_async)
+
+# /metrics 输出时读取内存占用和共享下载次数
+CallbackMetric('portfolio_price_memory_bytes', '内存中保存的价格数据字节数',
+               lambda: {('lookup',): _price_lookup.nbytes(), ('provider',): get_provider().nbytes()},
+               labelnames=('cache',))
+CallbackMetric('portfolio_price_fetches_shared_total', '共享进行中的下载而没有请求上游的股票数量',
+               lambda: _price_flights.shared, kind='counter')
 
 def create_sample_stocks_csv():
     """创建样例股票列表CSV文件，用于测试"""
@@ -96,4 +198,4 @@ def create_sample_stocks_csv():
     
     # 保存CSV
     df.to_csv(STOCKS_CSV_PATH, index=False, encoding='utf-8')
-    print(f"已创建样例股票列表: {STOCKS_CSV_PATH}")
+    logger.info("已创建样例股票列表: %s", STOCKS_CSV_PATH)
@@ -0,0 +1,90 @@
+"""
+图表数据降采样
+
+多年的投资组合有数千个数据点，图表的宽度只能画出其中一小部分。这里使用
+Largest-Triangle-Three-Buckets (LTTB) 算法选出保留曲线形状的数据点：首尾两点保留，
+中间的点平均分到若干个桶中，每个桶选出与上一个选中点、下一个桶平均点组成的三角形面积最大的点，
+峰值和谷底因此会被保留下来。
+"""
+import numpy as np
+
+# LTTB 至少保留首尾和一个中间点
+MIN_POINTS = 3
+MAX_POINTS = 100000
+
+
+def lttb_indices(x, y, max_points):
+    """
+    LTTB 降采样选中的数据点下标
+
+    Parameters:
+    x (ndarray): 横坐标，升序
+    y (ndarray): 纵坐标
+    max_points (int): 最多保留的点数
+
+    Returns:
+    ndarray: 升序的下标数组，数据点不超过 max_points 时返回全部下标
+    """
+    n = len(x)
+    if max_points >= n or max_points < MIN_POINTS:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+
+    # 中间 n-2 个点平均分成 max_points-2 个桶，bounds[i]:bounds[i+1] 为第 i 个桶
+    buckets = max_points - 2
+    bounds = np.arange(buckets + 1, dtype=np.int64) * (n - 2) // buckets + 1
+
+    # 每个桶的平均点用前缀和一次算出，最后一个桶的下一个"桶"是最后一个点
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    counts = bounds[1:] - bounds[:-1]
+    avg_x = np.append((x_sums[bounds[1:]] - x_sums[bounds[:-1]]) / counts, x[-1])
+    avg_y = np.append((y_sums[bounds[1:]] - y_sums[bounds[:-1]]) / counts, y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(buckets):
+        lo, hi = bounds[i], bounds[i + 1]
+        next_x, next_y = avg_x[i + 1], avg_y[i + 1]
+        # 三角形面积的两倍，省略常数因子不影响比较
+        areas = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample_portfolio_value(portfolio_value_df, max_points):
+    """
+    按组合总价值的曲线形状对价值序列降采样
+
+    所有列使用相同的日期，每只股票的价值取组合选中日期的数据
+
+    Parameters:
+    portfolio_value_df (DataFrame): 包含 Date 和 TotalValue 列的价值序列
+    max_points (int): 最多保留的点数，None 表示不降采样
+
+    Returns:
+    DataFrame: 降采样后的价值序列
+    """
+    if max_points is None or len(portfolio_value_df) <= max_points:
+        return portfolio_value_df
+    days = np.asarray(portfolio_value_df['Date'], dtype='datetime64[D]').astype(np.int64)
+    indices = lttb_indices(days, portfolio_value_df['TotalValue'].to_numpy(), max_points)
+    return portfolio_value_df.iloc[indices].reset_index(drop=True)
+
+
+def validate_max_points(max_points):
+    """
+    校验降采样的点数
+
+    Parameters:
+    max_points (int): 最多保留的点数，None 表示不降采样
+
+    Raises:
+    ValueError: 点数不在允许范围内
+    """
+    if max_points is not None and not MIN_POINTS <= max_points <= MAX_POINTS:
+        raise ValueError(f"max_points 必须在 {MIN_POINTS} 到 {MAX_POINTS} 之间: {max_points}")
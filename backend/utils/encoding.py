@@ -0,0 +1,209 @@
+"""
+投资组合结果的响应编码
+
+- records（默认）：价值序列是对象数组，每一行重复所有列名，与之前的响应格式相同
+- columnar：价值序列是 {列名: 数组}，日期也是一个数组，宽的投资组合体积小得多
+- arrow：价值序列编码为 Apache Arrow IPC 流，指标以 JSON 保存在 schema 的元数据中，适合程序化的客户端
+
+JSON 使用 orjson 序列化（没有安装时退化为标准库 json），直接处理 NumPy 数组和标量。
+NaN 和无穷大编码为 null，两种序列化方式的输出相同。
+
+流式响应把结果拆成多个事件依次发送，价值序列使用 records 或 columnar 格式：
+- ndjson: 每行一个 JSON 对象 {"type": 事件类型, ...}
+- sse: Server-Sent Events，event 为事件类型，data 为 JSON
+命中结果缓存的流式请求由缓存的响应体重新编码为事件（见 encode_cached_stream）。
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    # 没有安装 orjson 时使用标准库，输出内容相同
+    orjson = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+FORMATS = ('records', 'columnar', 'arrow')
+
+MEDIA_TYPES = {
+    'records': 'application/json',
+    'columnar': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+STREAM_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'sse': 'text/event-stream',
+}
+
+
+def _default(value):
+    """序列化 JSON 不直接支持的类型"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).isoformat()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def _finite(value):
+    """把 NaN 和无穷大替换为 None，与 orjson 的输出一致，只在使用标准库 json 时调用"""
+    if isinstance(value, float):
+        return value if np.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return _finite(value.tolist())
+    return value
+
+
+def dumps(content):
+    """
+    把内容序列化为 UTF-8 编码的 JSON
+
+    Parameters:
+    content: 可以序列化的对象，可以包含 NumPy 数组和标量
+
+    Returns:
+    bytes: JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(_finite(content), default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def _records(portfolio_value_df):
+    """按行的对象数组，比 DataFrame.to_dict(orient="records") 快"""
+    columns = list(portfolio_value_df.columns)
+    values = [portfolio_value_df[column].tolist() for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _columns(portfolio_value_df):
+    """按列的 {列名: 数组}"""
+    return {column: portfolio_value_df[column].to_numpy() if column != 'Date' else portfolio_value_df[column].tolist()
+            for column in portfolio_value_df.columns}
+
+
+def _arrow(portfolio_value_df, indicators):
+    """Arrow IPC 流，Date 为 date32 列，指标以 JSON 保存在 schema 元数据的 indicators 键中"""
+    arrays = []
+    fields = []
+    for column in portfolio_value_df.columns:
+        if column == 'Date':
+            array = pa.array(pd.to_datetime(portfolio_value_df[column]).dt.date, type=pa.date32())
+        else:
+            array = pa.array(portfolio_value_df[column].to_numpy(dtype=float), type=pa.float64())
+        arrays.append(array)
+        fields.append(pa.field(column, array.type))
+    schema = pa.schema(fields, metadata={'indicators': dumps(indicators)})
+    table = pa.Table.from_arrays(arrays, schema=schema)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def portfolio_series(portfolio_value_df, fmt='records'):
+    """
+    按 JSON 格式组织价值序列
+
+    Parameters:
+    portfolio_value_df (DataFrame): 价值序列
+    fmt (str): records 或 columnar
+
+    Returns:
+    list | dict: 可以用 dumps 序列化的价值序列
+    """
+    return _columns(portfolio_value_df) if fmt == 'columnar' else _records(portfolio_value_df)
+
+
+def encode_stream_event(event, payload, stream):
+    """
+    编码一个流式响应事件
+
+    Parameters:
+    event (str): 事件类型，例如 portfolio_value、indicators、done、error
+    payload (dict): 事件内容
+    stream (str): ndjson 或 sse
+
+    Returns:
+    bytes: 事件
+    """
+    if stream == 'sse':
+        return b'event: ' + event.encode('utf-8') + b'\ndata: ' + dumps(payload) + b'\n\n'
+    return dumps({'type': event, **payload}) + b'\n'
+
+
+def encode_portfolio_result(portfolio_value_df, indicators, fmt='records'):
+    """
+    把价值序列和指标编码为响应体
+
+    Parameters:
+    portfolio_value_df (DataFrame): 价值序列，Date 为字符串列
+    indicators (dict): 指标
+    fmt (str): records、columnar 或 arrow
+
+    Returns:
+    bytes: 响应体，媒体类型见 MEDIA_TYPES
+    """
+    if fmt == 'arrow':
+        return _arrow(portfolio_value_df, indicators)
+    return dumps({"portfolio_value": portfolio_series(portfolio_value_df, fmt), "indicators": indicators})
+
+
+def encode_cached_stream(body, stream):
+    """
+    把缓存的 JSON 响应体重新编码为流式响应事件
+
+    缓存的响应体与非流式响应相同，指标已经合并，因此只发送一个不带 group 的 indicators 事件
+
+    Parameters:
+    body (bytes): encode_portfolio_result 编码的 records 或 columnar 响应体
+    stream (str): ndjson 或 sse
+
+    Returns:
+    list: portfolio_value、indicators 和 done 三个事件
+    """
+    content = orjson.loads(body) if orjson is not None else json.loads(body)
+    return [
+        encode_stream_event('portfolio_value', {'data': content['portfolio_value']}, stream),
+        encode_stream_event('indicators', {'data': content['indicators']}, stream),
+        encode_stream_event('done', {}, stream),
+    ]
+
+
+def validate_format(fmt, stream=None):
+    """
+    校验响应格式
+
+    Parameters:
+    fmt (str): 响应格式，None 表示 records
+    stream (str): 流式响应格式，None 表示不使用流式响应
+
+    Raises:
+    ValueError: 格式未知，或者需要的可选依赖没有安装
+    """
+    if stream is not None:
+        if stream not in STREAM_MEDIA_TYPES:
+            raise ValueError(f"未知的流式响应格式: {stream}, 可选: {', '.join(STREAM_MEDIA_TYPES)}")
+        if fmt == 'arrow':
+            raise ValueError("流式响应不支持 arrow 格式")
+    if fmt is None:
+        return
+    if fmt not in FORMATS:
+        raise ValueError(f"未知的响应格式: {fmt}, 可选: {', '.join(FORMATS)}")
+    if fmt == 'arrow' and pa is None:
+        raise ValueError("arrow 格式需要安装 pyarrow")
@@ -3,7 +3,10 @@ import pandas as pd
 from datetime import datetime
 from typing import List, Dict, Any
 
-def calculate_enhanced_indicators(portfolio_value_df, daily_returns, total_values, initial_investment, final_value, first_date, last_date, transactions):
+from .kernels import run_lengths, segment_episodes, segment_max, gini
+from .pipeline import IndicatorContext, quantile_sorted, RISK_FREE_RATE, TRADING_DAYS, DEFAULT_VAR_WINDOW, DEFAULT_VAR_LEVELS
+
+def calculate_enhanced_indicators(portfolio_value_df, daily_returns, total_values, initial_investment, final_value, first_date, last_date, transactions, ctx=None):
     """
     计算增强型投资组合指标
     
@@ -16,118 +19,154 @@ def calculate_enhanced_indicators(portfolio_value_df, daily_returns, total_value
     first_date (datetime): 开始日期
     last_date (datetime): 结束日期
     transactions (List): 交易列表
+    ctx (IndicatorContext): 可选，共享的中间结果，提供时忽略上面的数组参数
     
     Returns:
     Dict: 计算的指标
     """
-    enhanced_indicators = {}
-    
-    # 计算总回报率
-    total_return = (final_value - initial_investment) / initial_investment if initial_investment > 0 else 0
+    if ctx is None:
+        ctx = IndicatorContext(portfolio_value_df, transactions, daily_returns=daily_returns, total_values=total_values)
+        ctx.initial_investment = initial_investment
+        ctx.final_value = final_value
+        ctx.first_date = first_date
+        ctx.last_date = last_date
     
-    # 计算投资时间（年）
-    time_diff = (last_date - first_date).days / 365.25
+    enhanced_indicators = {}
+    enhanced_indicators.update(calculate_enhanced_return_metrics(ctx))
+    if len(ctx.daily_returns) > 0:
+        enhanced_indicators.update(calculate_enhanced_risk_metrics(ctx))
+    enhanced_indicators.update(calculate_enhanced_allocation_metrics(ctx))
+    enhanced_indicators.update(calculate_enhanced_operation_metrics(ctx))
+    return enhanced_indicators
+
+def calculate_enhanced_return_metrics(ctx):
+    """
+    收益性指标: ROI、绝对收益、时间加权收益率和资金加权收益率
     
-    # 计算年化收益率
-    if time_diff > 0.01 and initial_investment > 0 and final_value > 0:
-        # 避免负数导致的复数结果
-        if final_value > initial_investment:
-            annualized_return = (1 + total_return) ** (1 / time_diff) - 1
-        else:
-            # 负收益，使用简单年化计算
-            annualized_return = ((final_value - initial_investment) / initial_investment) * (365.0 / (last_date - first_date).days)
-    else:
-        annualized_return = 0
+    Parameters:
+    ctx (IndicatorContext): 共享的中间结果
     
-    ### 1. 收益性指标 ###
+    Returns:
+    Dict: 计算的指标
+    """
+    enhanced_indicators = {}
     
     # ROI (投资回报率)
+    total_return = ctx.total_return if ctx.initial_investment > 0 else 0
     enhanced_indicators['ROI'] = f"{total_return * 100:.2f}%"
     
     # 绝对收益
-    absolute_return = final_value - initial_investment
+    absolute_return = ctx.final_value - ctx.initial_investment
     enhanced_indicators['绝对收益'] = f"{absolute_return:.2f}"
     
     # 时间加权收益率 (TWR)
-    if len(daily_returns) > 0:
-        twr = np.prod(1 + daily_returns) - 1
+    if len(ctx.daily_returns) > 0:
+        twr = np.prod(1 + ctx.daily_returns) - 1
         enhanced_indicators['时间加权收益率'] = f"{twr * 100:.2f}%"
     else:
         enhanced_indicators['时间加权收益率'] = "N/A"
     
     # 资金加权收益率 (IRR) - 简化处理
-    if len(transactions) == 1:
-        enhanced_indicators['资金加权收益率'] = f"{annualized_return * 100:.2f}%"
+    if len(ctx.transactions) == 1:
+        enhanced_indicators['资金加权收益率'] = f"{ctx.cagr * 100:.2f}%"
     else:
         enhanced_indicators['资金加权收益率'] = "需要详细现金流数据"
     
-    ### 2. 风险评估指标 ###
+    return enhanced_indicators
+
+def calculate_enhanced_risk_metrics(ctx, include_sortino=True):
+    """
+    风险评估指标: 波动率、特雷诺比率、VaR/CVaR、下行偏差、阿尔法和信息比率
     
-    if len(daily_returns) > 0:
-        # 日波动率
-        daily_volatility = np.std(daily_returns)
-        enhanced_indicators['日波动率'] = f"{daily_volatility * 100:.4f}%"
-        
-        # 年化波动率（假设252个交易日）
-        annualized_volatility = daily_volatility * np.sqrt(252)
-        enhanced_indicators['年化波动率'] = f"{annualized_volatility * 100:.2f}%"
-        
-        # 无风险利率 (假设为2%)
-        risk_free_rate = 0.02
-        daily_risk_free = risk_free_rate / 252  # 日无风险收益率
-        
-        # 索提诺比率 (仅考虑下行波动率)
+    Parameters:
+    ctx (IndicatorContext): 共享的中间结果
+    include_sortino (bool): 是否计算以日无风险收益为阈值的索提诺比率
+    
+    Returns:
+    Dict: 计算的指标
+    """
+    enhanced_indicators = {}
+    daily_returns = ctx.daily_returns
+    annualized_return = ctx.cagr
+    
+    # 日波动率
+    daily_volatility = ctx.moments['std']
+    enhanced_indicators['日波动率'] = f"{daily_volatility * 100:.4f}%"
+    
+    # 年化波动率（假设252个交易日）
+    annualized_volatility = daily_volatility * np.sqrt(TRADING_DAYS)
+    enhanced_indicators['年化波动率'] = f"{annualized_volatility * 100:.2f}%"
+    
+    # 无风险利率 (假设为2%)
+    risk_free_rate = RISK_FREE_RATE
+    daily_risk_free = risk_free_rate / TRADING_DAYS  # 日无风险收益率
+    
+    # 索提诺比率 (仅考虑下行波动率)
+    if include_sortino:
         downside_returns = daily_returns[daily_returns < daily_risk_free]
         if len(downside_returns) > 0:
-            downside_deviation = np.std(downside_returns) * np.sqrt(252)
+            downside_deviation = np.std(downside_returns) * np.sqrt(TRADING_DAYS)
             sortino_ratio = (annualized_return - risk_free_rate) / downside_deviation if downside_deviation > 0 else 0
             enhanced_indicators['索提诺比率'] = f"{sortino_ratio:.2f}"
         else:
             enhanced_indicators['索提诺比率'] = "无下行波动"
-        
-        # 特雷诺比率 - 假设贝塔值为1.0，需要市场数据才能准确计算
-        beta = 1.0
-        treynor_ratio = (annualized_return - risk_free_rate) / beta if beta > 0 else 0
-        enhanced_indicators['特雷诺比率'] = f"{treynor_ratio:.2f}"
-        
-        # 风险值(VaR) - 95%置信度下的VaR
-        var_95 = np.percentile(daily_returns, 5) * np.sqrt(1)  # 1天VaR
-        enhanced_indicators['风险值(VaR 95%)'] = f"{var_95 * 100:.2f}%"
-        
-        # 条件风险值(CVaR/Expected Shortfall)
-        cvar_95 = np.mean(daily_returns[daily_returns <= var_95])
-        enhanced_indicators['条件风险值(CVaR 95%)'] = f"{cvar_95 * 100:.2f}%"
-        
-        # 下行偏差
-        target_return = 0  # 目标收益率，可以是0或无风险收益率
-        downside_dev = np.sqrt(np.mean(np.minimum(daily_returns - target_return, 0) ** 2)) * np.sqrt(252)
-        enhanced_indicators['下行偏差'] = f"{downside_dev * 100:.2f}%"
-        
-        # 阿尔法 - 需要市场基准，简化计算
-        # 假设市场平均年收益率为8%
-        market_return = 0.08
-        alpha = annualized_return - (risk_free_rate + beta * (market_return - risk_free_rate))
-        enhanced_indicators['阿尔法'] = f"{alpha * 100:.2f}%"
-        
-        # 信息比率 - 需要基准，简化计算
-        # 假设跟踪误差为5%
-        tracking_error = 0.05
-        information_ratio = (annualized_return - market_return) / tracking_error
-        enhanced_indicators['信息比率'] = f"{information_ratio:.2f}"
     
-    ### 3. 多元化与资产配置指标 ###
+    # 特雷诺比率 - 假设贝塔值为1.0，需要市场数据才能准确计算
+    beta = 1.0
+    treynor_ratio = (annualized_return - risk_free_rate) / beta if beta > 0 else 0
+    enhanced_indicators['特雷诺比率'] = f"{treynor_ratio:.2f}"
+    
+    # 风险值(VaR) - 95%置信度下的VaR
+    sorted_returns = ctx.sorted_returns
+    var_95 = quantile_sorted(sorted_returns, 0.05) * np.sqrt(1)  # 1天VaR
+    enhanced_indicators['风险值(VaR 95%)'] = f"{var_95 * 100:.2f}%"
+    
+    # 条件风险值(CVaR/Expected Shortfall)
+    cvar_95 = np.mean(sorted_returns[:np.searchsorted(sorted_returns, var_95, side='right')])
+    enhanced_indicators['条件风险值(CVaR 95%)'] = f"{cvar_95 * 100:.2f}%"
+    
+    # 下行偏差
+    target_return = 0  # 目标收益率，可以是0或无风险收益率
+    downside_dev = np.sqrt(np.mean(np.minimum(daily_returns - target_return, 0) ** 2)) * np.sqrt(TRADING_DAYS)
+    enhanced_indicators['下行偏差'] = f"{downside_dev * 100:.2f}%"
+    
+    # 阿尔法 - 需要市场基准，简化计算
+    # 假设市场平均年收益率为8%
+    market_return = 0.08
+    alpha = annualized_return - (risk_free_rate + beta * (market_return - risk_free_rate))
+    enhanced_indicators['阿尔法'] = f"{alpha * 100:.2f}%"
+    
+    # 信息比率 - 需要基准，简化计算
+    # 假设跟踪误差为5%
+    tracking_error = 0.05
+    information_ratio = (annualized_return - market_return) / tracking_error
+    enhanced_indicators['信息比率'] = f"{information_ratio:.2f}"
+    
+    return enhanced_indicators
+
+def calculate_enhanced_allocation_metrics(ctx, include_weights=True):
+    """
+    多元化与资产配置指标: 权重集中度(HHI)、基尼系数
+    
+    Parameters:
+    ctx (IndicatorContext): 共享的中间结果
+    include_weights (bool): 是否输出股票权重和最大贡献股票
+    
+    Returns:
+    Dict: 计算的指标
+    """
+    enhanced_indicators = {}
     
     # 获取每个股票的权重
-    symbol_values = {}
-    for symbol in set(tx.symbol for tx in transactions):
-        if symbol in portfolio_value_df.columns:
-            symbol_values[symbol] = portfolio_value_df[symbol].iloc[-1]
+    symbols = set(tx.symbol for tx in ctx.transactions)
+    symbol_values = {symbol: value for symbol, value in ctx.latest_values.items() if symbol in symbols}
     
     total_portfolio_value = sum(symbol_values.values())
     if total_portfolio_value > 0:
         # 计算股票权重
         weights = {symbol: value / total_portfolio_value * 100 for symbol, value in symbol_values.items()}
-        enhanced_indicators['股票权重'] = {symbol: f"{weight:.2f}%" for symbol, weight in weights.items()}
+        if include_weights:
+            enhanced_indicators['股票权重'] = {symbol: f"{weight:.2f}%" for symbol, weight in weights.items()}
         
         numeric_weights = list(weights.values())
         
@@ -138,18 +177,28 @@ def calculate_enhanced_indicators(portfolio_value_df, daily_returns, total_value
         
         # 基尼系数 - 衡量投资集中度
         if len(numeric_weights) > 1:
-            # from scipy.stats import gini
-            from pygini import gini
-            gini_coef = gini(np.array(numeric_weights))
+            gini_coef = gini(numeric_weights)
             enhanced_indicators['基尼系数'] = f"{gini_coef:.2f}"
         
         # 最大贡献股票
-        if symbol_values:
+        if include_weights and symbol_values:
             max_contrib_symbol = max(symbol_values.items(), key=lambda x: x[1])[0]
             max_contrib_weight = symbol_values[max_contrib_symbol] / total_portfolio_value * 100
             enhanced_indicators['最大贡献'] = f"{max_contrib_symbol} ({max_contrib_weight:.2f}%)"
     
-    ### 4. 运营效率指标 ###
+    return enhanced_indicators
+
+def calculate_enhanced_operation_metrics(ctx):
+    """
+    运营效率指标: 换手率、费用率、现金拖累
+    
+    Parameters:
+    ctx (IndicatorContext): 共享的中间结果
+    
+    Returns:
+    Dict: 计算的指标
+    """
+    enhanced_indicators = {}
     
     # 换手率 - 需要交易历史，简化处理
     # 如果只有初始买入，换手率为0
@@ -163,12 +212,13 @@ def calculate_enhanced_indicators(portfolio_value_df, daily_returns, total_value
     
     return enhanced_indicators
 
-def calculate_win_loss_detailed_metrics(daily_returns):
+def calculate_win_loss_detailed_metrics(daily_returns, ctx=None):
     """
     计算详细的胜率和赔率相关指标
     
     Parameters:
     daily_returns (array): 日收益率数组
+    ctx (IndicatorContext): 可选，共享的中间结果
     
     Returns:
     dict: 胜率和赔率相关指标
@@ -178,38 +228,38 @@ def calculate_win_loss_detailed_metrics(daily_returns):
     if len(daily_returns) < 10:
         return {'胜率/败率分析': "数据点不足"}
     
-    # 区分正收益和负收益
-    positive_returns = daily_returns[daily_returns > 0]
-    negative_returns = daily_returns[daily_returns < 0]
+    ctx = ctx or IndicatorContext(daily_returns=daily_returns)
+    stats = ctx.win_loss
     
     # 基础胜率
-    win_rate = len(positive_returns) / len(daily_returns) * 100
+    win_rate = stats['win_rate']
     result['胜率'] = f"{win_rate:.2f}%"
     result['败率'] = f"{100 - win_rate:.2f}%"
     
-    # 平均收益和损失
-    if len(positive_returns) > 0:
-        avg_gain = np.mean(positive_returns) * 100
+    # 平均收益和损失，排序后的收益率两端即为最大单日收益/损失
+    avg_gain = avg_loss = None
+    if stats['avg_gain'] is not None:
+        avg_gain = stats['avg_gain'] * 100
         result['平均收益(盈利日)'] = f"{avg_gain:.4f}%"
-        result['最大单日收益'] = f"{np.max(positive_returns) * 100:.4f}%"
+        result['最大单日收益'] = f"{ctx.sorted_returns[-1] * 100:.4f}%"
     
-    if len(negative_returns) > 0:
-        avg_loss = np.mean(negative_returns) * 100
+    if stats['avg_loss'] is not None:
+        avg_loss = stats['avg_loss'] * 100
         result['平均损失(亏损日)'] = f"{avg_loss:.4f}%"
-        result['最大单日损失'] = f"{np.min(negative_returns) * 100:.4f}%"
+        result['最大单日损失'] = f"{ctx.sorted_returns[0] * 100:.4f}%"
     
     # 收益/损失比率 (赔率)
-    if len(negative_returns) > 0 and np.mean(negative_returns) != 0:
-        gain_loss_ratio = abs(np.mean(positive_returns) / np.mean(negative_returns))
+    if avg_loss is not None and avg_loss != 0:
+        gain_loss_ratio = abs((avg_gain if avg_gain is not None else np.nan) / avg_loss)
         result['收益/损失比'] = f"{gain_loss_ratio:.2f}"
     
     # 期望值
-    expectancy = (win_rate/100 * avg_gain/100) + ((1-win_rate/100) * avg_loss/100) if 'avg_loss' in locals() and 'avg_gain' in locals() else 0
+    expectancy = (win_rate/100 * avg_gain/100) + ((1-win_rate/100) * avg_loss/100) if avg_gain is not None and avg_loss is not None else 0
     result['每日期望收益'] = f"{expectancy*100:.4f}%"
     
     # 连续赢/输计数
-    win_streak = calculate_streak_metrics(daily_returns > 0)
-    loss_streak = calculate_streak_metrics(daily_returns < 0)
+    win_streak = _summarize_streaks(ctx.streaks['up'])
+    loss_streak = _summarize_streaks(ctx.streaks['down'])
     
     result['最大连续盈利天数'] = f"{win_streak['max_streak']}天"
     result['最大连续亏损天数'] = f"{loss_streak['max_streak']}天"
@@ -218,7 +268,8 @@ def calculate_win_loss_detailed_metrics(daily_returns):
     
     # Z分数 - 衡量收益的稳定性
     if len(daily_returns) > 30:
-        z_score = np.mean(daily_returns) / np.std(daily_returns) if np.std(daily_returns) > 0 else 0
+        daily_std = ctx.moments['std']
+        z_score = ctx.moments['mean'] / daily_std if daily_std > 0 else 0
         result['收益Z分数'] = f"{z_score:.2f}"
     
     return result
@@ -233,36 +284,27 @@ def calculate_streak_metrics(binary_array):
     Returns:
     dict: 连续事件统计
     """
-    streaks = []
-    current_streak = 0
-    
-    for value in binary_array:
-        if value:
-            current_streak += 1
-        else:
-            if current_streak > 0:
-                streaks.append(current_streak)
-                current_streak = 0
-    
-    # 处理最后一个连续事件
-    if current_streak > 0:
-        streaks.append(current_streak)
-    
-    if not streaks:
+    _, streaks = run_lengths(binary_array)
+    return _summarize_streaks(streaks)
+
+def _summarize_streaks(streaks):
+    """根据每段连续事件的长度计算最大值和平均值"""
+    if len(streaks) == 0:
         return {'max_streak': 0, 'avg_streak': 0}
     
     return {
-        'max_streak': max(streaks),
+        'max_streak': int(streaks.max()),
         'avg_streak': np.mean(streaks)
     }
 
-def calculate_rolling_detailed_metrics(daily_returns, window=20):
+def calculate_rolling_detailed_metrics(daily_returns, window=20, ctx=None):
     """
     计算详细的滚动指标
     
     Parameters:
     daily_returns (array): 日收益率数组
     window (int): 滚动窗口大小
+    ctx (IndicatorContext): 可选，共享的中间结果
     
     Returns:
     dict: 滚动指标
@@ -272,13 +314,14 @@ def calculate_rolling_detailed_metrics(daily_returns, window=20):
     if len(daily_returns) < window:
         return {f"{window}日滚动分析": "数据点不足"}
     
-    # 使用pandas的rolling函数
-    returns_series = pd.Series(daily_returns)
+    # 同一窗口的滚动统计量只计算一次
+    ctx = ctx or IndicatorContext(daily_returns=daily_returns)
+    rolling = ctx.rolling(window)
     
     # 各类滚动指标
-    rolling_return = returns_series.rolling(window=window).mean() * 252 * 100  # 年化
-    rolling_vol = returns_series.rolling(window=window).std() * np.sqrt(252) * 100  # 年化
-    rolling_sharpe = (returns_series.rolling(window=window).mean() * 252 - 0.02) / (returns_series.rolling(window=window).std() * np.sqrt(252))
+    rolling_return = rolling['mean'] * 252 * 100  # 年化
+    rolling_vol = rolling['std'] * np.sqrt(252) * 100  # 年化
+    rolling_sharpe = (rolling['mean'] * 252 - 0.02) / (rolling['std'] * np.sqrt(252))
     
     # 最新的滚动指标
     result[f"{window}日滚动年化收益"] = f"{rolling_return.iloc[-1]:.2f}%"
@@ -292,18 +335,47 @@ def calculate_rolling_detailed_metrics(daily_returns, window=20):
     result[f"{window}日最低历史波动率"] = f"{rolling_vol[rolling_vol > 0].min() if not rolling_vol[rolling_vol > 0].empty else 0:.2f}%"
     
     # 滚动胜率
-    rolling_win_rate = returns_series.rolling(window=window).apply(lambda x: np.sum(x > 0) / len(x) * 100, raw=True)
+    rolling_win_rate = rolling['win_rate']
     result[f"{window}日滚动胜率"] = f"{rolling_win_rate.iloc[-1]:.2f}%"
     
     return result
 
-def calculate_detailed_drawdown_metrics(portfolio_values, dates):
+def calculate_rolling_tail_risk_metrics(daily_returns, window=DEFAULT_VAR_WINDOW, levels=DEFAULT_VAR_LEVELS, ctx=None):
+    """
+    计算滚动VaR/CVaR指标: 最新值以及历史最差值
+    
+    Parameters:
+    daily_returns (array): 日收益率数组
+    window (int): 滚动窗口大小
+    levels (list): 置信度列表
+    ctx (IndicatorContext): 可选，共享的中间结果
+    
+    Returns:
+    dict: 滚动VaR/CVaR指标
+    """
+    result = {}
+    
+    if len(daily_returns) < window:
+        return {f"{window}日滚动风险值": "数据点不足"}
+    
+    ctx = ctx or IndicatorContext(daily_returns=daily_returns)
+    for level, series in ctx.tail_risk(window, levels).items():
+        label = f"{level * 100:g}%"
+        result[f"{window}日滚动VaR {label}"] = f"{series['var'].iloc[-1] * 100:.2f}%"
+        result[f"{window}日滚动CVaR {label}"] = f"{series['cvar'].iloc[-1] * 100:.2f}%"
+        result[f"{window}日最差VaR {label}"] = f"{series['var'].min() * 100:.2f}%"
+        result[f"{window}日最差CVaR {label}"] = f"{series['cvar'].min() * 100:.2f}%"
+    
+    return result
+
+def calculate_detailed_drawdown_metrics(portfolio_values, dates, ctx=None):
     """
     计算详细的回撤相关指标
     
     Parameters:
     portfolio_values (array): 投资组合价值数组
     dates (list): 对应的日期列表
+    ctx (IndicatorContext): 可选，共享的中间结果
     
     Returns:
     dict: 回撤相关指标
@@ -313,52 +385,35 @@ def calculate_detailed_drawdown_metrics(portfolio_values, dates):
     if len(portfolio_values) < 5:
         return {'回撤分析': "数据点不足"}
     
-    # 计算每个时间点的回撤
-    drawdowns = []
-    peak = portfolio_values[0]
-    drawdown_periods = []
-    current_drawdown_start = None
-    
-    for i, value in enumerate(portfolio_values):
-        if value > peak:
-            peak = value
-            if current_drawdown_start is not None:
-                current_drawdown_start = None
-        else:
-            if peak > 0:
-                current_drawdown = (peak - value) / peak
-                drawdowns.append(current_drawdown)
-                
-                # 记录新的回撤开始
-                if current_drawdown_start is None and current_drawdown > 0.02:  # 只记录超过2%的回撤
-                    current_drawdown_start = i
-                
-                # 记录回撤结束
-                if current_drawdown_start is not None and current_drawdown < 0.005:  # 回撤小于0.5%视为结束
-                    drawdown_periods.append({
-                        'start': current_drawdown_start,
-                        'end': i,
-                        'depth': max([(peak - portfolio_values[j]) / peak for j in range(current_drawdown_start, i+1)])
-                    })
-                    current_drawdown_start = None
-    
-    # 处理可能正在进行的回撤
-    if current_drawdown_start is not None:
-        drawdown_periods.append({
-            'start': current_drawdown_start,
-            'end': len(portfolio_values) - 1,
-            'depth': max([(peak - portfolio_values[j]) / peak for j in range(current_drawdown_start, len(portfolio_values))])
-        })
+    # 计算每个时间点的回撤，创出新高的时间点不计入回撤统计
+    ctx = ctx or IndicatorContext(total_values=portfolio_values)
+    peak = ctx.running_peak
+    new_peak = ctx.new_peak
+    underwater_curve = ctx.underwater
+    in_drawdown = ~new_peak & (peak > 0)
+    drawdowns = underwater_curve[in_drawdown]
+    
+    # 回撤超过2%开始记录，回撤小于0.5%视为结束，期间创出新高则放弃该区间
+    starts, ends, _ = segment_episodes(
+        in_drawdown & (underwater_curve > 0.02),
+        in_drawdown & (underwater_curve < 0.005),
+        new_peak
+    )
+    depths = segment_max(underwater_curve, starts, ends)
+    drawdown_periods = [
+        {'start': int(start), 'end': int(end), 'depth': float(depth)}
+        for start, end, depth in zip(starts, ends, depths)
+    ]
     
     # 基本回撤统计
-    if drawdowns:
-        max_drawdown = max(drawdowns) * 100
+    if len(drawdowns) > 0:
+        max_drawdown = np.max(drawdowns) * 100
         avg_drawdown = np.mean(drawdowns) * 100
         result['最大回撤'] = f"{max_drawdown:.2f}%"
         result['平均回撤'] = f"{avg_drawdown:.2f}%"
         
         # 回撤频率
-        significant_drawdowns = len([d for d in drawdown_periods if d['depth'] > 0.05])  # 超过5%的显著回撤
+        significant_drawdowns = int(np.sum(depths > 0.05))  # 超过5%的显著回撤
         result['显著回撤次数(>5%)'] = str(significant_drawdowns)
         
         # 回撤持续时间统计
@@ -1,18 +1,32 @@
+import logging
 import numpy as np
 import pandas as pd
-import yfinance as yf
 from datetime import datetime
 from typing import List, Dict, Optional
 
+from .data_fetcher import get_price_histories
+from .calendars import output_calendar, exchange_of, MARKET_CALENDARS
+from .valuation import align_prices, align_matrix_prices, build_holdings, value_holdings
+from .kernels import underwater, peak_index, run_lengths
+from .pipeline import IndicatorContext, indicator_group, iter_indicator_groups, RISK_FREE_RATE, TRADING_DAYS
+from .tracing import span
+
 # 导入增强型指标模块
 from .enhanced_indicators import (
     calculate_enhanced_indicators,
+    calculate_enhanced_return_metrics,
+    calculate_enhanced_risk_metrics,
+    calculate_enhanced_allocation_metrics,
+    calculate_enhanced_operation_metrics,
     calculate_win_loss_detailed_metrics,
     calculate_rolling_detailed_metrics,
+    calculate_rolling_tail_risk_metrics,
     calculate_detailed_drawdown_metrics
 )
 
-def calculate_portfolio_value(transactions, start_date, end_date):
+logger = logging.getLogger(__name__)
+
+def calculate_portfolio_value(transactions, start_date, end_date, stock_data=None, price_matrix=None, calendar='trading'):
     """
     计算投资组合在指定时间段内的每日价值
     
@@ -20,386 +34,316 @@ def calculate_portfolio_value(transactions, start_date, end_date):
     transactions (List): 交易列表
     start_date (str): 开始日期
     end_date (str): 结束日期
+    stock_data (dict): 可选，已经获取的 {股票代码: DataFrame} 历史数据，不提供时在这里下载
+    price_matrix (PriceMatrix): 可选，内存映射的价格矩阵，提供时直接从矩阵读取价格，不下载数据
+    calendar (str): 输出日历，trading 只包含所涉及交易所的交易日，calendar 包含每一个自然日
     
     Returns:
     DataFrame: 包含日期和投资组合价值的DataFrame
     """
     try:
-        # 获取日期范围
-        date_range = pd.date_range(start=start_date, end=end_date)
-        
-        # 创建结果DataFrame
-        portfolio_value = pd.DataFrame(index=date_range)
-        portfolio_value.index.name = 'Date'
-        portfolio_value['TotalValue'] = 0.0
-        
-        # 为每个股票添加价值列
-        symbols = set(tx.symbol for tx in transactions)
-        for symbol in symbols:
-            portfolio_value[symbol] = 0.0
-        
-        # 获取所有股票的历史数据
-        stock_data = {}
-        for symbol in symbols:
-            try:
-                print(f"下载 {symbol} 的历史数据...")
-                data = yf.download(symbol, start=start_date, end=end_date, progress=False)
-                if data.empty:
-                    print(f"警告: 没有找到 {symbol} 的历史数据")
-                stock_data[symbol] = data
-            except Exception as e:
-                print(f"获取 {symbol} 数据失败: {e}")
-        
-        # 计算每个交易在每一天的价值
-        for tx in transactions:
-            # 转换日期为datetime对象
-            buy_date = datetime.fromisoformat(tx.buy_date)
+        symbols = list(dict.fromkeys(tx.symbol for tx in transactions))
+        
+        if price_matrix is not None:
+            # 直接从内存映射的价格矩阵读取需要的行和列
+            for symbol in symbols:
+                if symbol not in price_matrix:
+                    logger.warning("价格矩阵中没有 %s", symbol)
+            with span('align'):
+                # 没有交易所日历的市场按实际成交日期去掉休市日，与下载历史数据时相同
+                observed = {symbol: price_matrix.history(symbol, start_date, end_date) for symbol in symbols
+                            if symbol in price_matrix and exchange_of(symbol) not in MARKET_CALENDARS}
+                date_range = output_calendar(symbols, start_date, end_date, calendar, observed)
+                prices = align_matrix_prices(price_matrix, date_range, symbols, start_date, end_date)
+        else:
+            # 一次批量获取所有股票的历史数据
+            if stock_data is None:
+                stock_data = {}
+                try:
+                    logger.debug("下载 %s 的历史数据...", ', '.join(symbols))
+                    with span('fetch'):
+                        stock_data = get_price_histories(symbols, start_date, end_date)
+                except Exception as e:
+                    logger.warning("获取历史数据失败: %s", e)
+            for symbol in symbols:
+                data = stock_data.get(symbol)
+                if data is None or data.empty:
+                    logger.warning("没有找到 %s 的历史数据", symbol)
             
-            # 获取股票数据
-            if tx.symbol not in stock_data or stock_data[tx.symbol].empty:
-                print(f"跳过 {tx.symbol} 的价值计算，因为没有历史数据")
-                continue
-                
-            stock_df = stock_data[tx.symbol]
+            # 价格对齐到日历并向前填充
+            with span('align'):
+                date_range = output_calendar(symbols, start_date, end_date, calendar, stock_data)
+                prices = align_prices(stock_data, date_range, symbols)
+        
+        with span('value'):
+            # 与持仓数量矩阵相乘
+            holdings = build_holdings(transactions, date_range, symbols)
+            symbol_values, total_values = value_holdings(prices, holdings)
             
-            # 确保日期列是索引
-            if not isinstance(stock_df.index, pd.DatetimeIndex):
-                stock_df.set_index('Date', inplace=True)
+            # 创建结果DataFrame
+            portfolio_value = pd.DataFrame(symbol_values, index=date_range, columns=symbols)
+            portfolio_value.insert(0, 'TotalValue', total_values)
+            portfolio_value.index.name = 'Date'
             
-            # 对于每一天，如果在买入日期之后，计算价值
-            for date in portfolio_value.index:
-                if date.date() >= buy_date.date():
-                    # 找到最近的交易日
-                    closest_date = find_closest_trading_date(stock_df, date)
-                    if closest_date is not None:
-                        price = stock_df.loc[closest_date, 'Close']
-                        value = tx.quantity * price
-                        
-                        # 使用try-except块来安全更新DataFrame
-                        try:
-                            # 确保符号列存在
-                            if tx.symbol not in portfolio_value.columns:
-                                portfolio_value[tx.symbol] = 0.0
-                                
-                            # 使用更安全的方法更新值
-                            current_value = portfolio_value.at[date, tx.symbol]
-                            portfolio_value.at[date, tx.symbol] = current_value + value
-                            
-                            current_total = portfolio_value.at[date, 'TotalValue']
-                            portfolio_value.at[date, 'TotalValue'] = current_total + value
-                        except Exception as e:
-                            print(f"更新 {tx.symbol} 在 {date} 的价值时出错: {e}")
-                            print(f"当前行索引类型: {type(date)}, 当前列索引: {portfolio_value.columns.tolist()}")
-                            # 确保不会中断整个计算过程
-                            continue
-        
-        # 填充缺失值
-        portfolio_value.fillna(0, inplace=True)
-        
-        # 重置索引使Date成为列
-        portfolio_value = portfolio_value.reset_index()
-        
-        # 确保日期是字符串格式
-        portfolio_value['Date'] = portfolio_value['Date'].dt.strftime('%Y-%m-%d')
+            # 重置索引使Date成为列
+            portfolio_value = portfolio_value.reset_index()
+            
+            # 确保日期是字符串格式
+            portfolio_value['Date'] = portfolio_value['Date'].dt.strftime('%Y-%m-%d')
         
         return portfolio_value
     except Exception as e:
-        print(f"计算投资组合价值时出现错误: {e}")
+        logger.exception("计算投资组合价值时出现错误: %s", e)
         # 返回一个最小的有效DataFrame而不是抛出异常
         result = pd.DataFrame({'Date': [start_date], 'TotalValue': [0.0]})
         for symbol in set(tx.symbol for tx in transactions):
             result[symbol] = 0.0
         return result
 
-def find_closest_trading_date(stock_df, date):
+def iter_indicators(portfolio_value_df, transactions, groups=None, rolling_windows=None, var_window=None, var_levels=None):
     """
-    找到最近的交易日期
-    
-    Parameters:
-    stock_df (DataFrame): 股票数据
-    date (datetime): 目标日期
+    依次计算指标组，每计算完一组就返回该组结果，参数与 calculate_indicators 相同
     
-    Returns:
-    datetime or None: 最近的交易日期或None
+    Yields:
+    tuple: (指标组名称, 该组的指标字典)，数据点不足时只返回一次 (None, 提示信息)
     """
-    try:
-        # 获取小于等于目标日期的最近交易日
-        available_dates = stock_df.index[stock_df.index <= date]
-        if not available_dates.empty:
-            return available_dates[-1]
-    except Exception as e:
-        print(f"查找交易日期时出错: {e}")
-    return None
+    if groups is not None and len(groups) == 0:
+        return
+    
+    logger.debug("计算指标 - 数据点数量: %d, 交易数量: %d", len(portfolio_value_df), len(transactions))
+    
+    # 确保有足够的数据点
+    if len(portfolio_value_df) < 2:
+        logger.warning("数据点不足，无法计算有意义的指标")
+        yield None, {"信息": "数据点不足，无法计算有意义的指标"}
+        return
+    
+    ctx = IndicatorContext(portfolio_value_df, transactions, rolling_windows=rolling_windows,
+                           var_window=var_window, var_levels=var_levels)
+    yield from iter_indicator_groups(ctx, groups)
 
-def calculate_indicators(portfolio_value_df, transactions):
+
+def calculate_indicators(portfolio_value_df, transactions, groups=None, rolling_windows=None, var_window=None, var_levels=None):
     """
     计算投资组合指标
     
+    所有指标共享同一个 IndicatorContext，日收益率、标准差、历史最高值等中间结果只计算一次
+    
     Parameters:
     portfolio_value_df (DataFrame): 投资组合价值数据
     transactions (List): 交易列表
+    groups (list): 需要计算的指标组，None 表示默认指标组，空列表表示不计算
+    rolling_windows (list): 滚动指标的窗口大小，None 表示默认的20日和60日
+    var_window (int): 滚动VaR/CVaR的窗口大小，None 表示默认的60日
+    var_levels (list): 滚动VaR/CVaR的置信度，None 表示默认的95%和99%
     
     Returns:
     Dict: 计算的指标 - 包含丰富的投资指标信息
     """
     indicators = {}
+    for _, group_indicators in iter_indicators(portfolio_value_df, transactions, groups, rolling_windows=rolling_windows,
+                                               var_window=var_window, var_levels=var_levels):
+        indicators.update(group_indicators)
+    return indicators
+
+
+@indicator_group('returns', requires=('initial_investment', 'final_value', 'daily_returns'))
+def calculate_return_indicators(ctx):
+    """收益指标: 总收益率、年化收益率等"""
+    indicators = {}
     
-    # 打印数据结构以便调试
-    print(f"计算指标 - 数据点数量: {len(portfolio_value_df)}")
-    print(f"计算指标 - 列: {portfolio_value_df.columns.tolist()}")
-    print(f"计算指标 - 交易数量: {len(transactions)}")
+    # 总收益率
+    total_return = ctx.total_return * 100
+    indicators['总收益率'] = f"{total_return:.2f}%"
     
-    # 确保有足够的数据点
-    if len(portfolio_value_df) < 2:
-        print("警告: 数据点不足，无法计算有意义的指标")
-        return {"信息": "数据点不足，无法计算有意义的指标"}
-    
-    # 提取总价值列
-    total_values = portfolio_value_df['TotalValue'].values
-    print(f"总价值数组: {total_values}")
-    
-    # 确保日期列是有效的
-    if 'Date' in portfolio_value_df.columns:
-        dates = pd.to_datetime(portfolio_value_df['Date'])
-        # 使用.iloc来安全地访问第一个和最后一个元素，而不是使用负索引
-        first_date = dates.iloc[0]
-        last_date = dates.iloc[len(dates) - 1]
-        print(f"日期范围: {first_date} 到 {last_date}")
+    # 年化收益率
+    if ctx.annualized_return is not None:
+        indicators['年化收益率'] = f"{ctx.annualized_return:.2f}%"
     else:
-        print("警告: 没有找到Date列，使用默认日期范围")
-        # 创建一个默认的日期范围
-        start_date = pd.Timestamp('2020-01-01')
-        end_date = pd.Timestamp('2020-01-01') + pd.Timedelta(days=len(portfolio_value_df) - 1)
-        first_date = start_date
-        last_date = end_date
-        dates = pd.date_range(start=start_date, end=end_date, periods=len(portfolio_value_df))
-    
-    # 计算初始投资
-    initial_investment = sum(tx.quantity * tx.buy_price for tx in transactions)
-    print(f"初始投资: {initial_investment}")
-    if initial_investment <= 0:
-        print("警告: 初始投资为零或负值")
-        initial_investment = 1.0  # 防止除以零错误
-    
-    # 计算最终投资组合价值
-    if len(total_values) > 0:
-        final_value = total_values[-1]  # 这里使用-1是安全的，因为是numpy数组
-        print(f"最终价值: {final_value}")
-        if final_value < 0:
-            print("警告: 最终价值为负")
-            final_value = 0.0
+        indicators['年化收益率'] = "N/A"
+        logger.warning("无法计算年化收益率，投资天数: %s, 初始投资: %s, 最终价值: %s", ctx.days, ctx.initial_investment, ctx.final_value)
+    
+    if len(ctx.daily_returns) > 0:
+        indicators.update(calculate_enhanced_return_metrics(ctx))
+    
+    return indicators
+
+
+@indicator_group('risk', requires=('daily_returns', 'moments', 'negative_returns', 'downside_std', 'sorted_returns', 'underwater'))
+def calculate_risk_indicators(ctx):
+    """风险指标: 波动率、最大回撤、夏普比率、索提诺比率等"""
+    indicators = {}
+    
+    if len(ctx.daily_returns) == 0:
+        logger.warning("无法计算风险指标，没有有效的每日回报率")
+        for key in ['波动率(年化)', '最大回撤', '夏普比率', '收益风险比', '下行风险', '索提诺比率', '平均每日收益', '卡尔玛比率']:
+            indicators[key] = "N/A"
+        return indicators
+    
+    mean_return = ctx.moments['mean']
+    daily_std = ctx.moments['std']
+    
+    # 波动率 (标准差)
+    volatility = daily_std * np.sqrt(TRADING_DAYS) * 100  # 年化
+    indicators['波动率(年化)'] = f"{volatility:.2f}%"
+    
+    # 最大回撤
+    max_drawdown = ctx.max_drawdown * 100
+    indicators['最大回撤'] = f"{max_drawdown:.2f}%"
+    
+    # 增强型风险指标，索提诺比率使用下面的定义
+    indicators.update(calculate_enhanced_risk_metrics(ctx, include_sortino=False))
+    
+    # 夏普比率 (假设无风险利率为2%)
+    if daily_std > 0:
+        sharpe_ratio = ((mean_return * TRADING_DAYS) - RISK_FREE_RATE) / (daily_std * np.sqrt(TRADING_DAYS))
+        indicators['夏普比率'] = f"{sharpe_ratio:.2f}"
     else:
-        print("警告: 总价值数组为空")
-        final_value = 0.0
-    
-    # 计算每日价值和变化率
-    if len(portfolio_value_df) > 1:
-        daily_values = portfolio_value_df['TotalValue'].values
-        # 确保没有零值或负值导致无法计算
-        valid_indices = np.where(daily_values[:-1] > 0)[0]
-        if len(valid_indices) > 0:
-            valid_values_prev = daily_values[valid_indices]
-            valid_values_next = daily_values[valid_indices + 1]
-            daily_returns = (valid_values_next - valid_values_prev) / valid_values_prev
-        else:
-            daily_returns = np.array([])
-            print("警告: 没有足够的有效价值来计算每日回报率")
+        indicators['夏普比率'] = "N/A (无波动性)"
+    
+    # 收益风险比
+    if max_drawdown > 0:
+        risk_return_ratio = abs(ctx.total_return * 100 / max_drawdown)
+        indicators['收益风险比'] = f"{risk_return_ratio:.2f}"
     else:
-        daily_returns = np.array([])
-        print("警告: 没有足够的数据点来计算每日回报率")
+        indicators['收益风险比'] = "N/A (无回撤)"
     
-    # 1. 收益指标
-    # 总收益率
-    if initial_investment > 0:
-        total_return = (final_value - initial_investment) / initial_investment * 100
-        indicators['总收益率'] = f"{total_return:.2f}%"
-        print(f"总收益率: {total_return:.2f}%")
+    # 下行风险
+    if len(ctx.negative_returns) > 0:
+        downside_risk = ctx.downside_std * np.sqrt(TRADING_DAYS) * 100
+        indicators['下行风险'] = f"{downside_risk:.2f}%"
     else:
-        indicators['总收益率'] = "N/A (初始投资为零)"
-        print("警告: 无法计算总收益率，初始投资为零")
-    
-    # 年化收益率和CAGR
-    # 使用日期对象计算天数，而不是使用索引
-    days = (last_date - first_date).days
-    print(f"投资天数: {days} (从 {first_date} 到 {last_date})")
-    
-    if days > 0 and initial_investment > 0 and final_value > 0:
-        years = days / 365.0
-        # 避免负数导致的复数结果
-        if final_value > initial_investment:
-            annualized_return = ((final_value / initial_investment) ** (1 / years) - 1) * 100
-            indicators['年化收益率'] = f"{annualized_return:.2f}%"
-            print(f"年化收益率计算: (({final_value} / {initial_investment}) ** (1 / {years}) - 1) * 100 = {annualized_return:.2f}%")
-        else:
-            # 负收益，使用简单年化计算
-            annualized_return = ((final_value - initial_investment) / initial_investment) * (365.0 / days) * 100
-            indicators['年化收益率'] = f"{annualized_return:.2f}%"
-            print(f"负收益年化计算: (({final_value} - {initial_investment}) / {initial_investment}) * (365 / {days}) * 100 = {annualized_return:.2f}%")
+        indicators['下行风险'] = "0.00%"
+    
+    # 索提诺比率 (下行风险替代标准差)
+    if len(ctx.negative_returns) > 0 and ctx.downside_std > 0:
+        sortino_ratio = ((mean_return * TRADING_DAYS) - RISK_FREE_RATE) / (ctx.downside_std * np.sqrt(TRADING_DAYS))
+        indicators['索提诺比率'] = f"{sortino_ratio:.2f}"
     else:
-        indicators['年化收益率'] = "N/A"
-        annualized_return = 0
-        print(f"警告: 无法计算年化收益率，投资天数: {days}, 初始投资: {initial_investment}, 最终价值: {final_value}")
-    
-    # 2. 风险指标
-    if len(daily_returns) > 0:
-        # 波动率 (标准差)
-        volatility = np.std(daily_returns) * np.sqrt(252) * 100  # 年化
-        indicators['波动率(年化)'] = f"{volatility:.2f}%"
-        
-        # 最大回撤
-        max_drawdown = calculate_max_drawdown(total_values) * 100
-        indicators['最大回撤'] = f"{max_drawdown:.2f}%"
-        
-        # 增强型指标 - 使用新创建的模块来扩展指标系统
-        print("计算增强型指标...")
-        
-        # 1. 计算高级指标
-        enhanced_metrics = calculate_enhanced_indicators(
-            portfolio_value_df=portfolio_value_df,
-            daily_returns=daily_returns,
-            total_values=total_values,
-            initial_investment=initial_investment,
-            final_value=final_value,
-            first_date=first_date,
-            last_date=last_date,
-            transactions=transactions
-        )
-        
-        # 将增强型指标整合到主指标字典中
-        for key, value in enhanced_metrics.items():
-            if key not in indicators:
-                indicators[key] = value
-                print(f"添加增强型指标: {key}")
-        
-        # 2. 计算详细的胜率/赔率分析
-        if len(daily_returns) > 10:  # 至少需要10天的数据
-            win_loss_detailed = calculate_win_loss_detailed_metrics(daily_returns)
-            indicators['胜负详细分析'] = win_loss_detailed
-            print("添加胜负详细分析")
-        
-        # 3. 计算滚动指标（如果有足够数据）
-        if len(daily_returns) >= 60:  # 至少需要60天数据
-            # 20日滚动指标
-            rolling_20_detailed = calculate_rolling_detailed_metrics(daily_returns, window=20)
-            indicators['20日滚动分析'] = rolling_20_detailed
-            
-            # 60日滚动指标
-            rolling_60_detailed = calculate_rolling_detailed_metrics(daily_returns, window=60)
-            indicators['60日滚动分析'] = rolling_60_detailed
-            print("添加滚动指标分析")
-        
-        # 4. 计算回撤相关详细指标
-        if len(total_values) > 30:
-            drawdown_detailed = calculate_detailed_drawdown_metrics(total_values, portfolio_value_df['Date'].tolist())
-            indicators['回撤详细分析'] = drawdown_detailed
-            print("添加回撤详细分析")
-        
-        # 夏普比率 (假设无风险利率为2%)
-        risk_free_rate = 0.02
-        daily_std = np.std(daily_returns)
-        if daily_std > 0:
-            sharpe_ratio = ((np.mean(daily_returns) * 252) - risk_free_rate) / (daily_std * np.sqrt(252))
-            indicators['夏普比率'] = f"{sharpe_ratio:.2f}"
-        else:
-            indicators['夏普比率'] = "N/A (无波动性)"
-        
-        # 收益风险比
-        if max_drawdown > 0:
-            risk_return_ratio = abs(total_return / max_drawdown)
-            indicators['收益风险比'] = f"{risk_return_ratio:.2f}"
-        else:
-            indicators['收益风险比'] = "N/A (无回撤)"
-            
-        # 下行风险
-        negative_returns = daily_returns[daily_returns < 0]
-        if len(negative_returns) > 0:
-            downside_risk = np.std(negative_returns) * np.sqrt(252) * 100
-            indicators['下行风险'] = f"{downside_risk:.2f}%"
-        else:
-            indicators['下行风险'] = "0.00%"
-        
-        # 索提诺比率 (下行风险替代标准差)
-        if len(negative_returns) > 0 and np.std(negative_returns) > 0:
-            sortino_ratio = ((np.mean(daily_returns) * 252) - risk_free_rate) / (np.std(negative_returns) * np.sqrt(252))
-            indicators['索提诺比率'] = f"{sortino_ratio:.2f}"
-        else:
-            indicators['索提诺比率'] = "N/A (无下行风险)"
-        
-        # 最大连续上涨/下跌天数
-        if len(daily_returns) > 0:
-            up_days = np.where(daily_returns > 0, 1, 0)
-            down_days = np.where(daily_returns < 0, 1, 0)
-            
-            max_up_streak = calculate_max_streak(up_days)
-            max_down_streak = calculate_max_streak(down_days)
-            
-            indicators['最大连续上涨天数'] = f"{max_up_streak}天"
-            indicators['最大连续下跌天数'] = f"{max_down_streak}天"
-        
-        # 胜率 (正收益天数比例)
-        if len(daily_returns) > 0:
-            win_rate = np.sum(daily_returns > 0) / len(daily_returns) * 100
-            indicators['胜率'] = f"{win_rate:.2f}%"
-            
-        # 平均每日收益
-        if len(daily_returns) > 0:
-            avg_daily_return = np.mean(daily_returns) * 100
-            indicators['平均每日收益'] = f"{avg_daily_return:.4f}%"
-            
-        # 新增: 卡尔玛比率 (年化收益率/最大回撤)
-        if max_drawdown > 0 and annualized_return != 0:
-            calmar_ratio = abs(annualized_return / max_drawdown)
-            indicators['卡尔玛比率'] = f"{calmar_ratio:.2f}"
-        else:
-            indicators['卡尔玛比率'] = "N/A"
-            
-        # 新增: 胜率/败率分析
-        win_loss_metrics = calculate_win_loss_metrics(daily_returns)
-        indicators.update(win_loss_metrics)
-        
-        # 新增: 滚动波动率分析 (20天和60天)
-        if len(daily_returns) >= 20:
-            rolling_20d = calculate_rolling_metrics(daily_returns, window=20)
-            indicators.update(rolling_20d)
-            
-        if len(daily_returns) >= 60:
-            rolling_60d = calculate_rolling_metrics(daily_returns, window=60)
-            indicators.update(rolling_60d)
-            
-        # 新增: 详细回撤分析
-        # 只有当有足够的数据点且日期数据可用时才计算
-        if len(total_values) > 20 and len(dates) == len(total_values):
-            # 将日期转换为列表，以便通过索引访问
-            date_list = dates.tolist()
-            drawdown_metrics = calculate_drawdown_metrics(total_values, date_list)
-            indicators.update(drawdown_metrics)
+        indicators['索提诺比率'] = "N/A (无下行风险)"
+    
+    # 平均每日收益
+    indicators['平均每日收益'] = f"{mean_return * 100:.4f}%"
+    
+    # 卡尔玛比率 (年化收益率/最大回撤)
+    annualized_return = ctx.annualized_return or 0
+    if max_drawdown > 0 and annualized_return != 0:
+        calmar_ratio = abs(annualized_return / max_drawdown)
+        indicators['卡尔玛比率'] = f"{calmar_ratio:.2f}"
     else:
-        indicators['波动率(年化)'] = "N/A"
-        indicators['最大回撤'] = "N/A"
-        indicators['夏普比率'] = "N/A"
-        indicators['收益风险比'] = "N/A"
-        indicators['下行风险'] = "N/A"
-        indicators['索提诺比率'] = "N/A"
+        indicators['卡尔玛比率'] = "N/A"
+    
+    return indicators
+
+
+@indicator_group('win_loss', requires=('daily_returns', 'positive_returns', 'negative_returns', 'win_loss', 'streaks'))
+def calculate_win_loss_indicators(ctx):
+    """胜率/赔率与连续涨跌指标"""
+    indicators = {}
+    daily_returns = ctx.daily_returns
+    
+    if len(daily_returns) == 0:
         indicators['最大连续上涨天数'] = "N/A"
         indicators['最大连续下跌天数'] = "N/A"
         indicators['胜率'] = "N/A"
-        indicators['平均每日收益'] = "N/A"
-        indicators['卡尔玛比率'] = "N/A"
-        print("警告: 无法计算风险指标，没有有效的每日回报率")
+        return indicators
     
-    # 3. 投资组合分析
-    # 计算每个股票的权重
-    latest_values = {}
-    for symbol in portfolio_value_df.columns:
-        if symbol not in ['Date', 'TotalValue'] and symbol in portfolio_value_df.columns:
-            try:
-                latest_values[symbol] = float(portfolio_value_df[symbol].iloc[-1])
-            except Exception as e:
-                print(f"获取 {symbol} 最新价值时出错: {e}")
-                latest_values[symbol] = 0.0
+    # 详细的胜率/赔率分析，至少需要10天的数据
+    if len(daily_returns) > 10:
+        indicators['胜负详细分析'] = calculate_win_loss_detailed_metrics(daily_returns, ctx=ctx)
+    
+    # 最大连续上涨/下跌天数
+    up_streaks = ctx.streaks['up']
+    down_streaks = ctx.streaks['down']
+    indicators['最大连续上涨天数'] = f"{int(up_streaks.max()) if len(up_streaks) > 0 else 0}天"
+    indicators['最大连续下跌天数'] = f"{int(down_streaks.max()) if len(down_streaks) > 0 else 0}天"
+    
+    # 胜率 (正收益天数比例)
+    indicators['胜率'] = f"{ctx.win_loss['win_rate']:.2f}%"
+    
+    # 胜率/败率分析
+    indicators.update(calculate_win_loss_metrics(daily_returns, ctx=ctx))
     
-    print(f"各股票最新价值: {latest_values}")
+    return indicators
+
+
+@indicator_group('rolling', requires=('daily_returns',))
+def calculate_rolling_indicators(ctx):
+    """滚动指标: 默认20日和60日窗口，可以通过 rolling_windows 指定"""
+    indicators = {}
+    daily_returns = ctx.daily_returns
+    windows = [window for window in ctx.rolling_windows if len(daily_returns) >= window]
     
+    # 所有窗口的滚动统计量在一次遍历中计算
+    ctx.rolling_stats(windows)
+    
+    # 详细滚动指标至少需要60天数据
+    for window in windows:
+        if len(daily_returns) >= max(window, 60):
+            indicators[f"{window}日滚动分析"] = calculate_rolling_detailed_metrics(daily_returns, window=window, ctx=ctx)
+    
+    # 滚动波动率分析
+    for window in windows:
+        indicators.update(calculate_rolling_metrics(daily_returns, window=window, ctx=ctx))
+    
+    return indicators
+
+
+@indicator_group('tail_risk', requires=('daily_returns', 'return_dates'), default=False)
+def calculate_tail_risk_indicators(ctx):
+    """滚动风险值: 滚动窗口的 VaR/CVaR 及其时间序列"""
+    indicators = {}
+    window = ctx.var_window
+    daily_returns = ctx.daily_returns
+    
+    indicators["滚动风险值分析"] = calculate_rolling_tail_risk_metrics(daily_returns, window=window, levels=ctx.var_levels, ctx=ctx)
+    if len(daily_returns) < window:
+        return indicators
+    
+    # 时间序列从第一个完整窗口开始，数值为百分比
+    series = {"窗口": window}
+    if ctx.return_dates is not None:
+        series["日期"] = ctx.return_dates[window - 1:]
+    for level, values in ctx.tail_risk(window, ctx.var_levels).items():
+        label = f"{level * 100:g}%"
+        series[f"VaR {label}"] = np.round(values['var'].to_numpy()[window - 1:] * 100, 4).tolist()
+        series[f"CVaR {label}"] = np.round(values['cvar'].to_numpy()[window - 1:] * 100, 4).tolist()
+    indicators["滚动风险值序列"] = series
+    
+    return indicators
+
+
+@indicator_group('drawdown', requires=('daily_returns', 'running_peak', 'new_peak', 'underwater'))
+def calculate_drawdown_indicators(ctx):
+    """回撤详细分析"""
+    indicators = {}
+    total_values = ctx.total_values
+    
+    if len(ctx.daily_returns) == 0:
+        return indicators
+    
+    if len(total_values) > 30:
+        indicators['回撤详细分析'] = calculate_detailed_drawdown_metrics(total_values, ctx.date_labels, ctx=ctx)
+    
+    # 只有当有足够的数据点且日期数据可用时才计算
+    if len(total_values) > 20 and len(ctx.dates) == len(total_values):
+        indicators.update(calculate_drawdown_metrics(total_values, ctx.dates.tolist(), ctx=ctx))
+    
+    return indicators
+
+
+@indicator_group('allocation', requires=('daily_returns', 'latest_values', 'final_value'))
+def calculate_allocation_indicators(ctx):
+    """投资组合分析: 股票权重、集中度和多样性"""
+    indicators = {}
+    final_value = ctx.final_value
+    latest_values = ctx.latest_values
+    
+    if len(ctx.daily_returns) > 0:
+        indicators.update(calculate_enhanced_allocation_metrics(ctx, include_weights=False))
+        indicators.update(calculate_enhanced_operation_metrics(ctx))
+    
+    # 计算每个股票的权重
     if final_value > 0 and latest_values:
         weights = {symbol: (value / final_value * 100) for symbol, value in latest_values.items()}
         indicators['股票权重'] = {symbol: f"{weight:.2f}%" for symbol, weight in weights.items()}
@@ -420,16 +364,14 @@ def calculate_indicators(portfolio_value_df, transactions):
         if weights:
             max_contributor = max(weights.items(), key=lambda x: x[1])
             indicators['最大贡献'] = f"{max_contributor[0]}: {max_contributor[1]:.2f}%"
-            print(f"最大贡献: {indicators['最大贡献']}")
         else:
             indicators['最大贡献'] = "无"
-            print("警告: 没有权重信息")
     else:
         indicators['股票权重'] = {symbol: "0.00%" for symbol in latest_values.keys()}
         indicators['最大贡献'] = "无 (投资组合价值为0)"
         indicators['投资集中度(基尼系数)'] = "N/A"
         indicators['投资多样性(熵值)'] = "N/A"
-        print("警告: 最终价值为零或没有股票价值")
+        logger.warning("最终价值为零或没有股票价值")
     
     return indicators
 
@@ -445,22 +387,10 @@ def calculate_max_drawdown(values):
     float: 最大回撤比例
     """
     if len(values) < 2:
-        print("警告: 数据点不足，无法计算最大回撤")
+        logger.warning("数据点不足，无法计算最大回撤")
         return 0.0
-        
-    max_so_far = values[0]
-    max_drawdown = 0.0
     
-    for value in values:
-        if value > max_so_far:
-            max_so_far = value
-        
-        # 防止除以零
-        if max_so_far > 0:
-            drawdown = (max_so_far - value) / max_so_far
-            max_drawdown = max(max_drawdown, drawdown)
-    
-    return max_drawdown
+    return max(0.0, float(np.max(underwater(values))))
 
 
 def calculate_max_streak(binary_array):
@@ -473,17 +403,8 @@ def calculate_max_streak(binary_array):
     Returns:
     int: 最大连续天数
     """
-    max_streak = 0
-    current_streak = 0
-    
-    for value in binary_array:
-        if value == 1:
-            current_streak += 1
-            max_streak = max(max_streak, current_streak)
-        else:
-            current_streak = 0
-            
-    return max_streak
+    _, lengths = run_lengths(np.asarray(binary_array) == 1)
+    return int(lengths.max()) if len(lengths) > 0 else 0
 
 
 def calculate_gini_coefficient(weights):
@@ -549,36 +470,35 @@ def calculate_diversity_score(weights):
     return diversity
 
 
-def calculate_win_loss_metrics(daily_returns):
+def calculate_win_loss_metrics(daily_returns, ctx=None):
     """
     计算胜率和赔率相关指标
     
     Parameters:
     daily_returns (array): 日收益率数组
+    ctx (IndicatorContext): 可选，共享的中间结果
     
     Returns:
     dict: 胜率和赔率相关指标
     """
     result = {}
-    
-    # 区分正收益和负收益
-    positive_returns = daily_returns[daily_returns > 0]
-    negative_returns = daily_returns[daily_returns < 0]
+    ctx = ctx or IndicatorContext(daily_returns=daily_returns)
+    stats = ctx.win_loss
     
     # 计算胜率
-    win_rate = len(positive_returns) / len(daily_returns) * 100
+    win_rate = stats['win_rate']
     result['详细胜率'] = f"{win_rate:.2f}%"
     
     # 平均收益和损失
-    if len(positive_returns) > 0:
-        avg_gain = np.mean(positive_returns) * 100
+    if stats['avg_gain'] is not None:
+        avg_gain = stats['avg_gain'] * 100
         result['平均收益(盈利日)'] = f"{avg_gain:.4f}%"
     else:
         avg_gain = 0
         result['平均收益(盈利日)'] = "N/A"
     
-    if len(negative_returns) > 0:
-        avg_loss = np.mean(negative_returns) * 100
+    if stats['avg_loss'] is not None:
+        avg_loss = stats['avg_loss'] * 100
         result['平均损失(亏损日)'] = f"{avg_loss:.4f}%"
     else:
         avg_loss = 0
@@ -598,28 +518,28 @@ def calculate_win_loss_metrics(daily_returns):
     return result
 
 
-def calculate_rolling_metrics(daily_returns, window=20):
+def calculate_rolling_metrics(daily_returns, window=20, ctx=None):
     """
     计算滚动指标
     
     Parameters:
     daily_returns (array): 日收益率数组
     window (int): 滚动窗口大小
+    ctx (IndicatorContext): 可选，共享的中间结果
     
     Returns:
     dict: 滚动指标
     """
     result = {}
     
-    # 使用pandas的rolling函数
-    returns_series = pd.Series(daily_returns)
-    
-    if len(returns_series) < window:
+    if len(daily_returns) < window:
         result[f"{window}日滚动分析"] = "数据点不足"
         return result
     
-    rolling_mean = returns_series.rolling(window=window).mean()
-    rolling_std = returns_series.rolling(window=window).std()
+    ctx = ctx or IndicatorContext(daily_returns=daily_returns)
+    rolling = ctx.rolling(window)
+    rolling_mean = rolling['mean']
+    rolling_std = rolling['std']
     
     # 最新的滚动指标
     latest_rolling_return = rolling_mean.iloc[-1] * 252 * 100  # 年化
@@ -643,13 +563,14 @@ def calculate_rolling_metrics(daily_returns, window=20):
     return result
 
 
-def calculate_drawdown_metrics(portfolio_values, dates):
+def calculate_drawdown_metrics(portfolio_values, dates, ctx=None):
     """
     计算回撤相关指标
     
     Parameters:
     portfolio_values (array): 投资组合价值数组
     dates (list): 对应的日期列表
+    ctx (IndicatorContext): 可选，共享的中间结果
     
     Returns:
     dict: 回撤相关指标
@@ -660,37 +581,16 @@ def calculate_drawdown_metrics(portfolio_values, dates):
         result['回撤分析'] = "数据点不足"
         return result
     
-    # 初始化
-    peak_value = portfolio_values[0]
-    peak_idx = 0
-    drawdown_start_idx = 0
-    drawdown_end_idx = 0
-    current_drawdown = 0
-    max_drawdown = 0
-    max_drawdown_start_idx = 0
-    max_drawdown_end_idx = 0
-    
-    # 计算每个时间点的回撤
-    drawdowns = []
-    for i, value in enumerate(portfolio_values):
-        # 更新峰值
-        if value > peak_value:
-            peak_value = value
-            peak_idx = i
-        
-        # 计算当前回撤
-        if peak_value > 0:
-            current_drawdown = (peak_value - value) / peak_value
-        else:
-            current_drawdown = 0
-        
-        drawdowns.append(current_drawdown)
-        
-        # 检查是否为新的最大回撤
-        if current_drawdown > max_drawdown:
-            max_drawdown = current_drawdown
-            max_drawdown_start_idx = peak_idx
-            max_drawdown_end_idx = i
+    # 计算每个时间点的回撤，以及回撤对应的峰值位置
+    ctx = ctx or IndicatorContext(total_values=portfolio_values)
+    values = ctx.total_values
+    peak = ctx.running_peak
+    drawdowns = ctx.underwater
+    max_drawdown = float(drawdowns.max())
+    
+    # 最大回撤首次出现的位置及其对应的峰值位置
+    max_drawdown_end_idx = int(np.argmax(drawdowns))
+    max_drawdown_start_idx = int(peak_index(values, peak)[max_drawdown_end_idx])
     
     # 如果有最大回撤，添加详细信息
     if max_drawdown > 0 and max_drawdown_start_idx < len(dates) and max_drawdown_end_idx < len(dates):
@@ -706,11 +606,8 @@ def calculate_drawdown_metrics(portfolio_values, dates):
             result['最大回撤持续时间'] = f"{dd_duration}天"
             
             # 计算恢复期 (如果有)
-            recovery_idx = None
-            for i in range(max_drawdown_end_idx + 1, len(portfolio_values)):
-                if portfolio_values[i] >= portfolio_values[max_drawdown_start_idx]:
-                    recovery_idx = i
-                    break
+            recovered = np.flatnonzero(values[max_drawdown_end_idx + 1:] >= values[max_drawdown_start_idx])
+            recovery_idx = max_drawdown_end_idx + 1 + int(recovered[0]) if len(recovered) > 0 else None
             
             if recovery_idx and recovery_idx < len(dates):
                 recovery_date = dates[recovery_idx]
@@ -727,12 +624,12 @@ def calculate_drawdown_metrics(portfolio_values, dates):
                 result['回撤恢复'] = "尚未恢复到峰值"
     
     # 计算平均回撤和回撤频率
-    if drawdowns:
+    if len(drawdowns) > 0:
         avg_drawdown = np.mean(drawdowns) * 100
         result['平均回撤'] = f"{avg_drawdown:.2f}%"
         
         # 计算有意义的回撤次数 (超过2%的回撤)
-        significant_drawdowns = sum(1 for dd in drawdowns if dd > 0.02)
+        significant_drawdowns = int(np.sum(drawdowns > 0.02))
         result['显著回撤次数(>2%)'] = str(significant_drawdowns)
         
         if len(dates) > 1:
@@ -0,0 +1,284 @@
+"""
+指标计算使用的向量化内核
+
+回撤、连续涨跌和回撤区间划分都基于这里的 NumPy 例程，计算量与数据点数量成线性关系，
+不在 Python 层逐点循环。
+"""
+from bisect import bisect_left, bisect_right, insort
+
+import numpy as np
+
+
+def running_peak(values):
+    """
+    计算截至每个时间点的历史最高值
+
+    Parameters:
+    values (array): 价值序列
+
+    Returns:
+    ndarray: 历史最高值序列
+    """
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return values
+    return np.maximum.accumulate(values)
+
+
+def new_peak_mask(values, peak=None):
+    """
+    标记创出新高（严格高于之前最高值）的时间点，第一个点不算新高
+
+    Parameters:
+    values (array): 价值序列
+    peak (array): 可选，已经计算好的历史最高值序列
+
+    Returns:
+    ndarray: 布尔数组
+    """
+    values = np.asarray(values, dtype=float)
+    if peak is None:
+        peak = running_peak(values)
+    mask = np.zeros(len(values), dtype=bool)
+    if len(values) > 1:
+        mask[1:] = values[1:] > peak[:-1]
+    return mask
+
+
+def peak_index(values, peak=None):
+    """
+    计算每个时间点对应的历史最高值首次出现的位置
+
+    Parameters:
+    values (array): 价值序列
+    peak (array): 可选，已经计算好的历史最高值序列
+
+    Returns:
+    ndarray: 整数位置数组
+    """
+    marks = np.where(new_peak_mask(values, peak), np.arange(len(values)), 0)
+    if len(marks) == 0:
+        return marks
+    return np.maximum.accumulate(marks)
+
+
+def underwater(values, peak=None):
+    """
+    计算水下曲线，即每个时间点相对历史最高值的回撤比例
+
+    历史最高值不为正时回撤记为0
+
+    Parameters:
+    values (array): 价值序列
+    peak (array): 可选，已经计算好的历史最高值序列
+
+    Returns:
+    ndarray: 回撤比例序列，取值 >= 0
+    """
+    values = np.asarray(values, dtype=float)
+    if peak is None:
+        peak = running_peak(values)
+    drawdowns = np.zeros(len(values))
+    positive = peak > 0
+    drawdowns[positive] = (peak[positive] - values[positive]) / peak[positive]
+    return drawdowns
+
+
+def run_lengths(mask):
+    """
+    找出布尔序列中所有连续为真的片段
+
+    Parameters:
+    mask (array): 布尔序列
+
+    Returns:
+    tuple: (每段开始位置数组, 每段长度数组)
+    """
+    mask = np.asarray(mask, dtype=bool)
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.diff(padded.astype(np.int8))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends - starts
+
+
+def segment_episodes(start_mask, end_mask, cancel_mask=None):
+    """
+    按开始/结束/取消条件划分区间（例如回撤区间）
+
+    不在区间内时，第一个满足 start_mask 的点开启区间；区间开启后，之后第一个满足
+    end_mask 的点结束并保留该区间，第一个满足 cancel_mask 的点则丢弃该区间。
+    到序列末尾仍未结束的区间以最后一个点为结束，并标记为未结束。
+
+    Parameters:
+    start_mask (array): 开始条件布尔序列
+    end_mask (array): 结束条件布尔序列
+    cancel_mask (array): 可选，取消条件布尔序列
+
+    Returns:
+    tuple: (开始位置数组, 结束位置数组, 是否未结束的布尔数组)
+    """
+    start_mask = np.asarray(start_mask, dtype=bool)
+    end_mask = np.asarray(end_mask, dtype=bool)
+    if cancel_mask is None:
+        cancel_mask = np.zeros(len(start_mask), dtype=bool)
+    cancel_mask = np.asarray(cancel_mask, dtype=bool)
+    n = len(start_mask)
+
+    candidates = np.flatnonzero(start_mask)
+    if len(candidates) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, np.array([], dtype=bool)
+
+    terminals = np.flatnonzero(end_mask | cancel_mask)
+    # 每个候选开始点之后第一个终止点的序号，同一序号内只有第一个候选点会开启区间
+    block = np.searchsorted(terminals, candidates, side='right')
+    first = np.ones(len(candidates), dtype=bool)
+    first[1:] = block[1:] != block[:-1]
+    starts = candidates[first]
+    block = block[first]
+
+    is_open = block >= len(terminals)
+    ends = np.full(len(starts), n - 1)
+    if len(terminals) > 0:
+        ends[~is_open] = terminals[block[~is_open]]
+
+    keep = is_open | (end_mask[ends] & ~cancel_mask[ends])
+    return starts[keep], ends[keep], is_open[keep]
+
+
+def segment_max(values, starts, ends):
+    """
+    计算多个互不重叠的闭区间 [start, end] 内的最大值
+
+    Parameters:
+    values (array): 数值序列
+    starts (array): 按顺序排列的区间开始位置
+    ends (array): 区间结束位置（包含）
+
+    Returns:
+    ndarray: 每个区间的最大值
+    """
+    values = np.asarray(values, dtype=float)
+    if len(starts) == 0:
+        return np.array([])
+    # 末尾补一个元素，保证 end + 1 始终是合法下标
+    padded = np.append(values, 0.0)
+    bounds = np.column_stack((starts, np.asarray(ends) + 1)).ravel()
+    return np.maximum.reduceat(padded, bounds)[::2]
+
+
+def gini(values):
+    """
+    计算非负数值的基尼系数，0表示完全平均，越接近1越集中
+
+    Parameters:
+    values (array): 非负数值，例如各股票的权重
+
+    Returns:
+    float: 基尼系数，数值全部为0时返回0
+    """
+    values = np.sort(np.asarray(values, dtype=float))
+    n = len(values)
+    total = values.sum()
+    if n == 0 or total <= 0:
+        return 0.0
+    ranks = np.arange(1, n + 1)
+    return float(np.sum((2 * ranks - n - 1) * values) / (n * total))
+
+
+def rolling_window_stats(values, windows):
+    """
+    一次计算多个窗口大小的滚动均值、标准差和胜率
+
+    基于累计和与累计计数，每个窗口的计算量都与数据长度成线性关系，不回调 Python 函数。
+    标准差使用样本标准差 (ddof=1)，与 pandas 的 rolling().std() 一致；
+    窗口内所有值都相同时均值精确等于该值，标准差精确为0。
+
+    Parameters:
+    values (array): 数值序列（例如日收益率）
+    windows (list): 窗口大小列表
+
+    Returns:
+    dict: {窗口大小: {'mean': ndarray, 'std': ndarray, 'win_rate': ndarray}}，
+          各数组与输入等长，前 window-1 个位置为 NaN，win_rate 为正值比例(百分比)
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+
+    # 先减去整体均值再累计，减小大数相减带来的精度损失
+    offset = values.mean() if n > 0 else 0.0
+    centered = values - offset
+    sum_1 = np.concatenate(([0.0], np.cumsum(centered)))
+    sum_2 = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    positives = np.concatenate(([0], np.cumsum(values > 0)))
+    # 相邻两个值不同的次数，用于识别所有值都相同的窗口
+    changes = np.concatenate(([0, 0], np.cumsum(values[1:] != values[:-1]))) if n > 1 else np.zeros(n + 1, dtype=int)
+
+    stats = {}
+    for window in dict.fromkeys(windows):
+        mean = np.full(n, np.nan)
+        std = np.full(n, np.nan)
+        win_rate = np.full(n, np.nan)
+        if 0 < window <= n:
+            ends = np.arange(window, n + 1)
+            starts = ends - window
+            window_sum = sum_1[ends] - sum_1[starts]
+            window_mean = window_sum / window
+            constant = (changes[ends] - changes[starts + 1]) == 0
+            mean[window - 1:] = np.where(constant, values[starts], window_mean + offset)
+            if window > 1:
+                variance = (sum_2[ends] - sum_2[starts] - window_sum * window_mean) / (window - 1)
+                variance = np.maximum(variance, 0.0)
+                variance[constant] = 0.0
+                std[window - 1:] = np.sqrt(variance)
+            win_rate[window - 1:] = (positives[ends] - positives[starts]) / window * 100
+        stats[window] = {'mean': mean, 'std': std, 'win_rate': win_rate}
+    return stats
+
+
+def rolling_tail_risk(values, window, levels):
+    """
+    计算滚动窗口的历史VaR和CVaR
+
+    维护一个有序的滑动窗口：每前进一步用二分查找删除移出窗口的值、插入新值，
+    不对每个窗口重新排序。VaR 为窗口内 1-置信度 分位数（与 np.percentile 默认的线性插值一致），
+    CVaR 为窗口内不高于 VaR 的值的均值。输入中不应包含 NaN。
+
+    Parameters:
+    values (array): 数值序列（例如日收益率）
+    window (int): 窗口大小
+    levels (list): 置信度列表，例如 [0.95, 0.99]
+
+    Returns:
+    dict: {置信度: {'var': ndarray, 'cvar': ndarray}}，各数组与输入等长，前 window-1 个位置为 NaN
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    levels = list(dict.fromkeys(levels))
+    result = {level: {'var': np.full(n, np.nan), 'cvar': np.full(n, np.nan)} for level in levels}
+    if window <= 0 or window > n:
+        return result
+
+    # 每个置信度对应的分位数位置在所有窗口中相同，提前算好插值的上下标和权重
+    positions = []
+    for level in levels:
+        position = (1 - level) * (window - 1)
+        lower = int(np.floor(position))
+        positions.append((result[level], lower, min(lower + 1, window - 1), position - lower))
+
+    data = values.tolist()
+    ordered = sorted(data[:window])
+    for end in range(window - 1, n):
+        if end >= window:
+            del ordered[bisect_left(ordered, data[end - window])]
+            insort(ordered, data[end])
+        for series, lower, upper, t in positions:
+            a = ordered[lower]
+            b = ordered[upper]
+            # 与 numpy 的 _lerp 相同，t >= 0.5 时从上端插值
+            var = b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+            count = bisect_right(ordered, var)
+            series['var'][end] = var
+            series['cvar'][end] = sum(ordered[:count]) / count
+    return result
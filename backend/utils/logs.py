@@ -0,0 +1,84 @@
+"""
+日志配置
+
+所有模块通过 logging.getLogger(__name__) 记录日志，默认只输出 WARNING 及以上级别，
+正常请求不产生日志。通过环境变量调整：
+- LOG_LEVEL: DEBUG/INFO/WARNING/ERROR，INFO 时每个请求输出一条包含各阶段耗时的日志
+- LOG_FORMAT: text（默认，便于阅读）或 json（每行一个 JSON 对象，便于日志系统检索）
+
+每条日志都带有当前请求的ID；调用时通过 extra 传入的字段在 json 格式中作为独立的键输出，
+在 text 格式中以 key=value 的形式附在消息之后。
+"""
+import json
+import logging
+
+from .config import LOG_LEVEL, LOG_FORMAT
+from .tracing import current_request_id
+
+# LogRecord 自带的属性，其余属性来自调用时的 extra
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+
+class RequestContextFilter(logging.Filter):
+    """给日志记录加上当前请求的ID"""
+
+    def filter(self, record):
+        record.request_id = current_request_id() or '-'
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """时间 级别 模块 [请求ID] 消息 key=value ..."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            # 异常堆栈在第一行之后，字段附在第一行末尾
+            first, _, rest = text.partition('\n')
+            first += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+            text = first + ('\n' + rest if rest else '')
+        return text
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """
+    配置根日志记录器，重复调用时更新级别和格式
+
+    Parameters:
+    level (str): 日志级别
+    fmt (str): text 或 json
+    """
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    handler = next((h for h in root.handlers if getattr(h, '_portfolio_handler', False)), None)
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler._portfolio_handler = True
+        handler.addFilter(RequestContextFilter())
+        root.addHandler(handler)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
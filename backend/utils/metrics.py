@@ -0,0 +1,193 @@
+"""
+Prometheus 格式的运行指标
+
+一个很小的指标注册表，不依赖 prometheus_client：
+- Counter: 只增不减的计数，例如上游下载次数、缓存命中次数
+- Histogram: 分桶统计的耗时分布，例如每个接口的延迟、每个计算阶段的耗时
+- CallbackMetric: 输出时调用函数读取当前值，例如内存中价格数据的字节数
+
+指标可以带标签，记录时以关键字参数传入标签值：
+
+    UPSTREAM_FETCHES.inc(provider='yfinance', symbol='AAPL')
+
+GET /metrics 返回 registry.render() 的文本。
+"""
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 接口延迟的分桶（秒）
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 计算阶段耗时的分桶（秒），比接口延迟细
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """按注册顺序保存指标，线程安全"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标已经注册: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """
+        输出 Prometheus 文本格式
+
+        Returns:
+        str: 所有指标的当前值
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # 一个指标读取失败不影响其他指标
+                logger.warning("读取指标 %s 失败: %s", metric.name, e)
+                continue
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, labels, value in samples:
+                lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# 服务使用的指标注册表
+registry = MetricsRegistry()
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=registry):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 的标签应为: {', '.join(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key):
+        return list(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield '', self._labels(key), value
+
+
+class Histogram(_Metric):
+    """分桶统计的数值分布"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS, registry=registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # 每个桶各自的计数（最后一个为 +Inf），输出时再累加
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            state['counts'][index] += 1
+            state['sum'] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(state['counts']), state['sum']) for key, state in self._values.items())
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield '_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, cumulative
+
+
+class CallbackMetric(_Metric):
+    """
+    输出时读取当前值的指标
+
+    Parameters:
+    collect (callable): 无标签时返回数值，有标签时返回 {标签值元组: 数值}
+    kind (str): gauge 或 counter
+    """
+
+    def __init__(self, name, documentation, collect, kind='gauge', labelnames=(), registry=registry):
+        super().__init__(name, documentation, labelnames, registry)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self):
+        values = self.collect()
+        if not self.labelnames:
+            yield '', [], values
+            return
+        for key, value in sorted(values.items()):
+            yield '', self._labels(tuple(str(item) for item in key)), value
+
+
+REQUEST_DURATION = Histogram('portfolio_http_request_duration_seconds', '每个接口的请求处理时间',
+                             ('method', 'route', 'status'), buckets=REQUEST_BUCKETS)
+STAGE_DURATION = Histogram('portfolio_stage_duration_seconds', '估值和指标计算各阶段的耗时',
+                           ('stage',), buckets=STAGE_BUCKETS)
+UPSTREAM_FETCHES = Counter('portfolio_upstream_fetches_total', '向上游数据源请求价格数据的次数，按股票统计',
+                           ('provider', 'symbol'))
+UPSTREAM_DURATION = Histogram('portfolio_upstream_request_duration_seconds', '上游数据源请求的耗时（含等待并发名额）',
+                              ('provider',), buckets=REQUEST_BUCKETS)
+CACHE_HITS = Counter('portfolio_cache_hits_total', '缓存命中次数', ('cache',))
+CACHE_MISSES = Counter('portfolio_cache_misses_total', '缓存未命中次数', ('cache',))
@@ -0,0 +1,455 @@
+"""
+指标计算流水线
+
+IndicatorContext 保存一次指标计算中所有指标共享的中间结果（日收益率、负收益、历史最高值、
+各阶矩、排序后的收益率等）。中间结果按需计算并缓存，同一次请求内每个中间结果只计算一次。
+
+指标按组注册，每组声明自己依赖的中间结果，流水线先准备这些中间结果再依次计算各组指标。
+"""
+import logging
+from collections import OrderedDict
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from .kernels import running_peak, new_peak_mask, underwater, run_lengths, rolling_window_stats, rolling_tail_risk
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 无风险利率 (假设为2%)
+RISK_FREE_RATE = 0.02
+# 每年交易日数量
+TRADING_DAYS = 252
+# 默认的滚动窗口
+DEFAULT_ROLLING_WINDOWS = (20, 60)
+# 单次请求允许的滚动窗口数量和最大窗口
+MAX_ROLLING_WINDOWS = 10
+MAX_ROLLING_WINDOW_SIZE = 2520
+# 默认的滚动VaR/CVaR窗口和置信度
+DEFAULT_VAR_WINDOW = 60
+DEFAULT_VAR_LEVELS = (0.95, 0.99)
+# 单次请求允许的置信度数量
+MAX_VAR_LEVELS = 5
+
+
+def quantile_sorted(sorted_values, q):
+    """
+    在已排序的数组上计算分位数，结果与 np.percentile 默认的线性插值一致
+
+    Parameters:
+    sorted_values (ndarray): 升序排列的数组
+    q (float): 分位数，取值 0~1
+
+    Returns:
+    float: 分位数
+    """
+    n = len(sorted_values)
+    position = q * (n - 1)
+    lower = int(np.floor(position))
+    upper = min(lower + 1, n - 1)
+    t = position - lower
+    a = sorted_values[lower]
+    b = sorted_values[upper]
+    diff = b - a
+    # 与 numpy 的 _lerp 相同，t >= 0.5 时从上端插值以减小舍入误差
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+class IndicatorContext:
+    """
+    一次指标计算共享的中间结果
+
+    可以由完整的投资组合价值数据构建，也可以只提供日收益率或价值序列，
+    供单独调用某个指标函数时使用
+    """
+
+    def __init__(self, portfolio_value_df=None, transactions=(), daily_returns=None, total_values=None, dates=None,
+                 rolling_windows=None, var_window=None, var_levels=None):
+        self.portfolio_value_df = portfolio_value_df
+        self.transactions = list(transactions or [])
+        self.rolling_windows = list(dict.fromkeys(rolling_windows or DEFAULT_ROLLING_WINDOWS))
+        self.var_window = var_window or DEFAULT_VAR_WINDOW
+        self.var_levels = list(dict.fromkeys(var_levels or DEFAULT_VAR_LEVELS))
+        self._daily_returns = daily_returns
+        self._total_values = total_values
+        self._dates = dates
+        self._rolling = {}
+        self._tail_risk = {}
+
+    # ---- 价值与日期 ----
+
+    @cached_property
+    def total_values(self):
+        if self._total_values is not None:
+            return np.asarray(self._total_values, dtype=float)
+        return self.portfolio_value_df['TotalValue'].values
+
+    @cached_property
+    def dates(self):
+        """日期序列 (Timestamp)"""
+        if self._dates is not None:
+            return pd.Series(pd.to_datetime(self._dates))
+        if self.portfolio_value_df is not None and 'Date' in self.portfolio_value_df.columns:
+            return pd.to_datetime(self.portfolio_value_df['Date'])
+        # 没有日期列时创建一个默认的日期范围
+        logger.warning("没有找到Date列，使用默认日期范围")
+        start_date = pd.Timestamp('2020-01-01')
+        end_date = start_date + pd.Timedelta(days=len(self.total_values) - 1)
+        return pd.Series(pd.date_range(start=start_date, end=end_date, periods=len(self.total_values)))
+
+    @cached_property
+    def date_labels(self):
+        """原始的日期列（字符串）"""
+        if self.portfolio_value_df is not None and 'Date' in self.portfolio_value_df.columns:
+            return self.portfolio_value_df['Date'].tolist()
+        return self.dates.tolist()
+
+    @cached_property
+    def first_date(self):
+        return self.dates.iloc[0]
+
+    @cached_property
+    def last_date(self):
+        # 使用.iloc来安全地访问最后一个元素，而不是使用负索引
+        return self.dates.iloc[len(self.dates) - 1]
+
+    @cached_property
+    def days(self):
+        return (self.last_date - self.first_date).days
+
+    # ---- 投资与收益 ----
+
+    @cached_property
+    def initial_investment(self):
+        initial_investment = sum(tx.quantity * tx.buy_price for tx in self.transactions)
+        if initial_investment <= 0:
+            logger.warning("初始投资为零或负值")
+            initial_investment = 1.0  # 防止除以零错误
+        return initial_investment
+
+    @cached_property
+    def final_value(self):
+        if len(self.total_values) == 0:
+            logger.warning("总价值数组为空")
+            return 0.0
+        final_value = self.total_values[-1]
+        if final_value < 0:
+            logger.warning("最终价值为负")
+            final_value = 0.0
+        return final_value
+
+    @cached_property
+    def total_return(self):
+        """总收益率（小数）"""
+        return (self.final_value - self.initial_investment) / self.initial_investment
+
+    @cached_property
+    def annualized_return(self):
+        """年化收益率（百分比，按365天/年），无法计算时为None"""
+        days = self.days
+        if days > 0 and self.initial_investment > 0 and self.final_value > 0:
+            years = days / 365.0
+            # 避免负数导致的复数结果
+            if self.final_value > self.initial_investment:
+                return ((self.final_value / self.initial_investment) ** (1 / years) - 1) * 100
+            # 负收益，使用简单年化计算
+            return ((self.final_value - self.initial_investment) / self.initial_investment) * (365.0 / days) * 100
+        return None
+
+    @cached_property
+    def cagr(self):
+        """复合年增长率（小数，按365.25天/年）"""
+        time_diff = self.days / 365.25
+        if time_diff > 0.01 and self.initial_investment > 0 and self.final_value > 0:
+            if self.final_value > self.initial_investment:
+                return (1 + self.total_return) ** (1 / time_diff) - 1
+            return ((self.final_value - self.initial_investment) / self.initial_investment) * (365.0 / self.days)
+        return 0
+
+    # ---- 日收益率 ----
+
+    @cached_property
+    def return_index(self):
+        """参与计算日收益率的前一日位置（前一日价值为正）"""
+        daily_values = self.total_values
+        if len(daily_values) < 2:
+            return np.array([], dtype=int)
+        # 确保没有零值或负值导致无法计算
+        return np.where(daily_values[:-1] > 0)[0]
+
+    @cached_property
+    def daily_returns(self):
+        if self._daily_returns is not None:
+            return np.asarray(self._daily_returns, dtype=float)
+        daily_values = self.total_values
+        if len(daily_values) < 2:
+            return np.array([])
+        valid_indices = self.return_index
+        if len(valid_indices) == 0:
+            logger.warning("没有足够的有效价值来计算每日回报率")
+            return np.array([])
+        valid_values_prev = daily_values[valid_indices]
+        valid_values_next = daily_values[valid_indices + 1]
+        return (valid_values_next - valid_values_prev) / valid_values_prev
+
+    @cached_property
+    def return_dates(self):
+        """每个日收益率对应的日期标签，只提供日收益率时为None"""
+        if self._daily_returns is not None:
+            return None
+        labels = self.date_labels
+        return [labels[i + 1] for i in self.return_index]
+
+    @cached_property
+    def positive_returns(self):
+        return self.daily_returns[self.daily_returns > 0]
+
+    @cached_property
+    def negative_returns(self):
+        return self.daily_returns[self.daily_returns < 0]
+
+    @cached_property
+    def sorted_returns(self):
+        return np.sort(self.daily_returns)
+
+    @cached_property
+    def moments(self):
+        """日收益率的均值和标准差"""
+        returns = self.daily_returns
+        if len(returns) == 0:
+            return {'mean': np.nan, 'std': np.nan}
+        return {'mean': np.mean(returns), 'std': np.std(returns)}
+
+    @cached_property
+    def downside_std(self):
+        """负收益的标准差，没有负收益时为0"""
+        if len(self.negative_returns) == 0:
+            return 0.0
+        return np.std(self.negative_returns)
+
+    @cached_property
+    def win_loss(self):
+        """胜率(百分比)、平均盈利和平均亏损"""
+        returns = self.daily_returns
+        return {
+            'win_rate': len(self.positive_returns) / len(returns) * 100 if len(returns) > 0 else np.nan,
+            'avg_gain': np.mean(self.positive_returns) if len(self.positive_returns) > 0 else None,
+            'avg_loss': np.mean(self.negative_returns) if len(self.negative_returns) > 0 else None,
+        }
+
+    @cached_property
+    def streaks(self):
+        """每段连续上涨/下跌的天数"""
+        return {
+            'up': run_lengths(self.daily_returns > 0)[1],
+            'down': run_lengths(self.daily_returns < 0)[1],
+        }
+
+    def rolling_stats(self, windows):
+        """
+        多个窗口的滚动均值、标准差和胜率，尚未计算的窗口在一次遍历中全部完成
+
+        Parameters:
+        windows (list): 窗口大小列表
+
+        Returns:
+        dict: {窗口大小: {'mean': Series, 'std': Series, 'win_rate': Series}}
+        """
+        missing = [window for window in windows if window not in self._rolling]
+        if missing:
+            for window, stats in rolling_window_stats(self.daily_returns, missing).items():
+                self._rolling[window] = {name: pd.Series(values) for name, values in stats.items()}
+        return {window: self._rolling[window] for window in windows}
+
+    def rolling(self, window):
+        """
+        单个窗口的滚动均值、标准差和胜率，同一窗口只计算一次
+
+        Parameters:
+        window (int): 窗口大小
+
+        Returns:
+        dict: {'mean': Series, 'std': Series, 'win_rate': Series}
+        """
+        return self.rolling_stats([window])[window]
+
+    def tail_risk(self, window, levels):
+        """
+        滚动窗口的VaR和CVaR序列，同一窗口和置信度只计算一次
+
+        Parameters:
+        window (int): 窗口大小
+        levels (list): 置信度列表
+
+        Returns:
+        dict: {置信度: {'var': Series, 'cvar': Series}}
+        """
+        cached = self._tail_risk.setdefault(window, {})
+        missing = [level for level in levels if level not in cached]
+        if missing:
+            for level, series in rolling_tail_risk(self.daily_returns, window, missing).items():
+                cached[level] = {name: pd.Series(values) for name, values in series.items()}
+        return {level: cached[level] for level in levels}
+
+    # ---- 回撤 ----
+
+    @cached_property
+    def running_peak(self):
+        return running_peak(self.total_values)
+
+    @cached_property
+    def new_peak(self):
+        return new_peak_mask(self.total_values, self.running_peak)
+
+    @cached_property
+    def underwater(self):
+        return underwater(self.total_values, self.running_peak)
+
+    @cached_property
+    def max_drawdown(self):
+        """最大回撤比例"""
+        if len(self.total_values) < 2:
+            return 0.0
+        return max(0.0, float(np.max(self.underwater)))
+
+    # ---- 持仓 ----
+
+    @cached_property
+    def latest_values(self):
+        """各股票的最新价值"""
+        latest_values = {}
+        df = self.portfolio_value_df
+        if df is None:
+            return latest_values
+        for symbol in df.columns:
+            if symbol not in ['Date', 'TotalValue']:
+                try:
+                    latest_values[symbol] = float(df[symbol].iloc[-1])
+                except Exception as e:
+                    logger.warning("获取 %s 最新价值时出错: %s", symbol, e)
+                    latest_values[symbol] = 0.0
+        return latest_values
+
+    def prepare(self, names):
+        """预先计算指定的中间结果"""
+        for name in names:
+            getattr(self, name)
+
+
+class IndicatorGroup:
+    """一组指标及其依赖的中间结果"""
+
+    def __init__(self, name, func, requires, default=True, description=''):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.default = default
+        self.description = description
+
+    def compute(self, ctx):
+        ctx.prepare(self.requires)
+        return self.func(ctx)
+
+
+# 已注册的指标组，按注册顺序计算
+INDICATOR_GROUPS = OrderedDict()
+
+
+def indicator_group(name, requires=(), default=True):
+    """
+    注册指标组的装饰器
+
+    被装饰的函数接收 IndicatorContext，返回该组的指标字典，函数的文档字符串作为指标组说明
+
+    Parameters:
+    name (str): 指标组名称
+    requires (tuple): 依赖的中间结果名称
+    default (bool): 请求未指定指标组时是否计算该组
+    """
+    def decorator(func):
+        description = (func.__doc__ or '').strip().splitlines()[0] if func.__doc__ else ''
+        INDICATOR_GROUPS[name] = IndicatorGroup(name, func, requires, default, description)
+        return func
+    return decorator
+
+
+def default_indicator_groups():
+    """返回默认计算的指标组名称"""
+    return [name for name, group in INDICATOR_GROUPS.items() if group.default]
+
+
+def validate_indicator_groups(groups):
+    """
+    检查指标组名称是否都已注册
+
+    Parameters:
+    groups (list): 指标组名称
+
+    Raises:
+    ValueError: 存在未知的指标组
+    """
+    unknown = [name for name in groups if name not in INDICATOR_GROUPS]
+    if unknown:
+        raise ValueError(f"未知的指标组: {', '.join(unknown)}, 可选: {', '.join(INDICATOR_GROUPS)}")
+
+
+def validate_rolling_windows(windows):
+    """
+    检查滚动窗口设置是否合法
+
+    Parameters:
+    windows (list): 窗口大小列表
+
+    Raises:
+    ValueError: 窗口数量过多或窗口大小超出范围
+    """
+    if len(windows) > MAX_ROLLING_WINDOWS:
+        raise ValueError(f"滚动窗口最多 {MAX_ROLLING_WINDOWS} 个")
+    invalid = [window for window in windows if window < 2 or window > MAX_ROLLING_WINDOW_SIZE]
+    if invalid:
+        raise ValueError(f"滚动窗口大小必须在 2 到 {MAX_ROLLING_WINDOW_SIZE} 之间: {invalid}")
+
+
+def validate_var_settings(window=None, levels=None):
+    """
+    检查滚动VaR/CVaR的窗口和置信度设置是否合法
+
+    Parameters:
+    window (int): 窗口大小
+    levels (list): 置信度列表
+
+    Raises:
+    ValueError: 窗口大小或置信度超出范围
+    """
+    if window is not None and (window < 2 or window > MAX_ROLLING_WINDOW_SIZE):
+        raise ValueError(f"VaR窗口大小必须在 2 到 {MAX_ROLLING_WINDOW_SIZE} 之间: {window}")
+    if levels is not None:
+        if len(levels) > MAX_VAR_LEVELS:
+            raise ValueError(f"VaR置信度最多 {MAX_VAR_LEVELS} 个")
+        invalid = [level for level in levels if not 0.5 <= level < 1]
+        if invalid:
+            raise ValueError(f"VaR置信度必须在 0.5 到 1 之间（不含1）: {invalid}")
+
+
+def iter_indicator_groups(ctx, groups=None):
+    """
+    依次计算指标组，每计算完一组就返回该组结果
+
+    只有被选中的指标组会执行，中间结果也只在被这些组用到时才计算
+
+    Parameters:
+    ctx (IndicatorContext): 共享的中间结果
+    groups (list): 需要计算的指标组名称，None 表示默认指标组，空列表表示不计算
+
+    Yields:
+    tuple: (指标组名称, 该组的指标字典)
+    """
+    selected = default_indicator_groups() if groups is None else groups
+    validate_indicator_groups(selected)
+    for name, group in INDICATOR_GROUPS.items():
+        if name in selected:
+            with span(f'indicators.{name}'):
+                result = group.compute(ctx)
+            yield name, result
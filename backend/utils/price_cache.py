@@ -0,0 +1,321 @@
+"""
+本地价格缓存
+
+按股票代码把OHLCV历史数据保存在磁盘上（存储后端见 price_store），并记录已经覆盖过的日期区间。
+请求某个日期区间时只向上游下载缺失的部分，合并后写回，其余部分直接从本地读取。
+
+日期区间统一使用左闭右开 [start, end)，与 yfinance 的 start/end 参数含义一致。
+当天及以后的数据可能还会变化，只在 PRICE_CACHE_TTL 秒内视为有效。
+上游没有返回任何数据的区间可能是节假日、上市之前，也可能是被吞掉的网络错误，只在 PRICE_CACHE_NEGATIVE_TTL 秒内视为已覆盖。
+"""
+import uuid
+import logging
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+from .config import PRICE_CACHE_ENABLED, PRICE_CACHE_TTL, PRICE_CACHE_NEGATIVE_TTL
+from .providers import split_histories
+from .singleflight import KeyedLocks
+from .price_store import get_store, symbol_file_locks
+from .metrics import CACHE_HITS, CACHE_MISSES
+
+logger = logging.getLogger(__name__)
+
+# 读-改-写缓存时使用的锁，每只股票一把，不同股票的下载可以同时进行；
+# 进程之间再通过 symbol_file_locks 互斥
+_symbol_locks = KeyedLocks()
+
+# 关闭本地价格缓存时每只股票的价格版本号，每次收到新的价格数据时加一。
+# 启用缓存时版本号保存在价格存储的元数据中（见 get_price_versions）
+_price_versions = {}
+_versions_lock = threading.Lock()
+
+
+def bump_price_versions(symbols):
+    """
+    记录股票收到了新的价格数据，只用于关闭本地价格缓存时
+
+    Parameters:
+    symbols (list): 股票代码列表
+    """
+    with _versions_lock:
+        for symbol in symbols:
+            _price_versions[symbol] = _price_versions.get(symbol, 0) + 1
+
+
+def get_price_versions(symbols):
+    """
+    返回股票当前的价格版本号，用于让依赖这些价格的计算结果和 ETag 失效
+
+    启用本地价格缓存时读取价格存储元数据中的版本号（见 load_versions），每次写入新数据时更换，
+    同一个存储的所有 worker 进程以及重启前后得到相同的值；
+    关闭缓存时没有共享的状态，使用进程内的计数
+
+    Parameters:
+    symbols (list): 股票代码列表
+
+    Returns:
+    dict: {股票代码: 版本号}，从未收到过新数据的股票为0
+    """
+    if not PRICE_CACHE_ENABLED:
+        with _versions_lock:
+            return {symbol: _price_versions.get(symbol, 0) for symbol in symbols}
+
+    try:
+        return get_store().load_versions(symbols)
+    except Exception as e:
+        logger.warning("读取 %s 的价格版本号失败: %s", ', '.join(symbols), e)
+        return {symbol: 0 for symbol in symbols}
+
+
+def _to_day(value):
+    """把字符串/日期统一转换为不含时区的日期Timestamp"""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.normalize()
+
+
+def load_cached_history(symbol):
+    """
+    读取股票的本地缓存
+
+    Parameters:
+    symbol (str): 股票代码
+
+    Returns:
+    tuple: (DataFrame 历史数据, dict 覆盖区间元数据)
+    """
+    store = get_store()
+    try:
+        return store.read(symbol), store.load_meta(symbol)
+    except Exception as e:
+        logger.warning("读取 %s 的价格缓存失败, 将重新下载: %s", symbol, e)
+        return pd.DataFrame(), {'stable': [], 'volatile': []}
+
+
+def merge_ranges(ranges):
+    """
+    合并重叠或相邻的日期区间
+
+    Parameters:
+    ranges (list): [(start, end), ...] 左闭右开区间
+
+    Returns:
+    list: 合并后按开始日期排序的区间列表
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def find_missing_ranges(covered, start, end):
+    """
+    计算 [start, end) 中没有被 covered 覆盖的子区间
+
+    Parameters:
+    covered (list): 已覆盖的区间列表
+    start (Timestamp): 开始日期
+    end (Timestamp): 结束日期（不含）
+
+    Returns:
+    list: 缺失的区间列表
+    """
+    missing = []
+    cursor = start
+    for range_start, range_end in merge_ranges(covered):
+        if range_end <= cursor:
+            continue
+        if range_start >= end:
+            break
+        if range_start > cursor:
+            missing.append((cursor, range_start))
+        cursor = max(cursor, range_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+
+def _has_weekday(start, end):
+    """[start, end) 中是否包含工作日"""
+    return len(pd.bdate_range(start, end - pd.Timedelta(days=1))) > 0
+
+
+def _covered_ranges(meta, now=None):
+    """从元数据中取出当前仍然有效的覆盖区间"""
+    now = now or datetime.now()
+    today = now.strftime('%Y-%m-%d')
+    covered = [(_to_day(s), _to_day(e)) for s, e in meta.get('stable', [])]
+
+    for item in meta.get('volatile', []):
+        fetched_at = datetime.fromisoformat(item['fetched_at'])
+        if item.get('empty'):
+            # 上游返回空数据的区间只在较短的TTL内有效
+            if (now - fetched_at).total_seconds() < PRICE_CACHE_NEGATIVE_TTL:
+                covered.append((_to_day(item['start']), _to_day(item['end'])))
+        # 当天数据只在同一天且TTL内有效
+        elif fetched_at.strftime('%Y-%m-%d') == today and (now - fetched_at).total_seconds() < PRICE_CACHE_TTL:
+            covered.append((_to_day(item['start']), _to_day(item['end'])))
+
+    return covered
+
+
+def _record_fetched_range(meta, start, end, now=None):
+    """把新下载的区间记录到元数据中，当天及以后的部分记为易变区间"""
+    now = now or datetime.now()
+    today = _to_day(now)
+
+    stable = [(_to_day(s), _to_day(e)) for s, e in meta.get('stable', [])]
+    if start < today:
+        stable.append((start, min(end, today)))
+    meta['stable'] = [[s.strftime('%Y-%m-%d'), e.strftime('%Y-%m-%d')] for s, e in merge_ranges(stable)]
+
+    volatile = _live_volatile(meta, now)
+    if end > today:
+        volatile.append({
+            'start': max(start, today).strftime('%Y-%m-%d'),
+            'end': end.strftime('%Y-%m-%d'),
+            'fetched_at': now.isoformat()
+        })
+    meta['volatile'] = volatile
+
+
+def _live_volatile(meta, now):
+    """丢弃已经过期的易变区间"""
+    volatile = []
+    for item in meta.get('volatile', []):
+        fetched_at = datetime.fromisoformat(item['fetched_at'])
+        if item.get('empty'):
+            if (now - fetched_at).total_seconds() < PRICE_CACHE_NEGATIVE_TTL:
+                volatile.append(item)
+        elif fetched_at.date() == now.date():
+            volatile.append(item)
+    return volatile
+
+
+def _record_empty_range(meta, start, end, now=None):
+    """
+    把上游返回空数据的区间记为短期覆盖
+
+    yfinance 遇到网络错误或限流时不抛出异常而是返回空数据，这样的区间如果记为稳定区间，
+    这只股票在这段时间内会一直没有价格，所以只在 PRICE_CACHE_NEGATIVE_TTL 秒内不再重复请求
+    """
+    now = now or datetime.now()
+    volatile = _live_volatile(meta, now)
+    volatile.append({
+        'start': start.strftime('%Y-%m-%d'),
+        'end': end.strftime('%Y-%m-%d'),
+        'fetched_at': now.isoformat(),
+        'empty': True,
+    })
+    meta['volatile'] = volatile
+
+
+def get_history(symbol, start_date, end_date, provider):
+    """
+    获取股票在 [start_date, end_date) 内的历史数据，优先使用本地缓存
+
+    Parameters:
+    symbol (str): 股票代码
+    start_date (str): 开始日期 (YYYY-MM-DD)
+    end_date (str): 结束日期 (YYYY-MM-DD)，不包含
+    provider (PriceProvider): 缓存缺失时使用的数据源
+
+    Returns:
+    DataFrame: 以日期为索引的历史数据
+    """
+    return get_history_many([symbol], start_date, end_date, provider)[symbol]
+
+
+def get_history_many(symbols, start_date, end_date, provider):
+    """
+    批量获取多只股票在 [start_date, end_date) 内的历史数据，优先使用本地缓存
+
+    所有存在缺失区间的股票合并成一次 fetch_many 请求，下载区间为这些缺失区间的外包区间
+
+    Parameters:
+    symbols (list): 股票代码列表
+    start_date (str): 开始日期 (YYYY-MM-DD)
+    end_date (str): 结束日期 (YYYY-MM-DD)，不包含
+    provider (PriceProvider): 缓存缺失时使用的数据源
+
+    Returns:
+    dict: {股票代码: DataFrame}
+    """
+    start = _to_day(start_date)
+    end = _to_day(end_date)
+    symbols = list(dict.fromkeys(symbols))
+    if start >= end:
+        return {symbol: pd.DataFrame() for symbol in symbols}
+
+    store = get_store()
+    # 写入缓存失败时直接使用新下载的数据
+    unsaved = {}
+    with _symbol_locks.hold(symbols), symbol_file_locks(symbols):
+        metas = {}
+        missing = {}
+        for symbol in symbols:
+            try:
+                meta = store.load_meta(symbol)
+            except Exception as e:
+                logger.warning("读取 %s 的价格缓存失败, 将重新下载: %s", symbol, e)
+                meta = {'stable': [], 'volatile': []}
+            metas[symbol] = meta
+            # 只包含周末的缺失区间上游不会返回数据，不需要下载
+            gaps = [gap for gap in find_missing_ranges(_covered_ranges(meta), start, end) if _has_weekday(*gap)]
+            if gaps:
+                missing[symbol] = gaps
+                CACHE_MISSES.inc(cache='price_store')
+            else:
+                CACHE_HITS.inc(cache='price_store')
+
+        if missing:
+            fetch_start = min(gaps[0][0] for gaps in missing.values())
+            fetch_end = max(gaps[-1][1] for gaps in missing.values())
+            try:
+                fetched = provider.fetch_many(list(missing), fetch_start.strftime('%Y-%m-%d'), fetch_end.strftime('%Y-%m-%d'))
+                fetched = split_histories(fetched, list(missing))
+            except Exception as e:
+                # 下载失败时不记录覆盖区间，下次请求时重新下载
+                logger.warning("下载 %s 在 %s 到 %s 的数据失败: %s", ', '.join(missing), fetch_start.date(), fetch_end.date(), e)
+                fetched = None
+
+            for symbol, new_data in (fetched or {}).items():
+                meta = metas[symbol]
+                if new_data.empty:
+                    # 没有数据的区间（节假日、上市之前或被吞掉的下载错误）短时间内不再重复请求
+                    _record_empty_range(meta, fetch_start, fetch_end)
+                else:
+                    _record_fetched_range(meta, fetch_start, fetch_end)
+                    # 版本号与数据在同一次写入中更新，其他进程读到新数据时也读到新的版本号
+                    meta['version'] = uuid.uuid4().hex[:16]
+                try:
+                    store.write(symbol, new_data, meta)
+                except Exception as e:
+                    logger.warning("写入 %s 的价格缓存失败: %s", symbol, e)
+                    unsaved[symbol] = new_data
+
+    histories = {}
+    for symbol in symbols:
+        try:
+            data = store.read(symbol, start, end)
+        except Exception as e:
+            logger.warning("读取 %s 的价格缓存失败: %s", symbol, e)
+            data = pd.DataFrame()
+        if symbol in unsaved and not unsaved[symbol].empty:
+            new_data = unsaved[symbol]
+            new_data = new_data[(new_data.index >= start) & (new_data.index < end)]
+            data = pd.concat([data, new_data]) if not data.empty else new_data
+            data = data[~data.index.duplicated(keep='last')].sort_index()
+        histories[symbol] = data
+    return histories
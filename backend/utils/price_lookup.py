@@ -0,0 +1,189 @@
+"""
+按日期查询收盘价
+
+填写交易表单时会对同一只股票的不同日期反复查询价格。这里为每只股票在内存中保存一段收盘价历史，
+查询时用二分查找定位不晚于该日期的最近一个交易日；缓存没有覆盖的日期一次下载前后一段较宽的区间，
+之后附近的日期都直接命中。覆盖当天的区间与价格缓存一样只在 PRICE_CACHE_TTL 秒内有效。
+上游没有返回任何数据的区间（无效或已退市的代码、区间内没有成交，也可能是上游暂时不可用）
+只在 PRICE_LOOKUP_NEGATIVE_TTL 秒内视为已覆盖，无效代码的查询不会每次都重新下载整个区间。
+
+异步查询（get_close_async）在事件循环中等待下载，不占用下载线程池的线程：
+等待共享下载的请求如果占住下载线程，发起下载的异步请求排在同一个线程池中的任务就可能永远得不到执行。
+"""
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .config import PRICE_CACHE_TTL, PRICE_LOOKUP_WINDOW_DAYS, PRICE_LOOKUP_MAX_SYMBOLS, PRICE_LOOKUP_NEGATIVE_TTL
+from .price_cache import merge_ranges
+from .metrics import CACHE_HITS, CACHE_MISSES
+
+# 向前查找最近交易日的最大天数（覆盖长假）
+MAX_LOOKBACK_DAYS = 10
+# 下载区间按固定网格对齐的起点
+_GRID_ORIGIN = pd.Timestamp('1970-01-01')
+
+
+class PriceLookup:
+    """
+    每只股票一段内存中的收盘价历史，按最近使用顺序淘汰
+
+    Parameters:
+    fetch (callable): fetch(symbol, start_date, end_date) 返回 [start_date, end_date) 内的历史数据
+    fetch_async (callable): 可选，fetch 的异步版本，返回可等待对象，供 get_close_async 使用
+    window_days (int): 缓存缺失时在查询日期前后各下载的天数
+    max_symbols (int): 最多保存的股票数量
+    negative_ttl (float): 没有返回数据的区间视为已覆盖的秒数
+    """
+
+    def __init__(self, fetch, window_days=PRICE_LOOKUP_WINDOW_DAYS, max_symbols=PRICE_LOOKUP_MAX_SYMBOLS,
+                 negative_ttl=PRICE_LOOKUP_NEGATIVE_TTL, fetch_async=None):
+        self.fetch = fetch
+        self.fetch_async = fetch_async
+        self.window_days = window_days
+        self.max_symbols = max_symbols
+        self.negative_ttl = negative_ttl
+        self._histories = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _covers(history, start, end):
+        """历史数据的有效覆盖区间是否包含 [start, end)"""
+        now = time.monotonic()
+        ranges = list(history['stable'])
+        ranges += [(s, e) for s, e, expires_at in history['volatile'] if now < expires_at]
+        return any(s <= start and end <= e for s, e in merge_ranges(ranges))
+
+    def _store(self, symbol, data, start, end, today):
+        """把新下载的收盘价合并到内存中的历史数据"""
+        history = self._histories.get(symbol) or {
+            'closes': pd.Series(dtype=float), 'stable': [], 'volatile': []
+        }
+        closes = history['closes']
+        if not data.empty and 'Close' in data.columns:
+            new_closes = data['Close'].dropna().astype(float)
+            closes = pd.concat([closes, new_closes]) if not closes.empty else new_closes
+            closes = closes[~closes.index.duplicated(keep='last')].sort_index()
+
+        now = time.monotonic()
+        stable = history['stable']
+        volatile = [item for item in history['volatile'] if now < item[2]]
+        if data.empty:
+            volatile.append((start, end, now + self.negative_ttl))
+        else:
+            if start < today:
+                stable = stable + [(start, min(end, today))]
+            if end > today:
+                volatile.append((max(start, today), end, now + PRICE_CACHE_TTL))
+
+        history = {
+            'closes': closes,
+            'dates': closes.index.values.astype('datetime64[D]'),
+            'values': closes.to_numpy(dtype=float),
+            'stable': merge_ranges(stable),
+            'volatile': volatile,
+        }
+        self._histories[symbol] = history
+        self._histories.move_to_end(symbol)
+        while len(self._histories) > self.max_symbols:
+            self._histories.popitem(last=False)
+        return history
+
+    def _plan(self, symbol, date):
+        """
+        查找内存中覆盖查询日期的历史数据，没有命中时给出需要下载的区间
+
+        Returns:
+        tuple: (查询日期, 最早可用日期, 历史数据或 None, (下载开始, 下载结束, 今天))，
+               查询日期晚于今天时为 None
+        """
+        day = pd.Timestamp(date).normalize()
+        today = pd.Timestamp.now().normalize()
+        if day > today:
+            return None
+
+        need_start = day - pd.Timedelta(days=MAX_LOOKBACK_DAYS)
+        need_end = day + pd.Timedelta(days=1)
+
+        with self._lock:
+            history = self._histories.get(symbol)
+            if history is not None and self._covers(history, need_start, need_end):
+                self._histories.move_to_end(symbol)
+                CACHE_HITS.inc(cache='price_lookup')
+                return day, need_start, history, None
+            CACHE_MISSES.inc(cache='price_lookup')
+
+        # 一次下载查询日期前后较宽的区间，附近日期的查询都能命中；
+        # 区间按 window_days 的网格对齐，相近日期的并发查询请求完全相同的区间，可以共享同一次下载
+        block = (day - _GRID_ORIGIN).days // self.window_days
+        start = _GRID_ORIGIN + pd.Timedelta(days=(block - 1) * self.window_days)
+        end = min(_GRID_ORIGIN + pd.Timedelta(days=(block + 2) * self.window_days), today + pd.Timedelta(days=1))
+        return day, need_start, None, (start, end, today)
+
+    @staticmethod
+    def _find(history, day, need_start):
+        """在历史数据中二分查找不晚于 day 的最近一个交易日"""
+        position = np.searchsorted(history['dates'], np.datetime64(day.date(), 'D'), side='right') - 1
+        if position < 0 or history['dates'][position] < np.datetime64(need_start.date(), 'D'):
+            return None, None
+        price_date = pd.Timestamp(history['dates'][position]).strftime('%Y-%m-%d')
+        return price_date, float(history['values'][position])
+
+    def get_close(self, symbol, date):
+        """
+        查询不晚于 date 的最近一个交易日的收盘价
+
+        Parameters:
+        symbol (str): 股票代码
+        date (str): 日期 (YYYY-MM-DD)
+
+        Returns:
+        tuple: (交易日期字符串, 收盘价)，没有数据时为 (None, None)
+        """
+        plan = self._plan(symbol, date)
+        if plan is None:
+            return None, None
+        day, need_start, history, window = plan
+        if history is None:
+            start, end, today = window
+            data = self.fetch(symbol, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+            with self._lock:
+                history = self._store(symbol, data, start, end, today)
+        return self._find(history, day, need_start)
+
+    async def get_close_async(self, symbol, date):
+        """
+        get_close 的异步版本，通过 fetch_async 下载，等待下载时不占用线程
+
+        Parameters:
+        symbol (str): 股票代码
+        date (str): 日期 (YYYY-MM-DD)
+
+        Returns:
+        tuple: (交易日期字符串, 收盘价)，没有数据时为 (None, None)
+        """
+        plan = self._plan(symbol, date)
+        if plan is None:
+            return None, None
+        day, need_start, history, window = plan
+        if history is None:
+            start, end, today = window
+            data = await self.fetch_async(symbol, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+            with self._lock:
+                history = self._store(symbol, data, start, end, today)
+        return self._find(history, day, need_start)
+
+    def nbytes(self):
+        """内存中保存的收盘价历史的字节数"""
+        with self._lock:
+            histories = list(self._histories.values())
+        return int(sum(history['closes'].memory_usage(index=True) + history['dates'].nbytes + history['values'].nbytes
+                       for history in histories))
+
+    def clear(self):
+        """清空内存中的历史数据"""
+        with self._lock:
+            self._histories.clear()
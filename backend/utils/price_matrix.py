@@ -0,0 +1,282 @@
+"""
+内存映射的价格矩阵
+
+批量分析需要数千只股票二十多年的收盘价，用每只股票一个 DataFrame 的方式构建矩阵会产生大量内存分配和复制。
+这里把价格保存为一个 日期 × 股票 的二进制矩阵，打开时使用内存映射，只有实际访问到的页才会读入内存。
+这是供离线批量分析使用的接口，API 服务本身不读取价格矩阵。
+
+一个价格矩阵是一个目录，每次写入生成一个新的版本子目录：
+- CURRENT: 当前版本子目录的名称
+- <版本>/prices.npy: 价格矩阵（NumPy .npy 格式，列优先存储，每只股票的价格在文件中连续）
+- <版本>/dates.npy: 行对应的日期 (datetime64[D])，升序
+- <版本>/index.json: 列对应的股票代码、价格字段和数据类型
+
+新版本先完整写入临时目录，再通过一次 os.replace 替换 CURRENT 切换过去，
+读取方打开时只读取一次 CURRENT，三个文件总是来自同一个版本，不会出现新矩阵配旧股票索引的情况。
+切换和清理旧版本时持有目录中的 .lock 文件锁，并发的写入不会删掉彼此的新版本。
+
+股票代码与价格缓存一样统一转换为大写，查询时不区分大小写。
+
+因为按列存储，单只股票在任意日期区间内的价格都可以作为零复制的视图取出。
+没有交易的日期保存为 NaN。
+"""
+import os
+import json
+import shutil
+import uuid
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .price_store import get_store
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 上没有 fcntl，不对并发的写入加锁
+    fcntl = None
+
+CURRENT_FILE = 'CURRENT'
+LOCK_FILE = '.lock'
+PRICES_FILE = 'prices.npy'
+DATES_FILE = 'dates.npy'
+INDEX_FILE = 'index.json'
+
+# 打开矩阵时版本目录可能刚被新的写入清理掉，重新读取 CURRENT 的次数
+OPEN_RETRIES = 3
+
+
+def write_price_matrix(path, histories, field='Close', dtype='float64', dates=None):
+    """
+    把多只股票的历史数据写成价格矩阵
+
+    逐列写入内存映射的文件，不会在内存中构建完整的矩阵
+
+    Parameters:
+    path (str): 价格矩阵目录
+    histories (dict): {股票代码: DataFrame} 历史数据，以日期为索引，只有大小写不同的代码以最后一个为准
+    field (str): 保存的价格字段
+    dtype (str): 数据类型，float64 或 float32
+    dates (DatetimeIndex): 可选，矩阵的行日期，默认使用所有股票交易日期的并集
+
+    Returns:
+    PriceMatrix: 以只读方式打开的价格矩阵
+    """
+    histories = {symbol.upper(): data for symbol, data in histories.items()}
+    return _write_matrix(path, list(histories), histories.__getitem__, field, dtype, dates)
+
+
+def write_price_matrix_from_store(path, symbols, start_date=None, end_date=None, field='Close',
+                                  dtype='float64', dates=None):
+    """
+    从价格缓存构建价格矩阵
+
+    每次只从存储后端读取一只股票的数据并写入对应的列，内存中最多同时保留一只股票的历史数据。
+    没有指定 dates 时先逐只读取一遍得到交易日期的并集，再逐只读取写入。
+
+    Parameters:
+    path (str): 价格矩阵目录
+    symbols (list): 股票代码列表
+    start_date (str): 开始日期，None 表示不限制
+    end_date (str): 结束日期（不含），None 表示不限制
+    field (str): 保存的价格字段
+    dtype (str): 数据类型，float64 或 float32
+    dates (DatetimeIndex): 可选，矩阵的行日期，默认使用所有股票交易日期的并集
+
+    Returns:
+    PriceMatrix: 以只读方式打开的价格矩阵
+    """
+    store = get_store()
+    start = None if start_date is None else pd.Timestamp(start_date)
+    end = None if end_date is None else pd.Timestamp(end_date)
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    return _write_matrix(path, symbols, lambda symbol: store.read(symbol, start, end), field, dtype, dates)
+
+
+def _write_matrix(path, symbols, load, field, dtype, dates):
+    """
+    逐列写入新版本并切换 CURRENT
+
+    Parameters:
+    path (str): 价格矩阵目录
+    symbols (list): 列对应的股票代码
+    load (callable): load(symbol) 返回该股票的历史数据
+    field (str): 保存的价格字段
+    dtype (str): 数据类型
+    dates (DatetimeIndex): 矩阵的行日期，None 表示使用所有股票交易日期的并集
+
+    Returns:
+    PriceMatrix: 以只读方式打开的价格矩阵
+    """
+    if dates is None:
+        index = pd.DatetimeIndex([])
+        for symbol in symbols:
+            data = load(symbol)
+            if not data.empty:
+                index = index.union(data.index.normalize())
+        dates = index
+    dates = pd.DatetimeIndex(dates).normalize().unique().sort_values()
+
+    os.makedirs(path, exist_ok=True)
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    tmp_dir = os.path.join(path, f'.{version}.tmp')
+    os.makedirs(tmp_dir)
+    try:
+        prices = np.lib.format.open_memmap(os.path.join(tmp_dir, PRICES_FILE), mode='w+', dtype=np.dtype(dtype),
+                                           shape=(len(dates), len(symbols)), fortran_order=True)
+        for col, symbol in enumerate(symbols):
+            data = load(symbol)
+            if data.empty or field not in data.columns:
+                prices[:, col] = np.nan
+                continue
+            series = data[field]
+            series = series[~series.index.duplicated(keep='last')]
+            series.index = series.index.normalize()
+            prices[:, col] = series.reindex(dates).to_numpy(dtype=float)
+        prices.flush()
+        del prices
+
+        np.save(os.path.join(tmp_dir, DATES_FILE), dates.values.astype('datetime64[D]'))
+        with open(os.path.join(tmp_dir, INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'symbols': symbols, 'field': field, 'dtype': np.dtype(dtype).name}, f, ensure_ascii=False)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    with _publish_lock(path):
+        os.rename(tmp_dir, os.path.join(path, version))
+        tmp_current = os.path.join(path, f'{CURRENT_FILE}.{version}.tmp')
+        with open(tmp_current, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_current, os.path.join(path, CURRENT_FILE))
+        # 删除 CURRENT 之外的所有版本；已经打开的矩阵持有内存映射，删除文件不影响它们。
+        # 以 . 开头的是其他写入还没有完成的临时目录
+        for name in os.listdir(path):
+            if name != version and not name.startswith('.') and os.path.isdir(os.path.join(path, name)):
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return PriceMatrix(path)
+
+
+@contextmanager
+def _publish_lock(path):
+    """在进程之间互斥地切换价格矩阵的版本"""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(path, LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _read_current(path):
+    """读取 CURRENT 中的版本名称，还没有写入过时返回 None"""
+    try:
+        with open(os.path.join(path, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class PriceMatrix:
+    """
+    以只读内存映射方式打开的价格矩阵
+
+    打开时读取一次 CURRENT，之后的写入不会影响已经打开的矩阵
+
+    Parameters:
+    path (str): write_price_matrix 写入的目录
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for attempt in range(OPEN_RETRIES):
+            version = _read_current(path)
+            if version is None:
+                raise FileNotFoundError(f'价格矩阵不存在: {path}')
+            directory = os.path.join(path, version)
+            try:
+                self._load(directory)
+                break
+            except FileNotFoundError:
+                # 读取 CURRENT 之后这个版本被新的写入替换并清理了
+                if attempt == OPEN_RETRIES - 1:
+                    raise
+        self.version = version
+
+    def _load(self, directory):
+        with open(os.path.join(directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        self.symbols = index['symbols']
+        self.field = index['field']
+        self.columns = {symbol: col for col, symbol in enumerate(self.symbols)}
+        self.dates = np.load(os.path.join(directory, DATES_FILE))
+        self.values = np.load(os.path.join(directory, PRICES_FILE), mmap_mode='r')
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def __contains__(self, symbol):
+        return symbol.upper() in self.columns
+
+    def column_index(self, symbol):
+        """股票在矩阵中的列号，不区分大小写"""
+        return self.columns[symbol.upper()]
+
+    def date_range(self, start=None, end=None):
+        """
+        日期区间 [start, end) 对应的行范围
+
+        Parameters:
+        start (str): 开始日期，None 表示从第一行开始
+        end (str): 结束日期（不含），None 表示到最后一行
+
+        Returns:
+        tuple: (起始行, 结束行)
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start).date(), 'D'), side='left'))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end).date(), 'D'), side='left'))
+        return lo, max(lo, hi)
+
+    def column(self, symbol, start=None, end=None):
+        """
+        单只股票在 [start, end) 内的价格，零复制的只读视图
+
+        Parameters:
+        symbol (str): 股票代码
+        start (str): 开始日期
+        end (str): 结束日期（不含）
+
+        Returns:
+        ndarray: 一维价格数组，没有交易的日期为 NaN
+        """
+        lo, hi = self.date_range(start, end)
+        return self.values[lo:hi, self.column_index(symbol)]
+
+    def rows(self, start=None, end=None):
+        """
+        所有股票在 [start, end) 内的价格，零复制的只读视图
+
+        Returns:
+        tuple: (日期数组, 二维价格数组)
+        """
+        lo, hi = self.date_range(start, end)
+        return self.dates[lo:hi], self.values[lo:hi]
+
+    def history(self, symbol, start=None, end=None):
+        """
+        单只股票在 [start, end) 内有交易的价格，格式与数据源返回的历史数据一致
+
+        Returns:
+        DataFrame: 以日期为索引、只有一个价格字段的数据
+        """
+        lo, hi = self.date_range(start, end)
+        values = self.values[lo:hi, self.column_index(symbol)]
+        valid = ~np.isnan(values)
+        index = pd.DatetimeIndex(self.dates[lo:hi][valid], name='Date')
+        return pd.DataFrame({self.field: values[valid]}, index=index)
@@ -0,0 +1,322 @@
+"""
+价格缓存的存储后端
+
+- FileStore: 每只股票一个列式文件(Parquet)和一个记录覆盖区间的JSON文件，默认使用
+- SQLiteStore: 所有股票保存在一个 SQLite 数据库中（WAL模式，启用内存映射），
+  同一台机器上的多个 worker 进程直接读取同一个数据库，数据页由操作系统页缓存共享，
+  新下载的数据只写入新增的行
+
+两种后端都通过 symbol_file_locks 提供的文件锁在进程之间互斥地更新同一只股票，
+一个 worker 正在下载时，其他 worker 等待后直接读取下载结果，不会重复访问上游。
+
+每次请求都要读取所涉及股票的价格版本号（load_versions），两种后端都不需要逐只解析元数据：
+FileStore 在内存中保存版本号，只在元数据文件被替换时重新读取；SQLiteStore 用一次查询读取所有股票的版本号。
+"""
+import os
+import re
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager, ExitStack
+
+import numpy as np
+import pandas as pd
+
+from .config import PRICE_CACHE_DIR, PRICE_STORE, PRICE_STORE_PATH, SQLITE_MMAP_SIZE
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    # 没有安装pyarrow时退化为pickle格式，功能不变
+    CACHE_FORMAT = 'pickle'
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 上没有 fcntl，只使用进程内的锁
+    fcntl = None
+
+
+def _safe_name(symbol):
+    """把股票代码转换为可以用作文件名的字符串"""
+    return re.sub(r'[^A-Za-z0-9._^-]', '_', symbol.upper())
+
+
+def _empty_meta():
+    return {'stable': [], 'volatile': []}
+
+
+@contextmanager
+def symbol_file_locks(symbols):
+    """
+    在进程之间互斥地持有多只股票的文件锁，按排序后的顺序加锁
+
+    Parameters:
+    symbols (list): 股票代码列表
+    """
+    if fcntl is None:
+        yield
+        return
+
+    lock_dir = os.path.join(PRICE_CACHE_DIR, '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    with ExitStack() as stack:
+        for name in sorted({_safe_name(symbol) for symbol in symbols}):
+            lock_file = stack.enter_context(open(os.path.join(lock_dir, name + '.lock'), 'a'))
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            stack.callback(fcntl.flock, lock_file.fileno(), fcntl.LOCK_UN)
+        yield
+
+
+class FileStore:
+    """每只股票一个 Parquet 文件和一个覆盖区间 JSON 文件"""
+
+    name = 'file'
+
+    def __init__(self, directory=None):
+        self.directory = directory or PRICE_CACHE_DIR
+        # {文件名: (元数据文件的 inode、修改时间和大小, 版本号)}
+        self._versions = {}
+        self._versions_lock = threading.Lock()
+
+    def _path(self, symbol):
+        """返回股票缓存文件的路径前缀（不含扩展名）"""
+        return os.path.join(self.directory, _safe_name(symbol))
+
+    def _load_frame(self, symbol):
+        base = self._path(symbol)
+        if CACHE_FORMAT == 'parquet' and os.path.exists(base + '.parquet'):
+            return pd.read_parquet(base + '.parquet')
+        if os.path.exists(base + '.pkl'):
+            return pd.read_pickle(base + '.pkl')
+        return pd.DataFrame()
+
+    def load_meta(self, symbol):
+        """读取股票的覆盖区间元数据"""
+        path = self._path(symbol) + '.json'
+        meta = _empty_meta()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                meta.update(json.load(f))
+        return meta
+
+    def load_versions(self, symbols):
+        """
+        读取多只股票的价格版本号
+
+        元数据文件没有被替换（inode、修改时间和大小都相同）时直接使用内存中的版本号；
+        本进程或其他进程写入新数据时文件被整体替换，下次读取时重新加载
+
+        Parameters:
+        symbols (list): 股票代码列表
+
+        Returns:
+        dict: {股票代码: 版本号}，没有缓存的股票为0
+        """
+        versions = {}
+        for symbol in symbols:
+            name = _safe_name(symbol)
+            try:
+                stat = os.stat(self._path(symbol) + '.json')
+            except FileNotFoundError:
+                versions[symbol] = 0
+                continue
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            with self._versions_lock:
+                cached = self._versions.get(name)
+            if cached is not None and cached[0] == stamp:
+                versions[symbol] = cached[1]
+                continue
+            # 读取时文件可能又被替换，此时记录的版本号比 stamp 新，下次读取时 stamp 不同会再次加载
+            version = self.load_meta(symbol).get('version', 0)
+            with self._versions_lock:
+                self._versions[name] = (stamp, version)
+            versions[symbol] = version
+        return versions
+
+    def read(self, symbol, start=None, end=None):
+        """
+        读取股票在 [start, end) 内的缓存数据
+
+        Parameters:
+        symbol (str): 股票代码
+        start (Timestamp): 开始日期，None 表示不限制
+        end (Timestamp): 结束日期（不含），None 表示不限制
+
+        Returns:
+        DataFrame: 以日期为索引的历史数据
+        """
+        data = self._load_frame(symbol)
+        if data.empty:
+            return data
+        if start is not None:
+            data = data[data.index >= start]
+        if end is not None:
+            data = data[data.index < end]
+        return data
+
+    def write(self, symbol, new_data, meta):
+        """
+        合并新下载的数据并原子地写回，同时更新覆盖区间元数据
+
+        Parameters:
+        symbol (str): 股票代码
+        new_data (DataFrame): 新下载的数据，重复日期以新数据为准
+        meta (dict): 覆盖区间元数据
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = self._path(symbol)
+
+        data = self._load_frame(symbol)
+        if data.empty:
+            data = new_data.sort_index()
+        elif not new_data.empty:
+            data = pd.concat([data, new_data])
+            data = data[~data.index.duplicated(keep='last')].sort_index()
+
+        if CACHE_FORMAT == 'parquet':
+            data_path = base + '.parquet'
+            data.to_parquet(data_path + '.tmp')
+        else:
+            data_path = base + '.pkl'
+            data.to_pickle(data_path + '.tmp')
+        os.replace(data_path + '.tmp', data_path)
+
+        with open(base + '.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+            f.flush()
+            stat = os.fstat(f.fileno())
+        os.replace(base + '.json.tmp', base + '.json')
+        # 替换不改变 inode 和修改时间，写入的版本号可以直接使用
+        with self._versions_lock:
+            self._versions[_safe_name(symbol)] = ((stat.st_ino, stat.st_mtime_ns, stat.st_size), meta.get('version', 0))
+
+
+class SQLiteStore:
+    """所有股票保存在一个 SQLite 数据库中，多个进程可以同时读取"""
+
+    name = 'sqlite'
+
+    # 保存的价格字段及对应的列名
+    FIELDS = [('Open', 'open'), ('High', 'high'), ('Low', 'low'), ('Close', 'close'),
+              ('Adj Close', 'adj_close'), ('Volume', 'volume')]
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS prices (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            open REAL, high REAL, low REAL, close REAL, adj_close REAL, volume REAL,
+            PRIMARY KEY (symbol, date)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS coverage (
+            symbol TEXT PRIMARY KEY,
+            meta TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path=None):
+        self.path = path or PRICE_STORE_PATH
+        self._local = threading.local()
+
+    def _connect(self):
+        """每个线程一个连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}')
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def load_meta(self, symbol):
+        row = self._connect().execute('SELECT meta FROM coverage WHERE symbol = ?', (symbol.upper(),)).fetchone()
+        meta = _empty_meta()
+        if row is not None:
+            meta.update(json.loads(row[0]))
+        return meta
+
+    def load_versions(self, symbols):
+        symbols = list(symbols)
+        found = {}
+        conn = self._connect()
+        # 每次查询的参数数量不超过 SQLite 的限制
+        for i in range(0, len(symbols), 500):
+            keys = [symbol.upper() for symbol in symbols[i:i + 500]]
+            placeholders = ', '.join('?' * len(keys))
+            found.update(conn.execute(
+                f"SELECT symbol, json_extract(meta, '$.version') FROM coverage WHERE symbol IN ({placeholders})", keys
+            ).fetchall())
+        return {symbol: found.get(symbol.upper()) or 0 for symbol in symbols}
+
+    def read(self, symbol, start=None, end=None):
+        sql = 'SELECT date, ' + ', '.join(column for _, column in self.FIELDS) + ' FROM prices WHERE symbol = ?'
+        params = [symbol.upper()]
+        if start is not None:
+            sql += ' AND date >= ?'
+            params.append(start.strftime('%Y-%m-%d'))
+        if end is not None:
+            sql += ' AND date < ?'
+            params.append(end.strftime('%Y-%m-%d'))
+        rows = self._connect().execute(sql + ' ORDER BY date', params).fetchall()
+        if not rows:
+            return pd.DataFrame()
+
+        data = pd.DataFrame.from_records(rows, columns=['Date'] + [field for field, _ in self.FIELDS])
+        data.index = pd.DatetimeIndex(pd.to_datetime(data.pop('Date')), name='Date')
+        # 数据源没有提供的字段整列为空，去掉
+        return data.dropna(axis=1, how='all').astype(float)
+
+    def write(self, symbol, new_data, meta):
+        rows = []
+        if not new_data.empty:
+            columns = [new_data[field].to_numpy(dtype=float) if field in new_data.columns
+                       else np.full(len(new_data), np.nan) for field, _ in self.FIELDS]
+            dates = new_data.index.strftime('%Y-%m-%d')
+            key = symbol.upper()
+            for i, date in enumerate(dates):
+                rows.append((key, date) + tuple(None if np.isnan(column[i]) else float(column[i]) for column in columns))
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if rows:
+                placeholders = ', '.join('?' * (len(self.FIELDS) + 2))
+                conn.executemany(f'INSERT OR REPLACE INTO prices VALUES ({placeholders})', rows)
+            conn.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?)', (symbol.upper(), json.dumps(meta)))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+STORES = {
+    FileStore.name: FileStore,
+    SQLiteStore.name: SQLiteStore,
+}
+
+_store = None
+
+
+def get_store():
+    """返回当前使用的存储后端，由 PRICE_STORE 环境变量决定"""
+    global _store
+    if _store is None:
+        if PRICE_STORE not in STORES:
+            raise ValueError(f"未知的价格存储: {PRICE_STORE}, 可选: {', '.join(STORES)}")
+        _store = STORES[PRICE_STORE]()
+    return _store
+
+
+def set_store(store):
+    """
+    替换当前使用的存储后端
+
+    Parameters:
+    store (FileStore | SQLiteStore): 存储后端实例
+    """
+    global _store
+    _store = store
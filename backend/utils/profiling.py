@@ -0,0 +1,194 @@
+"""
+按需的请求性能剖析
+
+设置 PROFILING_ENABLED=1 后，带有请求头 X-Profile 或查询参数 profile 的请求会在采样剖析器下执行
+（配置了 PROFILE_TOKEN 时取值必须与之相同，否则取值为 1/true 即可）。剖析器每隔 PROFILE_INTERVAL 秒
+记录一次为这个请求工作的线程的调用栈，请求结束后以折叠调用栈格式（每行 "调用栈 次数"，可以直接交给
+flamegraph.pl、speedscope 等工具生成火焰图）写入 PROFILE_DIR/<请求ID>.folded。
+
+下载和计算线程池中执行的函数会被采样（见 concurrency.py），估值、指标计算和序列化都在其中；
+事件循环线程同时处理其他请求，不采样。
+
+没有启用时不添加中间件，线程池只多一次 contextvars 读取。
+"""
+import os
+import sys
+import hmac
+import logging
+import threading
+import contextvars
+from collections import Counter
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import PROFILE_DIR, PROFILE_INTERVAL, PROFILE_TOKEN
+from .tracing import current_request_id
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('profiler', default=None)
+
+
+def _frame_label(code):
+    # 只保留路径的最后两级，足以区分模块又不泄露部署路径
+    filename = '/'.join(code.co_filename.replace('\\', '/').split('/')[-2:])
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+def _fold(frame):
+    """调用栈从外到内用分号连接"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    定时记录指定线程调用栈的采样剖析器
+
+    Parameters:
+    interval (float): 采样间隔（秒）
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        """记录一次所有被剖析线程的调用栈"""
+        with self._lock:
+            idents = list(self._threads)
+        if not idents:
+            return
+        frames = sys._current_frames()
+        for ident in idents:
+            frame = frames.get(ident)
+            if frame is not None:
+                self.stacks[_fold(frame)] += 1
+                self.samples += 1
+
+    def wrap(self, func):
+        """
+        包装函数，执行期间对所在线程采样
+
+        Parameters:
+        func (callable): 在线程池中执行的函数
+
+        Returns:
+        callable: 包装后的函数
+        """
+        def profiled(*args, **kwargs):
+            ident = threading.get_ident()
+            with self._lock:
+                self._threads[ident] = self._threads.get(ident, 0) + 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._threads[ident] -= 1
+                    if self._threads[ident] == 0:
+                        del self._threads[ident]
+        return profiled
+
+    def write(self, path):
+        """
+        以折叠调用栈格式写入文件
+
+        Parameters:
+        path (str): 输出文件路径
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def profiled(func):
+    """当前请求正在剖析时返回对所在线程采样的包装函数，否则原样返回"""
+    profiler = _current.get()
+    return profiler.wrap(func) if profiler is not None else func
+
+
+def is_profiling():
+    """当前请求是否正在剖析"""
+    return _current.get() is not None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI 中间件：剖析带有 X-Profile 请求头或 profile 查询参数的请求
+
+    剖析结果的文件名在响应头 X-Profile 中返回
+
+    Parameters:
+    app: ASGI 应用
+    directory (str): 剖析结果保存的目录
+    interval (float): 采样间隔（秒）
+    token (str): 非空时请求中的取值必须与之相同
+    """
+
+    def __init__(self, app, directory=PROFILE_DIR, interval=PROFILE_INTERVAL, token=PROFILE_TOKEN):
+        self.app = app
+        self.directory = directory
+        self.interval = interval
+        self.token = token
+
+    def _requested(self, scope):
+        value = Headers(scope=scope).get('x-profile')
+        if value is None:
+            values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('profile')
+            value = values[0] if values else None
+        if value is None:
+            return False
+        if self.token:
+            return hmac.compare_digest(value.encode('utf-8'), self.token.encode('utf-8'))
+        return value.lower() in ('1', 'true', 'yes')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # 请求ID由外层的 TracingMiddleware 分配，只包含安全字符
+        filename = f'{current_request_id() or "request"}.folded'
+        profiler = SamplingProfiler(self.interval)
+
+        async def send_with_header(message):
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message)['X-Profile'] = filename
+            await send(message)
+
+        token = _current.set(profiler)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            _current.reset(token)
+            profiler.stop()
+            path = os.path.join(self.directory, filename)
+            try:
+                profiler.write(path)
+                logger.info("已保存性能剖析结果: %s, 样本数: %d", path, profiler.samples)
+            except OSError as e:
+                logger.warning("保存性能剖析结果失败: %s", e)
@@ -0,0 +1,300 @@
+"""
+价格数据源
+
+PriceProvider 定义了获取历史价格的统一接口，fetch_many 可以一次取回多只股票的数据，
+返回按日期对齐、列为 (股票代码, 字段) 两层索引的 DataFrame。
+
+目前提供两种实现：
+- YFinanceProvider: 通过 yfinance 从 Yahoo Finance 下载
+- LocalFileProvider: 从本地目录读取 CSV/Parquet 文件，不需要网络，适合测试和基准测试
+
+对同一个上游的并发请求数量受 UPSTREAM_CONCURRENCY 限制，不支持批量请求的数据源会并发地逐只下载。
+通过 upstream_slot 发出的请求按股票计入 metrics 中的上游请求次数和耗时。
+"""
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+import yfinance as yf
+
+from .config import PRICE_PROVIDER, PRICE_FIXTURE_DIR, UPSTREAM_CONCURRENCY, FETCH_WORKERS
+from .metrics import UPSTREAM_FETCHES, UPSTREAM_DURATION
+from .concurrency import run_in_fetch_pool
+
+# 每个上游一个信号量，限制同时进行的请求数量
+_upstream_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+# fetch_many 逐只下载时使用的线程池。调用 fetch_many 的线程（包括 fetch_many_async 使用的
+# concurrency.fetch_executor）不能属于这个线程池，否则外层任务占满线程后会一直等待排不上队的内层任务
+_symbol_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='provider')
+
+
+@contextmanager
+def upstream_slot(name, symbols=()):
+    """
+    占用上游的一个并发名额，名额用完时等待
+
+    Parameters:
+    name (str): 上游名称
+    symbols (list): 这次请求的股票代码，用于统计上游请求次数
+    """
+    for symbol in symbols:
+        UPSTREAM_FETCHES.inc(provider=name, symbol=symbol)
+    with _semaphores_lock:
+        semaphore = _upstream_semaphores.get(name)
+        if semaphore is None:
+            semaphore = _upstream_semaphores[name] = threading.BoundedSemaphore(UPSTREAM_CONCURRENCY)
+    start = time.perf_counter()
+    try:
+        with semaphore:
+            yield
+    finally:
+        UPSTREAM_DURATION.observe(time.perf_counter() - start, provider=name)
+
+
+def normalize_history(stock_data):
+    """
+    统一历史数据的格式：单层列名、不含时区的日期索引
+
+    Parameters:
+    stock_data (DataFrame): 原始历史数据
+
+    Returns:
+    DataFrame: 规范化后的数据
+    """
+    if stock_data is None or stock_data.empty:
+        return pd.DataFrame()
+
+    stock_data = stock_data.copy()
+
+    # 新版yfinance即使只下载一只股票也会返回 (Price, Ticker) 两层列名
+    if isinstance(stock_data.columns, pd.MultiIndex):
+        stock_data.columns = stock_data.columns.get_level_values(0)
+
+    # 确保日期列被设置为索引
+    if not isinstance(stock_data.index, pd.DatetimeIndex):
+        stock_data.set_index('Date', inplace=True)
+        stock_data.index = pd.to_datetime(stock_data.index)
+
+    if stock_data.index.tz is not None:
+        stock_data.index = stock_data.index.tz_localize(None)
+    stock_data.index.name = 'Date'
+
+    # 丢弃整行为空的日期（批量下载时其他股票有数据的日期）
+    return stock_data.dropna(how='all').sort_index()
+
+
+def combine_histories(histories):
+    """
+    把多只股票的历史数据合并成一个按日期对齐的 DataFrame
+
+    Parameters:
+    histories (dict): {股票代码: DataFrame}
+
+    Returns:
+    DataFrame: 列为 (股票代码, 字段) 两层索引的数据
+    """
+    frames = {symbol: data for symbol, data in histories.items() if not data.empty}
+    if not frames:
+        return pd.DataFrame()
+    combined = pd.concat(frames, axis=1).sort_index()
+    combined.index.name = 'Date'
+    return combined
+
+
+def split_histories(combined, symbols):
+    """
+    把 fetch_many 返回的对齐数据拆分为每只股票一个 DataFrame
+
+    Parameters:
+    combined (DataFrame): 列为 (股票代码, 字段) 两层索引的数据
+    symbols (list): 股票代码列表
+
+    Returns:
+    dict: {股票代码: DataFrame}，没有数据的股票对应空的 DataFrame
+    """
+    histories = {}
+    available = set(combined.columns.get_level_values(0)) if not combined.empty else set()
+    for symbol in symbols:
+        if symbol in available:
+            histories[symbol] = combined[symbol].dropna(how='all')
+        else:
+            histories[symbol] = pd.DataFrame()
+    return histories
+
+
+class PriceProvider:
+    """价格数据源基类"""
+
+    name = 'base'
+
+    def fetch(self, symbol, start_date, end_date):
+        """
+        获取单只股票在 [start_date, end_date) 内的历史数据
+
+        Parameters:
+        symbol (str): 股票代码
+        start_date (str): 开始日期 (YYYY-MM-DD)
+        end_date (str): 结束日期 (YYYY-MM-DD)，不包含
+
+        Returns:
+        DataFrame: 以日期为索引的OHLCV数据
+        """
+        raise NotImplementedError
+
+    def nbytes(self):
+        """数据源在内存中保存的价格数据字节数"""
+        return 0
+
+    def fetch_many(self, symbols, start_date, end_date):
+        """
+        批量获取多只股票在 [start_date, end_date) 内的历史数据
+
+        默认并发地逐只调用 fetch，支持批量请求的数据源应当覆盖此方法
+
+        Parameters:
+        symbols (list): 股票代码列表
+        start_date (str): 开始日期 (YYYY-MM-DD)
+        end_date (str): 结束日期 (YYYY-MM-DD)，不包含
+
+        Returns:
+        DataFrame: 列为 (股票代码, 字段) 两层索引、按日期对齐的数据
+        """
+        symbols = list(symbols)
+        if len(symbols) <= 1:
+            return combine_histories({symbol: self.fetch(symbol, start_date, end_date) for symbol in symbols})
+        futures = {symbol: _symbol_executor.submit(self.fetch, symbol, start_date, end_date) for symbol in symbols}
+        return combine_histories({symbol: future.result() for symbol, future in futures.items()})
+
+    async def fetch_many_async(self, symbols, start_date, end_date):
+        """
+        fetch_many 的异步版本，在下载线程池中执行，不阻塞事件循环
+
+        Parameters:
+        symbols (list): 股票代码列表
+        start_date (str): 开始日期 (YYYY-MM-DD)
+        end_date (str): 结束日期 (YYYY-MM-DD)，不包含
+
+        Returns:
+        DataFrame: 列为 (股票代码, 字段) 两层索引、按日期对齐的数据
+        """
+        return await run_in_fetch_pool(self.fetch_many, list(symbols), start_date, end_date)
+
+
+class YFinanceProvider(PriceProvider):
+    """通过 yfinance 获取数据"""
+
+    name = 'yfinance'
+
+    def fetch(self, symbol, start_date, end_date):
+        with upstream_slot(self.name, [symbol]):
+            stock_data = yf.download(symbol, start=start_date, end=end_date, progress=False)
+        return normalize_history(stock_data)
+
+    def fetch_many(self, symbols, start_date, end_date):
+        symbols = list(symbols)
+        if len(symbols) == 1:
+            return combine_histories({symbols[0]: self.fetch(symbols[0], start_date, end_date)})
+
+        # 一次请求下载所有股票
+        with upstream_slot(self.name, symbols):
+            raw = yf.download(symbols, start=start_date, end=end_date, group_by='ticker', progress=False)
+        if raw is None or raw.empty:
+            return pd.DataFrame()
+
+        histories = {}
+        tickers = set(raw.columns.get_level_values(0))
+        for symbol in symbols:
+            if symbol in tickers:
+                histories[symbol] = normalize_history(raw[symbol])
+        return combine_histories(histories)
+
+
+class LocalFileProvider(PriceProvider):
+    """
+    从本地目录读取历史数据
+
+    目录中每只股票一个文件，文件名为 <股票代码>.csv 或 <股票代码>.parquet，
+    CSV 文件需要包含 Date 列以及 Open/High/Low/Close 等价格列
+    """
+
+    name = 'local'
+
+    def __init__(self, directory=None):
+        self.directory = directory or PRICE_FIXTURE_DIR
+        self._frames = {}
+
+    def _load(self, symbol):
+        if symbol in self._frames:
+            return self._frames[symbol]
+
+        safe_name = re.sub(r'[^A-Za-z0-9._^-]', '_', symbol)
+        data = pd.DataFrame()
+        parquet_path = os.path.join(self.directory, safe_name + '.parquet')
+        csv_path = os.path.join(self.directory, safe_name + '.csv')
+        if os.path.exists(parquet_path):
+            data = pd.read_parquet(parquet_path)
+        elif os.path.exists(csv_path):
+            data = pd.read_csv(csv_path, parse_dates=['Date'])
+
+        data = normalize_history(data)
+        self._frames[symbol] = data
+        return data
+
+    def nbytes(self):
+        return int(sum(frame.memory_usage(index=True).sum() for frame in list(self._frames.values())))
+
+    def fetch(self, symbol, start_date, end_date):
+        data = self._load(symbol)
+        if data.empty:
+            return data
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        return data[(data.index >= start) & (data.index < end)]
+
+
+PROVIDERS = {
+    YFinanceProvider.name: YFinanceProvider,
+    LocalFileProvider.name: LocalFileProvider,
+}
+
+_provider = None
+
+
+def create_provider(name):
+    """
+    按名称创建数据源
+
+    Parameters:
+    name (str): 数据源名称，见 PROVIDERS
+
+    Returns:
+    PriceProvider: 数据源实例
+    """
+    if name not in PROVIDERS:
+        raise ValueError(f"未知的价格数据源: {name}, 可选: {', '.join(PROVIDERS)}")
+    return PROVIDERS[name]()
+
+
+def get_provider():
+    """返回当前使用的数据源，默认由 PRICE_PROVIDER 环境变量决定"""
+    global _provider
+    if _provider is None:
+        _provider = create_provider(PRICE_PROVIDER)
+    return _provider
+
+
+def set_provider(provider):
+    """
+    替换当前使用的数据源，例如在测试或基准测试中使用本地数据
+
+    Parameters:
+    provider (PriceProvider): 数据源实例
+    """
+    global _provider
+    _provider = provider
@@ -0,0 +1,235 @@
+"""
+投资组合计算结果缓存
+
+刷新页面、多人使用同一个模型组合、前端在界面小改动后重新提交，都会产生完全相同的请求。
+这里按交易记录、日期区间和计算选项的规范化哈希缓存序列化好的响应，命中时不再下载和计算。
+
+每条结果同时记录所涉及股票的价格版本号，任何一只股票收到新的价格数据后，
+依赖它的结果在下次读取时失效。版本号保存在价格存储中（见 price_cache.get_price_versions），
+所有 worker 进程共享，其他进程下载了新数据时本进程的结果同样失效。一次请求只读取一次版本号，
+同时用于查找结果缓存和计算 ETag。日期区间包含当天的结果与价格缓存一样只在 PRICE_CACHE_TTL 秒内有效。
+缓存容量有上限，超出时淘汰最久未使用的结果。
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from .config import RESULT_CACHE_SIZE, PRICE_CACHE_TTL
+from .price_cache import get_price_versions
+from .metrics import CACHE_HITS, CACHE_MISSES, CallbackMetric
+
+
+def _canonical_date(value):
+    """把日期字符串统一为 YYYY-MM-DD，无法解析时保持原样"""
+    try:
+        return datetime.fromisoformat(value).date().isoformat()
+    except (TypeError, ValueError):
+        return value
+
+
+def portfolio_key(transactions, start_date, end_date, options=None):
+    """
+    计算投资组合请求的规范化哈希
+
+    交易的顺序决定结果中各股票列的顺序，因此保留；股票名称只用于显示，不参与计算
+
+    Parameters:
+    transactions (List): 交易列表
+    start_date (str): 开始日期
+    end_date (str): 结束日期
+    options (dict): 影响计算结果的其他选项，例如指标组和滚动窗口
+
+    Returns:
+    str: 十六进制的 SHA-256 哈希
+    """
+    payload = {
+        'transactions': [
+            [tx.symbol, _canonical_date(tx.buy_date), float(tx.quantity), float(tx.buy_price)]
+            for tx in transactions
+        ],
+        'start_date': _canonical_date(start_date),
+        'end_date': _canonical_date(end_date),
+        'options': options or {},
+    }
+    text = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def is_volatile_range(end_date, now=None):
+    """
+    判断日期区间是否包含当天（结束日期包含在区间内）
+
+    Parameters:
+    end_date (str): 结束日期
+
+    Returns:
+    bool: 区间包含当天及以后的日期时为True
+    """
+    today = (now or datetime.now()).strftime('%Y-%m-%d')
+    return _canonical_date(end_date) >= today
+
+
+class ResultCache:
+    """按最近使用顺序淘汰的计算结果缓存，线程安全"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions=None):
+        """
+        读取缓存的结果，结果已过期或依赖的价格数据已更新时返回None
+
+        Parameters:
+        key (str): portfolio_key 计算的缓存键
+        versions (dict): 调用方已经读取的 get_price_versions 结果，None 表示在这里读取
+
+        Returns:
+        Any: 缓存的结果
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        # 读取价格版本号需要访问价格存储，不在持有锁时进行
+        if entry is not None:
+            expired = entry['expires_at'] is not None and time.monotonic() >= entry['expires_at']
+            if versions is None and not expired:
+                versions = get_price_versions(list(entry['versions']))
+            if expired or {symbol: versions.get(symbol, 0) for symbol in entry['versions']} != entry['versions']:
+                with self._lock:
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                CACHE_MISSES.inc(cache='result')
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_HITS.inc(cache='result')
+            return entry['value']
+
+    def put(self, key, value, symbols, ttl=None, versions=None):
+        """
+        保存计算结果
+
+        价格版本号应当在结果计算完成（价格已经下载）之后读取
+
+        Parameters:
+        key (str): portfolio_key 计算的缓存键
+        value (Any): 计算结果
+        symbols (list): 结果依赖的股票代码
+        ttl (float): 有效期（秒），None 表示只在价格更新时失效
+        versions (dict): 调用方已经读取的 get_price_versions 结果，None 表示在这里读取
+        """
+        if self.max_entries <= 0:
+            return
+        symbols = list(dict.fromkeys(symbols))
+        if versions is None:
+            versions = get_price_versions(symbols)
+        entry = {
+            'value': value,
+            'versions': {symbol: versions.get(symbol, 0) for symbol in symbols},
+            'expires_at': time.monotonic() + ttl if ttl is not None else None,
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def nbytes(self):
+        """缓存的响应体的总字节数"""
+        with self._lock:
+            return sum(len(entry['value']) for entry in self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# 投资组合计算接口使用的结果缓存
+result_cache = ResultCache()
+
+CallbackMetric('portfolio_result_cache_entries', '结果缓存中的结果数量', lambda: len(result_cache))
+CallbackMetric('portfolio_result_cache_bytes', '结果缓存中响应体的总字节数', result_cache.nbytes)
+
+
+def result_ttl(end_date):
+    """
+    返回结果的有效期：区间包含当天时为 PRICE_CACHE_TTL 秒，否则为None
+
+    Parameters:
+    end_date (str): 结束日期
+
+    Returns:
+    float: 有效期（秒）
+    """
+    return PRICE_CACHE_TTL if is_volatile_range(end_date) else None
+
+
+# 压缩后 ETag 附加的编码后缀，比较时去掉
+_ETAG_SUFFIXES = ('-gzip', '-br')
+
+
+def result_etag(key, symbols, versions=None):
+    """
+    计算结果的强 ETag：由请求的规范化哈希和所涉及股票当前的价格版本号决定
+
+    只应用于不包含当天的日期区间，这样的结果在价格数据不变时是确定的。
+    版本号来自价格存储，共享同一个存储的所有 worker 进程对相同的结果给出相同的 ETag，重启后也不变
+
+    Parameters:
+    key (str): portfolio_key 计算的哈希
+    symbols (list): 结果依赖的股票代码
+    versions (dict): 调用方已经读取的 get_price_versions 结果，None 表示在这里读取
+
+    Returns:
+    str: 带引号的 ETag
+    """
+    symbols = sorted(set(symbols))
+    if versions is None:
+        versions = get_price_versions(symbols)
+    versions = {symbol: versions.get(symbol, 0) for symbol in symbols}
+    text = key + json.dumps(versions, sort_keys=True, separators=(',', ':'))
+    return '"' + hashlib.sha256(text.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    判断 If-None-Match 请求头是否包含给定的 ETag
+
+    投资组合计算接口是 POST，按 RFC 9110 条件请求命中时只有 GET/HEAD 可以返回 304。
+    这里把计算请求当作对结果的只读查询，命中时返回 304，这是非标准的用法，需要客户端明确带上之前收到的 ETag；
+    * 不指向任何具体的结果，总是视为不匹配，不会让请求跳过计算
+
+    Parameters:
+    if_none_match (str): If-None-Match 请求头，可以包含多个逗号分隔的 ETag
+    etag (str): 当前结果的 ETag
+
+    Returns:
+    bool: 客户端已经持有当前结果时为True
+    """
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        for suffix in _ETAG_SUFFIXES:
+            if candidate.endswith(suffix + '"'):
+                candidate = candidate[:-len(suffix) - 1] + '"'
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,198 @@
+"""
+并发请求合并
+
+开盘时大量并发请求会同时下载同一批热门股票。这里提供两种工具：
+- RangeFlights: 正在进行中的下载如果已经覆盖了另一个请求需要的股票和日期区间，
+  该请求直接等待并共享这次下载的结果，不再单独访问数据源。同步调用在线程中等待，
+  异步调用在事件循环中等待，不占用线程。只有下载本身的错误会交给等待的请求；
+  发起下载的请求被取消时下载继续进行（异步），或者由等待的请求自己重新下载（同步被中断时）。
+  异步下载的任务在 concurrency.fetch_executor 中执行，同步的 run 不能在这个线程池中调用：
+  等待的线程占满线程池后，发起下载的任务永远排不上队
+- KeyedLocks: 按股票代码分配的锁，同时持有多把锁时按排序后的顺序获取，避免死锁
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    """按键分配的互斥锁，没有线程使用的锁会被释放"""
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, keys):
+        """
+        同时持有多个键的锁
+
+        Parameters:
+        keys (list): 键列表，按排序后的顺序加锁
+        """
+        keys = sorted(set(keys))
+        with self._lock:
+            entries = []
+            for key in keys:
+                entry = self._locks.setdefault(key, [threading.Lock(), 0])
+                entry[1] += 1
+                entries.append(entry)
+
+        acquired = []
+        try:
+            for entry in entries:
+                entry[0].acquire()
+                acquired.append(entry)
+            yield
+        finally:
+            for entry in reversed(acquired):
+                entry[0].release()
+            with self._lock:
+                for key, entry in zip(keys, entries):
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        del self._locks[key]
+
+
+class _Abandoned(Exception):
+    """发起下载的请求被中断，没有得到结果，等待的请求需要自己重新获取"""
+
+
+class _Flight:
+    """一次进行中的下载，结果通过 Future 交给等待的请求"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.future = Future()
+
+
+class RangeFlights:
+    """
+    合并对同一键、相互覆盖的日期区间的并发请求
+
+    每个键可以同时有多个进行中的下载；新请求优先复用区间完全覆盖自己的下载，
+    其余的键合并成一次新的下载
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        # 通过共享其他请求的下载而省去的键数量
+        self.shared = 0
+
+    def _join(self, keys, start, end):
+        """登记请求：返回 (可复用的下载 {键: 下载}, 需要自己下载的键, 新登记的下载)"""
+        waiting = {}
+        own = []
+        flight = None
+        with self._lock:
+            for key in keys:
+                shared = next((f for f in self._flights.get(key, ()) if f.start <= start and end <= f.end), None)
+                if shared is not None:
+                    waiting[key] = shared
+                else:
+                    own.append(key)
+            if own:
+                flight = _Flight(start, end)
+                for key in own:
+                    self._flights.setdefault(key, []).append(flight)
+            self.shared += len(waiting)
+        return waiting, own, flight
+
+    def _finish(self, own, flight, result=None, error=None):
+        """注销下载并把结果交给等待的请求"""
+        with self._lock:
+            for key in own:
+                flights = self._flights[key]
+                flights.remove(flight)
+                if not flights:
+                    del self._flights[key]
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def _finish_task(self, own, flight, task):
+        """异步下载完成后注销下载，发起的请求被取消时同样执行"""
+        if task.cancelled():
+            self._finish(own, flight, error=_Abandoned())
+        elif task.exception() is not None:
+            error = task.exception()
+            self._finish(own, flight, error=error if isinstance(error, Exception) else _Abandoned())
+        else:
+            self._finish(own, flight, task.result())
+
+    def run(self, keys, start, end, fetch):
+        """
+        获取多个键在 [start, end) 内的结果
+
+        Parameters:
+        keys (list): 键列表（例如股票代码）
+        start: 区间开始，可比较大小
+        end: 区间结束（不含）
+        fetch (callable): fetch(keys) 返回 {键: 结果}，只会传入没有可复用下载的键
+
+        Returns:
+        dict: {键: 结果}，共享的结果可能覆盖比 [start, end) 更大的区间，由调用方截取
+        """
+        waiting, own, flight = self._join(keys, start, end)
+
+        results = {}
+        if flight is not None:
+            try:
+                result = fetch(own)
+            except Exception as e:
+                self._finish(own, flight, error=e)
+                raise
+            except BaseException:
+                # KeyboardInterrupt 等不是下载失败，等待的请求自己重新下载
+                self._finish(own, flight, error=_Abandoned())
+                raise
+            self._finish(own, flight, result)
+            results.update(result)
+
+        retry = []
+        for key, shared in waiting.items():
+            try:
+                results[key] = shared.future.result()[key]
+            except _Abandoned:
+                retry.append(key)
+        if retry:
+            results.update(self.run(retry, start, end, fetch))
+        return results
+
+    async def run_async(self, keys, start, end, fetch):
+        """
+        run 的异步版本，等待其他请求的下载时不占用线程
+
+        Parameters:
+        keys (list): 键列表
+        start: 区间开始
+        end: 区间结束（不含）
+        fetch (callable): fetch(keys) 返回可等待对象，结果为 {键: 结果}
+
+        Returns:
+        dict: {键: 结果}
+        """
+        waiting, own, flight = self._join(keys, start, end)
+
+        results = {}
+        if flight is not None:
+            task = asyncio.ensure_future(fetch(own))
+            task.add_done_callback(functools.partial(self._finish_task, own, flight))
+            # 发起的请求被取消（例如客户端断开）时下载继续进行，结果仍然交给等待的请求
+            results.update(await asyncio.shield(task))
+
+        retry = []
+        for key, shared in waiting.items():
+            try:
+                # 等待的请求被取消时不能取消共享的下载
+                results[key] = (await asyncio.shield(asyncio.wrap_future(shared.future)))[key]
+            except _Abandoned:
+                retry.append(key)
+        if retry:
+            results.update(await self.run_async(retry, start, end, fetch))
+        return results
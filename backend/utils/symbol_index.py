@@ -0,0 +1,193 @@
+"""
+股票代码搜索索引
+
+股票列表只在第一次搜索和文件发生变化时读取，读取后建立以下索引：
+- 代码和名称（小写）的有序列表，用二分查找定位前缀匹配的区间
+- 代码和名称各自的二元组(bigram)倒排索引，在最短的倒排列表中确认子串匹配
+
+搜索结果按以下顺序排列，同一档内代码较短的在前：
+代码完全匹配、代码前缀匹配、名称前缀匹配、代码包含、名称包含。
+"""
+import os
+import threading
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+# 前缀查找区间的上界
+_PREFIX_END = '\uffff'
+# 子串匹配时先在最短倒排列表开头逐个确认的数量，不够时再与其他倒排列表求交集
+_SCAN_LIMIT = 2048
+
+
+class _Snapshot:
+    """
+    一次加载的股票列表及其索引，建立后不再修改
+
+    重新加载时建立新的快照并整体替换，搜索只读取同一个快照，不会把新列表与旧索引混在一起
+
+    Parameters:
+    stocks_df (DataFrame): 股票列表，包含 symbol 和 name 列
+    """
+
+    def __init__(self, stocks_df):
+        stocks_df = stocks_df[stocks_df['symbol'] != '']
+        if 'name' not in stocks_df.columns:
+            stocks_df = stocks_df.assign(name='')
+
+        # 编号按排序后的顺序分配（代码短的在前），倒排列表和区间内编号越小排名越靠前
+        raw_symbols = stocks_df['symbol'].tolist()
+        order = sorted(range(len(raw_symbols)), key=lambda i: (len(raw_symbols[i]), raw_symbols[i].lower(), i))
+        records = stocks_df.iloc[order].to_dict(orient='records')
+        symbols = [record['symbol'].lower() for record in records]
+        names = [record['name'].lower() for record in records]
+
+        exact = {}
+        for i, symbol in enumerate(symbols):
+            exact.setdefault(symbol, []).append(i)
+
+        symbol_order = sorted(range(len(symbols)), key=symbols.__getitem__)
+        name_order = sorted(range(len(names)), key=names.__getitem__)
+
+        self.records = records
+        self.symbols = symbols
+        self.names = names
+        self.exact = exact
+        self.symbol_keys = [symbols[i] for i in symbol_order]
+        self.symbol_ids = np.array(symbol_order, dtype=np.int64)
+        self.name_keys = [names[i] for i in name_order]
+        self.name_ids = np.array(name_order, dtype=np.int64)
+        self.symbol_postings = self._build_postings(symbols)
+        self.name_postings = self._build_postings(names)
+
+    @staticmethod
+    def _build_postings(texts):
+        """二元组倒排索引，每个倒排列表中的编号升序排列"""
+        postings = {}
+        for i, text in enumerate(texts):
+            for gram in {text[k:k + 2] for k in range(len(text) - 1)}:
+                postings.setdefault(gram, []).append(i)
+        return {gram: np.array(ids, dtype=np.int64) for gram, ids in postings.items()}
+
+
+class SymbolIndex:
+    """从CSV文件加载的股票列表及其搜索索引，文件修改后自动重新加载"""
+
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot(pd.DataFrame({'symbol': [], 'name': []}, dtype=str))
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self):
+        """文件发生变化（或尚未加载）时重新建立索引"""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            if signature != self._signature:
+                self._build(pd.read_csv(self.path, dtype=str, keep_default_na=False))
+                self._signature = signature
+
+    def _build(self, stocks_df):
+        """根据股票列表建立新的快照，一次赋值替换旧的快照"""
+        self._snapshot = _Snapshot(stocks_df)
+
+    def __len__(self):
+        return len(self._snapshot.records)
+
+    @staticmethod
+    def _prefix_ids(keys, ids, prefix, limit):
+        """有序列表中以 prefix 开头的前 limit 个编号"""
+        lo = bisect_left(keys, prefix)
+        hi = bisect_left(keys, prefix + _PREFIX_END, lo)
+        if hi - lo > limit:
+            return np.sort(np.partition(ids[lo:hi], limit - 1)[:limit])
+        return np.sort(ids[lo:hi])
+
+    @staticmethod
+    def _substring_ids(postings, texts, query, limit):
+        """包含 query 的前 limit 个编号"""
+        if len(query) < 2:
+            # 单个字符没有二元组可用，按编号顺序扫描
+            matches = []
+            for i, text in enumerate(texts):
+                if query in text:
+                    matches.append(i)
+                    if len(matches) >= limit:
+                        break
+            return matches
+
+        lists = []
+        for gram in {query[k:k + 2] for k in range(len(query) - 1)}:
+            posting = postings.get(gram)
+            if posting is None:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+
+        # 大多数查询在最短倒排列表的开头就能凑够结果
+        matches = []
+        for i in lists[0][:_SCAN_LIMIT].tolist():
+            if query in texts[i]:
+                matches.append(i)
+                if len(matches) >= limit:
+                    return matches
+
+        rest = lists[0][_SCAN_LIMIT:]
+        for posting in lists[1:]:
+            if len(rest) == 0:
+                break
+            rest = np.intersect1d(rest, posting, assume_unique=True)
+        for i in rest.tolist():
+            if query in texts[i]:
+                matches.append(i)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def search(self, query, limit=10):
+        """
+        搜索股票代码或名称（不区分大小写）
+
+        Parameters:
+        query (str): 搜索查询字符串
+        limit (int): 最多返回的结果数量
+
+        Returns:
+        list: 匹配的股票列表
+        """
+        self.refresh()
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+
+        selected = []
+        seen = set()
+
+        def take(ids):
+            for i in ids:
+                if len(selected) >= limit:
+                    return
+                i = int(i)
+                if i not in seen:
+                    seen.add(i)
+                    selected.append(i)
+
+        # 整个搜索只使用同一个快照，期间重新加载不影响本次结果
+        snapshot = self._snapshot
+        # 已选中的结果可能再次出现，每一档多取 len(seen) 个
+        take(snapshot.exact.get(query, ()))
+        take(self._prefix_ids(snapshot.symbol_keys, snapshot.symbol_ids, query, limit + len(seen)))
+        take(self._prefix_ids(snapshot.name_keys, snapshot.name_ids, query, limit + len(seen)))
+        if len(selected) < limit:
+            take(self._substring_ids(snapshot.symbol_postings, snapshot.symbols, query, limit + len(seen)))
+        if len(selected) < limit:
+            take(self._substring_ids(snapshot.name_postings, snapshot.names, query, limit + len(seen)))
+
+        return [dict(snapshot.records[i]) for i in selected]
@@ -0,0 +1,145 @@
+"""
+请求上下文与分阶段耗时
+
+每个请求有一个请求ID（优先使用请求头 X-Request-ID）和一组耗时记录，保存在 contextvars 中，
+计算线程池中执行的代码也能记录到所属的请求（见 concurrency.py）。
+
+用 span 记录一个阶段的耗时：
+
+    with span('align'):
+        prices = align_prices(...)
+
+TracingMiddleware 在响应头中返回 X-Request-ID，并把响应开始前已经完成的阶段写入 Server-Timing
+（浏览器开发者工具可以直接显示）；请求结束后把所有阶段的耗时写入一条 INFO 日志。
+请求延迟和各阶段耗时同时记录到 metrics 中的直方图。
+没有请求上下文时（例如命令行脚本）span 不做任何事情。
+"""
+import re
+import time
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import SERVER_TIMING_ENABLED
+from .metrics import REQUEST_DURATION, STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_trace', default=None)
+
+# 请求头中的请求ID只接受较短的安全字符，避免写入日志和文件名时出问题
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class RequestTrace:
+    """一个请求的ID和各阶段耗时（毫秒）"""
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, duration_ms):
+        # list.append 是原子操作，计算线程中记录不需要加锁
+        self.spans.append((name, duration_ms))
+
+    def totals(self):
+        """按阶段名称汇总的耗时，保持第一次出现的顺序"""
+        totals = {}
+        for name, duration_ms in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration_ms
+        return totals
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self):
+        """Server-Timing 响应头的值"""
+        metrics = [f'{name};dur={duration_ms:.1f}' for name, duration_ms in self.totals().items()]
+        metrics.append(f'total;dur={self.elapsed_ms():.1f}')
+        return ', '.join(metrics)
+
+
+def current_trace():
+    """当前请求的 RequestTrace，不在请求中时为None"""
+    return _current.get()
+
+
+def current_request_id():
+    """当前请求的ID，不在请求中时为None"""
+    trace = _current.get()
+    return trace.request_id if trace is not None else None
+
+
+@contextmanager
+def span(name):
+    """
+    记录一个阶段的耗时
+
+    Parameters:
+    name (str): 阶段名称，例如 fetch、align、value、indicators.risk、serialize
+    """
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        trace.add(name, seconds * 1000)
+        STAGE_DURATION.observe(seconds, stage=name)
+
+
+class TracingMiddleware:
+    """
+    ASGI 中间件：为每个请求建立 RequestTrace，返回 X-Request-ID 和 Server-Timing 响应头
+
+    Parameters:
+    app: ASGI 应用
+    server_timing (bool): 是否返回 Server-Timing 响应头
+    """
+
+    def __init__(self, app, server_timing=SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get('x-request-id', '')
+        if not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex[:16]
+        trace = RequestTrace(request_id)
+        token = _current.set(trace)
+        status = [500]
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                headers = MutableHeaders(scope=message)
+                headers['X-Request-ID'] = request_id
+                if self.server_timing:
+                    headers.append('Server-Timing', trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            duration_ms = trace.elapsed_ms()
+            # 使用路由模板而不是实际路径，未匹配路由的请求归为一类，避免标签数量无限增长
+            route = scope.get('route')
+            REQUEST_DURATION.observe(duration_ms / 1000, method=scope['method'],
+                                     route=getattr(route, 'path', 'unmatched'), status=status[0])
+            if logger.isEnabledFor(logging.INFO):
+                spans = {name: round(span_ms, 2) for name, span_ms in trace.totals().items()}
+                logger.info('%s %s %d %.1fms', scope['method'], scope['path'], status[0], duration_ms,
+                            extra={'method': scope['method'], 'path': scope['path'], 'status': status[0],
+                                   'duration_ms': round(duration_ms, 2), 'spans': spans})
+            _current.reset(token)
@@ -0,0 +1,121 @@
+"""
+向量化的投资组合估值
+
+把价格对齐到输出日历后向前填充，按交易日期构建持仓数量矩阵，
+再用一次矩阵乘法得到每只股票以及整个组合的每日价值。
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+def align_prices(stock_data, calendar, symbols, field='Close'):
+    """
+    把每只股票的价格对齐到输出日历，非交易日使用之前最近一个交易日的价格
+
+    Parameters:
+    stock_data (dict): {股票代码: DataFrame} 历史数据
+    calendar (DatetimeIndex): 输出日历
+    symbols (list): 股票代码列表，决定矩阵的列顺序
+    field (str): 使用的价格字段
+
+    Returns:
+    ndarray: 形状为 (日期数, 股票数) 的价格矩阵，第一个交易日之前为 NaN
+    """
+    prices = np.full((len(calendar), len(symbols)), np.nan)
+    for col, symbol in enumerate(symbols):
+        data = stock_data.get(symbol)
+        if data is None or data.empty or field not in data.columns:
+            continue
+        series = data[field].dropna()
+        if series.empty:
+            continue
+        series = series[~series.index.duplicated(keep='last')].sort_index()
+        prices[:, col] = series.reindex(calendar, method='ffill').to_numpy(dtype=float)
+    return prices
+
+
+def align_matrix_prices(matrix, calendar, symbols, start_date, end_date):
+    """
+    align_prices 的价格矩阵版本，直接读取内存映射矩阵中需要的行和列，不构建每只股票的 DataFrame
+
+    只使用 [start_date, end_date) 内的行，与下载历史数据的区间一致：
+    不向 start_date 之前查找价格，end_date 当天使用之前最近一个交易日的价格
+
+    Parameters:
+    matrix (PriceMatrix): 价格矩阵
+    calendar (DatetimeIndex): 输出日历（升序）
+    symbols (list): 股票代码列表，决定矩阵的列顺序，不在价格矩阵中的股票价格为 NaN
+    start_date (str): 开始日期
+    end_date (str): 结束日期（不含）
+
+    Returns:
+    ndarray: 形状为 (日期数, 股票数) 的价格矩阵，第一个交易日之前为 NaN
+    """
+    prices = np.full((len(calendar), len(symbols)), np.nan)
+    lo, hi = matrix.date_range(start_date, end_date)
+    if len(calendar) == 0 or lo >= hi:
+        return prices
+
+    # 每个输出日期对应的矩阵行：区间内不晚于该日期的最后一行，所有股票共用
+    days = calendar.values.astype('datetime64[D]')
+    rows = np.minimum(np.searchsorted(matrix.dates, days, side='right') - 1, hi - 1)
+    has_row = rows >= lo
+    if not has_row.any():
+        return prices
+
+    for col, symbol in enumerate(symbols):
+        if symbol not in matrix:
+            continue
+        # 按列存储，取出的区间是零复制的视图
+        column = matrix.values[lo:hi, matrix.column_index(symbol)]
+        positions = np.where(np.isnan(column), -1, np.arange(len(column)))
+        last_valid = np.maximum.accumulate(positions)
+        source = np.where(has_row, last_valid[np.maximum(rows - lo, 0)], -1)
+        valid = source >= 0
+        prices[valid, col] = column[source[valid]]
+    return prices
+
+
+def build_holdings(transactions, calendar, symbols):
+    """
+    根据交易记录构建每日持仓数量矩阵，买入日期当天及之后持有对应数量
+
+    Parameters:
+    transactions (List): 交易列表
+    calendar (DatetimeIndex): 输出日历
+    symbols (list): 股票代码列表，决定矩阵的列顺序
+
+    Returns:
+    ndarray: 形状为 (日期数, 股票数) 的持仓数量矩阵
+    """
+    changes = np.zeros((len(calendar), len(symbols)))
+    if not transactions:
+        return changes
+
+    columns = {symbol: col for col, symbol in enumerate(symbols)}
+    buy_dates = pd.DatetimeIndex([datetime.fromisoformat(tx.buy_date).date() for tx in transactions])
+    rows = calendar.searchsorted(buy_dates, side='left')
+    cols = np.array([columns[tx.symbol] for tx in transactions])
+    quantities = np.array([tx.quantity for tx in transactions], dtype=float)
+
+    # 买入日期晚于输出日历的交易不产生持仓
+    in_range = rows < len(calendar)
+    np.add.at(changes, (rows[in_range], cols[in_range]), quantities[in_range])
+    return np.cumsum(changes, axis=0)
+
+
+def value_holdings(prices, holdings):
+    """
+    计算每只股票及组合的每日价值
+
+    Parameters:
+    prices (ndarray): (日期数, 股票数) 价格矩阵
+    holdings (ndarray): (日期数, 股票数) 持仓数量矩阵
+
+    Returns:
+    tuple: (每只股票价值矩阵, 组合总价值数组)
+    """
+    values = np.nan_to_num(holdings * prices, nan=0.0)
+    return values, values.sum(axis=1)
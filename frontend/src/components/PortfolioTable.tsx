@@ -2,7 +2,7 @@ import React, { useState } from 'react';
 import { Table, Button, Card, Spin, message, Empty, DatePicker } from 'antd';
 import { DeleteOutlined, CalculatorOutlined } from '@ant-design/icons';
 import { StockTransaction } from '../types';
-import { calculatePortfolioValue } from '../services/api';
+import { streamPortfolioValue } from '../services/api';
 import dayjs from 'dayjs';
 
 interface PortfolioTableProps {
@@ -11,6 +11,9 @@ interface PortfolioTableProps {
   onCalculate: (portfolioValue: any[], indicators: any) => void;
 }
 
+// 价值走势图最多使用的数据点数，更长的序列在服务端按曲线形状降采样
+const CHART_MAX_POINTS = 1000;
+
 // 帮助函数：确保值是数字类型，用于安全调用toFixed
 const ensureNumber = (value: any): number => {
   if (value === null || value === undefined) return 0;
@@ -46,18 +49,26 @@ const PortfolioTable: React.FC<PortfolioTableProps> = ({
         transactions,
         start_date: startDate ? startDate.format('YYYY-MM-DD') : undefined,
         end_date: endDate ? endDate.format('YYYY-MM-DD') : undefined,
+        max_points: CHART_MAX_POINTS,
       };
 
       console.log('发送到API的数据:', portfolioData);
       
-      const result = await calculatePortfolioValue(portfolioData);
-      console.log('API返回结果:', result);
+      // 价值序列先到达，走势图立即显示；指标组计算完成后逐个更新
+      let portfolioValue: any[] = [];
+      await streamPortfolioValue(
+        portfolioData,
+        (value) => {
+          portfolioValue = value;
+          onCalculate(value, {});
+        },
+        (indicators) => onCalculate(portfolioValue, indicators),
+      );
       
-      if (!result || !result.portfolioValue) {
+      if (portfolioValue.length === 0) {
         throw new Error('API返回的结果不包含投资组合价值数据');
       }
       
-      onCalculate(result.portfolioValue, result.indicators || {});
       message.success('计算完成');
     } catch (error) {
       console.error('计算投资组合价值时出错:', error);
@@ -68,23 +68,140 @@ export const getStockPrice = async (symbol: string, date: string): Promise<numbe
   }
 };
 
+// 把按列返回的价值序列 {列名: 数组} 转换为每行一个对象
+const columnsToRecords = (columns: Record<string, any[]>): any[] => {
+  const names = Object.keys(columns);
+  const length = names.length > 0 ? columns[names[0]].length : 0;
+  const records = new Array(length);
+  for (let i = 0; i < length; i++) {
+    const record: Record<string, any> = {};
+    for (const name of names) {
+      record[name] = columns[name][i];
+    }
+    records[i] = record;
+  }
+  return records;
+};
+
+// 最近的计算结果及其 ETag，重复提交相同的投资组合时服务端返回 304，直接使用保存的结果
+const MAX_SAVED_RESULTS = 20;
+const savedResults = new Map<string, { etag: string; data: any }>();
+
+const saveResult = (requestKey: string, etag: string, data: any) => {
+  savedResults.delete(requestKey);
+  savedResults.set(requestKey, { etag, data });
+  if (savedResults.size > MAX_SAVED_RESULTS) {
+    savedResults.delete(savedResults.keys().next().value as string);
+  }
+};
+
 // 计算投资组合价值
 export const calculatePortfolioValue = async (portfolioData: PortfolioData) => {
   try {
     console.log('发送请求到计算投资组合API:', portfolioData);
-    const response = await api.post('/portfolio/value', portfolioData);
-    console.log('计算投资组合API响应:', response.data);
+    // 按列返回的价值序列不重复列名，体积更小
+    const body = { format: 'columnar', ...portfolioData };
+    const requestKey = JSON.stringify(body);
+    const saved = savedResults.get(requestKey);
+    const response = await api.post('/portfolio/value', body, {
+      headers: saved ? { 'If-None-Match': saved.etag } : undefined,
+      validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+    });
+    const data = response.status === 304 && saved ? saved.data : response.data;
+    console.log('计算投资组合API响应:', data);
     
-    if (!response.data || !response.data.portfolio_value) {
+    if (!data || !data.portfolio_value) {
       throw new Error('API响应格式不正确，缺少portfolio_value字段');
     }
     
+    const etag = response.headers['etag'];
+    if (etag && response.status !== 304) {
+      saveResult(requestKey, etag, data);
+    }
+    
     return {
-      portfolioValue: response.data.portfolio_value,
-      indicators: response.data.indicators || {}
+      portfolioValue: columnsToRecords(data.portfolio_value),
+      indicators: data.indicators || {}
     };
   } catch (error) {
     console.error('计算投资组合价值出错:', error);
     throw error;
   }
 };
+
+// 流式计算投资组合价值：价值序列计算完成后立即回调 onValue，之后每计算完一个指标组回调一次 onIndicators
+export const streamPortfolioValue = async (
+  portfolioData: PortfolioData,
+  onValue: (portfolioValue: any[]) => void,
+  onIndicators: (indicators: any) => void,
+) => {
+  const body = { format: 'columnar', stream: 'ndjson', ...portfolioData };
+  const requestKey = JSON.stringify(body);
+  const saved = savedResults.get(requestKey);
+  const response = await fetch(`${API_URL}/portfolio/value`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(saved ? { 'If-None-Match': saved.etag } : {}),
+    },
+    body: requestKey,
+  });
+
+  if (response.status === 304 && saved) {
+    onValue(columnsToRecords(saved.data.portfolio_value));
+    onIndicators(saved.data.indicators);
+    return;
+  }
+  if (!response.ok || !response.body) {
+    throw new Error(`计算投资组合API请求失败: ${response.status}`);
+  }
+
+  const result: { portfolio_value: any; indicators: any } = { portfolio_value: null, indicators: {} };
+  let completed = false;
+  const handleEvent = (line: string) => {
+    const event = JSON.parse(line);
+    if (event.type === 'portfolio_value') {
+      result.portfolio_value = event.data;
+      onValue(columnsToRecords(event.data));
+    } else if (event.type === 'indicators') {
+      result.indicators = { ...result.indicators, ...event.data };
+      onIndicators(result.indicators);
+    } else if (event.type === 'error') {
+      throw new Error(event.message);
+    } else if (event.type === 'done') {
+      completed = true;
+    }
+  };
+
+  // 每行一个事件，一次读取的数据可能包含多行或不完整的一行
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) {
+      break;
+    }
+    buffer += decoder.decode(value, { stream: true });
+    let newline = buffer.indexOf('\n');
+    while (newline >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (line) {
+        handleEvent(line);
+      }
+      newline = buffer.indexOf('\n');
+    }
+  }
+
+  // 没有收到 done 事件（例如连接中途断开）时指标不完整，不能当作计算完成
+  if (!completed) {
+    throw new Error('计算结果不完整：连接在计算完成之前中断');
+  }
+
+  // 只有命中服务端结果缓存的完整结果带有 ETag
+  const etag = response.headers.get('etag');
+  if (etag && result.portfolio_value) {
+    saveResult(requestKey, etag, result);
+  }
+};
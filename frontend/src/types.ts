@@ -19,6 +19,15 @@ export interface PortfolioData {
   transactions: StockTransaction[];
   start_date?: string;
   end_date?: string;
+  indicator_groups?: string[];  // 需要计算的指标组，不指定则计算默认指标组
+  rolling_windows?: number[];  // 滚动指标的窗口大小，不指定则使用20日和60日
+  var_window?: number;  // 滚动VaR/CVaR的窗口大小，不指定则使用60日
+  var_levels?: number[];  // 滚动VaR/CVaR的置信度，不指定则使用0.95和0.99
+  frequency?: 'daily' | 'weekly' | 'monthly';  // 价值序列的输出频率，不指定则为 daily
+  calendar?: 'trading' | 'calendar';  // 输出日历，trading 只包含交易日，不指定则为 trading
+  max_points?: number;  // 价值序列最多返回的点数，超过时在服务端降采样
+  format?: 'records' | 'columnar' | 'arrow';  // 响应格式，不指定则为 records
+  stream?: 'ndjson' | 'sse';  // 流式响应，价值序列和各指标组计算完成后依次发送
 }
 
 // 投资组合价值数据点